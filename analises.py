@@ -0,0 +1,38 @@
+# Números das análises de margens (setorial e subsetorial), sem interface: usados pelo
+# dashboard do Streamlit e pelos relatórios em lote (relatorios.py). O motor (numpy) só é
+# carregado no primeiro cálculo; subsetores e setores vêm do mapeamento de contas
+# (mapeamento_contas.json, ver mapeamento.py)
+
+# Filiais na ordem dos códigos do DealerNet (0 é o consolidado do grupo)
+FILIAIS = ["Grupo Consolidado", "Araras", "Assis", "Ourinhos"]
+
+TIPOS_ANALISE = ["Análise Setorial", "Análise Subsetorial"]
+
+
+# Função para listar os códigos das filiais de uma análise: todas no consolidado (0),
+# senão apenas a selecionada
+def codigos_filiais(filial, num_filiais=len(FILIAIS) - 1):
+    return list(range(1, num_filiais + 1)) if filial == 0 else [filial]
+
+
+# Função para calcular os números de uma análise de um mês (título, nomes, resultados e
+# margens) a partir dos razões das filiais consultadas e seus códigos
+def numeros_analise(tipo, mes, ano, razoes, filiais):
+    from motor_margens import calcular_analise
+
+    # Uma linha por filial, um único mês; o consolidado soma receitas e custos antes das margens
+    analise = calcular_analise([[razao] for razao in razoes], filiais)
+
+    if tipo == "Análise Subsetorial":
+        titulo = f"Resultados e Margens Brutas por Subsetor - {mes:02d}/{ano}"
+        nivel = analise["consolidado"]["subsetores"]
+    else:
+        titulo = f"Resultados e Margens Brutas por Setor"
+        nivel = analise["consolidado"]["setores"]
+    # subsetores que nenhuma filial tem (sem contas no razão ou ausentes no mapeamento da filial,
+    # ex.: "Peças Atacado" em Ourinhos) ficam fora do gráfico
+    visiveis = nivel["presente"][0]
+    nomes = [nome for nome, visivel in zip(nivel["nomes"], visiveis) if visivel]
+    resultados = nivel["resultado"][0][visiveis].tolist()
+    margens = nivel["margem"][0][visiveis].tolist()
+    return titulo, nomes, resultados, margens
@@ -0,0 +1,123 @@
+# Aquecimento dos dados recentes: busca no gateway (e deixa no cache) os últimos meses de
+# todas as filiais, para que o primeiro analista a abrir um mês não espere pelas consultas.
+# A primeira rodada aquece todos os meses pedidos; as seguintes, feitas só fora do horário
+# de pico, renovam apenas o mês em aberto (os meses fechados não mudam mais). As consultas
+# entram na fila do gateway como lote, atrás das dos analistas.
+#
+# Uso: python aquecimento.py --filiais 1 2 3 --meses 3 [--continuo]
+import argparse
+import contextvars
+import datetime
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from arvore_contas import obter_arvore
+from cache_razao import TTL_MES_ABERTO, desatualizado_desde
+from dealernet import consultar_razao
+from protecao_gateway import prioridade_gateway
+
+# Quantos meses (contando o atual) são aquecidos na primeira rodada
+MESES_AQUECIDOS = int(os.environ.get("DEALERNET_AQUECIMENTO_MESES", 3))
+
+# Consultas simultâneas do aquecimento (menos que o limite geral, para não disputar com os analistas)
+MAX_AQUECIMENTO_SIMULTANEO = int(os.environ.get("DEALERNET_AQUECIMENTO_SIMULTANEAS", 2))
+
+# Horário fora de pico ("inicio-fim", em horas) e intervalo (em segundos) entre as rodadas
+HORARIO_FORA_PICO = os.environ.get("DEALERNET_AQUECIMENTO_HORARIO", "19-7")
+INTERVALO_AQUECIMENTO = float(os.environ.get("DEALERNET_AQUECIMENTO_INTERVALO", TTL_MES_ABERTO))
+
+_trava = threading.Lock()
+_agendador = None
+
+
+# Função para listar os últimos meses como (mes, ano), do atual para trás
+def meses_recentes(quantidade, hoje=None):
+    hoje = hoje or datetime.date.today()
+    indice = hoje.year * 12 + hoje.month - 1
+    return [((i % 12) + 1, i // 12) for i in range(indice, indice - quantidade, -1)]
+
+
+# Função para saber se estamos fora do horário de pico (horário vazio = sempre)
+def fora_de_pico(agora=None, horario=None):
+    horario = HORARIO_FORA_PICO if horario is None else horario
+    if not horario:
+        return True
+    inicio, fim = (int(hora) for hora in horario.split("-"))
+    hora = (agora or datetime.datetime.now()).hour
+    if inicio <= fim:
+        return inicio <= hora < fim
+    return hora >= inicio or hora < fim  # faixa que atravessa a meia-noite
+
+
+# Função para aquecer os meses pedidos de todas as filiais; com renovar=True os razões são
+# buscados de novo no gateway. pre_calcular (opcional) recebe os meses aquecidos, para
+# quem quiser deixar análises e gráficos prontos. Retorna (obtidos, pedidos); razões
+# desatualizados (gateway fora do ar) não contam como obtidos
+def aquecer(filiais, meses, renovar=False, pre_calcular=None):
+    pedidos = [(mes, ano, filial) for mes, ano in meses for filial in filiais]
+
+    def buscar(pedido):
+        razao = consultar_razao(*pedido, renovar=renovar)
+        if razao is not None:
+            obter_arvore(razao)
+        return razao
+
+    with prioridade_gateway("lote"), ThreadPoolExecutor(max_workers=max(1, MAX_AQUECIMENTO_SIMULTANEO)) as executor:
+        futuros = [executor.submit(contextvars.copy_context().run, buscar, pedido) for pedido in pedidos]
+        razoes = [futuro.result() for futuro in futuros]
+    if pre_calcular is not None:
+        pre_calcular(meses)
+    return sum(razao is not None and desatualizado_desde(razao) is None for razao in razoes), len(pedidos)
+
+
+# Função que roda as rodadas de aquecimento até o processo terminar
+def _rodar(filiais, quantidade, pre_calcular, intervalo):
+    def rodada(meses, renovar):
+        try:
+            obtidos, pedidos = aquecer(filiais, meses, renovar, pre_calcular)
+            print(f"Aquecimento: {obtidos} de {pedidos} razões ({', '.join(f'{m:02d}/{a}' for m, a in meses)})")
+        except Exception as erro:  # uma rodada com erro não derruba o agendador
+            print(f"Aquecimento falhou: {erro!r}")
+
+    rodada(meses_recentes(quantidade), False)
+    mes_aberto = meses_recentes(1)[0]
+    while True:
+        time.sleep(intervalo)
+        if not fora_de_pico():
+            continue
+        # na virada do mês, o que acabou de fechar é renovado uma última vez
+        meses = meses_recentes(2)
+        if meses[0] == mes_aberto:
+            meses = meses[:1]
+        mes_aberto = meses[0]
+        rodada(meses, True)
+
+
+# Função para iniciar o agendador numa thread em segundo plano (uma única vez por processo)
+def iniciar_aquecimento(filiais, quantidade=MESES_AQUECIDOS, pre_calcular=None, intervalo=INTERVALO_AQUECIMENTO):
+    global _agendador
+    with _trava:
+        if _agendador is None:
+            _agendador = threading.Thread(
+                target=_rodar,
+                args=(list(filiais), quantidade, pre_calcular, intervalo),
+                name="aquecimento",
+                daemon=True,
+            )
+            _agendador.start()
+        return _agendador
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aquece o cache de razões dos meses recentes.")
+    parser.add_argument("--filiais", type=int, nargs="+", default=[1, 2, 3])
+    parser.add_argument("--meses", type=int, default=MESES_AQUECIDOS)
+    parser.add_argument("--continuo", action="store_true", help="continua renovando o mês em aberto")
+    args = parser.parse_args()
+    if args.continuo:
+        _rodar(args.filiais, args.meses, None, INTERVALO_AQUECIMENTO)
+    else:
+        obtidos, pedidos = aquecer(args.filiais, meses_recentes(args.meses))
+        print(f"{obtidos} de {pedidos} razões aquecidos")
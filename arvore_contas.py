@@ -0,0 +1,93 @@
+from memo_lru import CachePorObjeto
+from razao import CAMPOS_NUMERICOS
+
+# Quantas árvores (uma por razão) ficam guardadas para reaproveitamento
+MAX_ARVORES = 256
+
+_arvores = CachePorObjeto(MAX_ARVORES)
+
+
+# Função para listar as contas sintéticas do razão (as que têm contas abaixo delas)
+def contas_pais(razao):
+    return {conta_id.rsplit(".", 1)[0] for conta_id in razao if "." in conta_id}
+
+
+# Função para montar a árvore do plano de contas: cada nó (prefixo de ContaIDNivel, como
+# "3.1.1.003") guarda a soma dos campos numéricos de todas as contas folha abaixo dele
+# e a variação no período (SaldoFinal - SaldoInicial) já arredondada
+def montar_arvore(razao):
+    pais = contas_pais(razao)
+    arvore = {}
+    for conta_id, registro in razao.items():
+        if conta_id in pais:
+            continue  # contas sintéticas são recalculadas a partir das folhas
+        partes = conta_id.split(".")
+        for tamanho in range(1, len(partes) + 1):
+            no = arvore.setdefault(".".join(partes[:tamanho]), dict.fromkeys(CAMPOS_NUMERICOS, 0.0))
+            for campo in CAMPOS_NUMERICOS:
+                no[campo] += registro[campo]
+    for no in arvore.values():
+        no["Variacao"] = round(no["SaldoFinal"] - no["SaldoInicial"], 2)
+    return arvore
+
+
+# Função para atualizar a árvore de um razão anterior para um novo razão com as mesmas
+# contas: só os nós no caminho das contas folha alteradas são refeitos (somando a diferença
+# de cada campo), e a árvore anterior não é modificada. Retorna a nova árvore e os
+# prefixos refeitos
+def atualizar_arvore(arvore, anterior, razao, alteradas, pais):
+    nova = dict(arvore)
+    refeitos = {}
+    for conta_id in alteradas:
+        if conta_id in pais:
+            continue  # contas sintéticas não entram na árvore
+        antigo, novo = anterior[conta_id], razao[conta_id]
+        partes = conta_id.split(".")
+        for tamanho in range(1, len(partes) + 1):
+            prefixo = ".".join(partes[:tamanho])
+            no = refeitos.get(prefixo)
+            if no is None:
+                no = refeitos[prefixo] = dict(nova[prefixo])
+                nova[prefixo] = no
+            for campo in CAMPOS_NUMERICOS:
+                no[campo] += novo[campo] - antigo[campo]
+    for no in refeitos.values():
+        no["Variacao"] = round(no["SaldoFinal"] - no["SaldoInicial"], 2)
+    return nova, set(refeitos)
+
+
+# Função para obter a árvore de um razão, montada uma única vez por razão
+def obter_arvore(razao):
+    arvore = _arvores.obter(razao)
+    if arvore is None:
+        arvore = montar_arvore(razao)
+        guardar_arvore(razao, arvore)
+    return arvore
+
+
+# Função para guardar a árvore de um razão (ex.: atualizada a partir da árvore anterior)
+def guardar_arvore(razao, arvore):
+    _arvores.guardar(razao, arvore)
+
+
+# Função para obter a variação no período (SaldoFinal - SaldoInicial) de um ou mais
+# prefixos; prefixos ausentes no razão contam como zero e, se nenhum existir, retorna None
+def valor_prefixos(arvore, prefixos):
+    if isinstance(prefixos, str):
+        no = arvore.get(prefixos)
+        return None if no is None else no["Variacao"]
+    nos = [arvore[prefixo] for prefixo in prefixos if prefixo in arvore]
+    if not nos:
+        return None
+    return sum(no["Variacao"] for no in nos)
+
+
+# Função para calcular receita, custo, resultado (mil R$) e margem bruta (%) de
+# qualquer agrupamento de contas, ex.: calcular_rollup(razao, "3.1.1.003", "3.3.1.003")
+def calcular_rollup(razao, receita, custo):
+    arvore = obter_arvore(razao)
+    valor_receita = valor_prefixos(arvore, receita) or 0.0
+    valor_custo = valor_prefixos(arvore, custo) or 0.0
+    resultado = -valor_receita - valor_custo
+    margem = -resultado / valor_receita * 100 if valor_receita != 0 else 0
+    return valor_receita, valor_custo, resultado / 1000, margem
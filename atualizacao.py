@@ -0,0 +1,168 @@
+# Atualização incremental do mês em aberto: cada razão renovado no gateway é comparado,
+# conta a conta, com o último instantâneo da mesma filial e mês. A árvore de prefixos é
+# refeita só no caminho das contas alteradas, a análise só é recalculada se algum subsetor
+# usa um prefixo refeito e o gráfico só é redesenhado se os números mudaram. Assim o mês
+# em aberto pode ser renovado com frequência durante o fechamento.
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from analises import codigos_filiais, numeros_analise
+from arvore_contas import atualizar_arvore, contas_pais, guardar_arvore, obter_arvore
+from cache_razao import TTL_MES_ABERTO
+from dealernet import consultar_razoes
+from mapeamento import carregar_mapeamento
+from memo_lru import guardar_lru
+from metricas import medir, registrar_cache
+from razao import CAMPOS_NUMERICOS
+
+# Intervalo (em segundos) entre renovações do mesmo razão; durante o fechamento pode ser bem
+# menor que a validade do cache, já que cada renovação só refaz o que mudou
+INTERVALO_ATUALIZACAO = float(os.environ.get("DEALERNET_ATUALIZACAO_INTERVALO", TTL_MES_ABERTO))
+
+# Quantos instantâneos (filial e mês) e análises ficam guardados
+MAX_INSTANTANEOS = 16
+MAX_ANALISES = 64
+
+_trava = threading.Lock()
+_instantaneos = OrderedDict()  # (filial, ano, mes) -> último razão obtido, impressões e versão
+_analises = OrderedDict()  # (tipo, mes, ano, filial, num_filiais) -> versões usadas, números e gráfico
+
+
+# Função para tirar a impressão de um registro do razão (os valores que definem a conta)
+def impressao_registro(registro):
+    return tuple(registro[campo] for campo in CAMPOS_NUMERICOS) + (registro["ContaNivel"], registro["ContaNatureza"])
+
+
+# Função para tirar a impressão do razão inteiro a partir das impressões das contas
+# (não depende da ordem das contas; vale só dentro do processo)
+def impressao_razao(impressoes):
+    return hash(frozenset(impressoes.items()))
+
+
+# Função para registrar um razão recém-obtido como instantâneo da filial e mês. Se nada
+# mudou, o instantâneo anterior (e o mesmo razão, com árvore e análises já prontas) continua
+# valendo; senão a versão aumenta e o instantâneo guarda as contas alteradas e os prefixos
+# refeitos (None quando a árvore foi montada do zero: primeira vez ou contas diferentes)
+def registrar_razao(filial, ano, mes, razao):
+    chave = (filial, ano, mes)
+    impressoes = {conta_id: impressao_registro(registro) for conta_id, registro in razao.items()}
+    impressao = impressao_razao(impressoes)
+    with _trava:
+        anterior = _instantaneos.get(chave)
+        if anterior is not None and anterior["impressao"] == impressao:
+            anterior["renovado_em"] = time.monotonic()
+            return anterior
+
+        with medir("atualizacao", filial=filial, mes=f"{mes:02d}/{ano}") as medida:
+            if anterior is None or impressoes.keys() != anterior["impressoes"].keys():
+                alteradas, refeitos, pais = None, None, contas_pais(razao)
+                obter_arvore(razao)
+            else:
+                pais = anterior["pais"]
+                alteradas = {
+                    conta_id for conta_id, valor in impressoes.items() if valor != anterior["impressoes"][conta_id]
+                }
+                arvore, refeitos = atualizar_arvore(
+                    obter_arvore(anterior["razao"]), anterior["razao"], razao, alteradas, pais
+                )
+                guardar_arvore(razao, arvore)
+            medida["contas_alteradas"] = len(razao) if alteradas is None else len(alteradas)
+
+        instantaneo = {
+            "razao": razao,
+            "impressao": impressao,
+            "impressoes": impressoes,
+            "pais": pais,
+            "versao": 0 if anterior is None else anterior["versao"] + 1,
+            "alteradas": alteradas,
+            "refeitos": refeitos,
+            "renovado_em": time.monotonic(),
+        }
+        guardar_lru(_instantaneos, chave, instantaneo, MAX_INSTANTANEOS)
+    return instantaneo
+
+
+def _vencido(chave, agora):
+    instantaneo = _instantaneos.get(chave)
+    return instantaneo is None or agora - instantaneo["renovado_em"] >= INTERVALO_ATUALIZACAO
+
+
+# Função para renovar no gateway, em paralelo, os razões (mes, ano, filial) cujo instantâneo
+# passou do intervalo de atualização e devolver os instantâneos atuais (None se algum falhar).
+# O primeiro instantâneo pode vir do cache local; os seguintes vão sempre ao gateway
+def atualizar_razoes(pedidos):
+    with _trava:
+        agora = time.monotonic()
+        vencidos = [(mes, ano, filial) for mes, ano, filial in pedidos if _vencido((filial, ano, mes), agora)]
+        # quarto campo do pedido: o renovar de consultar_razao
+        renovar = [(filial, ano, mes) in _instantaneos for mes, ano, filial in vencidos]
+    razoes = consultar_razoes([pedido + (forcar,) for pedido, forcar in zip(vencidos, renovar)])
+    if any(razao is None for razao in razoes):
+        return None
+    for (mes, ano, filial), razao in zip(vencidos, razoes):
+        registrar_razao(filial, ano, mes, razao)
+    with _trava:
+        return [_instantaneos[(filial, ano, mes)] for mes, ano, filial in pedidos]
+
+
+# Função para saber quais subsetores do mapeamento usam algum dos prefixos refeitos
+def subsetores_afetados(mapeamento, refeitos):
+    return {
+        subsetor["nome"]
+        for subsetor in mapeamento["subsetores"]
+        if any(conta in refeitos for conta in subsetor["receita"] + subsetor["custo"])
+    }
+
+
+# Função para saber quais subsetores mudaram entre as versões usadas numa análise e os
+# instantâneos atuais (None quando não dá para saber e tudo deve ser refeito)
+def _subsetores_alterados(versoes, instantaneos):
+    refeitos = set()
+    for versao, instantaneo in zip(versoes, instantaneos):
+        if instantaneo["versao"] == versao:
+            continue
+        if instantaneo["versao"] != versao + 1 or instantaneo["refeitos"] is None:
+            return None
+        refeitos |= instantaneo["refeitos"]
+    return subsetores_afetados(carregar_mapeamento(), refeitos)
+
+
+# Função para obter a análise de um mês a partir dos instantâneos das filiais: números e
+# gráfico anteriores são reaproveitados se nenhum subsetor mudou, e o gráfico só é
+# redesenhado se os números mudaram. Retorna (numeros, grafico)
+def analisar_instantaneos(tipo, mes, ano, filial, num_filiais, instantaneos):
+    from graficos import criar_grafico
+
+    chave = (tipo, mes, ano, filial, num_filiais)
+    versoes = tuple(instantaneo["versao"] for instantaneo in instantaneos)
+    with _trava:
+        estado = _analises.get(chave)
+    reaproveitar = estado is not None and (
+        estado["versoes"] == versoes or _subsetores_alterados(estado["versoes"], instantaneos) == set()
+    )
+    if reaproveitar:
+        registrar_cache("incremental", True)
+        numeros, grafico = estado["numeros"], estado["grafico"]
+    else:
+        registrar_cache("incremental", False)
+        razoes = [instantaneo["razao"] for instantaneo in instantaneos]
+        numeros = numeros_analise(tipo, mes, ano, razoes, codigos_filiais(filial, num_filiais))
+        if estado is not None and estado["numeros"] == numeros:
+            grafico = estado["grafico"]
+        else:
+            titulo, nomes, resultados, margens = numeros
+            grafico = criar_grafico(nomes, resultados, margens, titulo)
+    with _trava:
+        guardar_lru(_analises, chave, {"versoes": versoes, "numeros": numeros, "grafico": grafico}, MAX_ANALISES)
+    return numeros, grafico
+
+
+# Função para renovar (se vencidos) os razões de uma análise do mês em aberto e refazer só
+# o que mudou; None se algum razão não pôde ser obtido
+def atualizar_analise(tipo, mes, ano, filial, num_filiais):
+    instantaneos = atualizar_razoes([(mes, ano, codigo) for codigo in codigos_filiais(filial, num_filiais)])
+    if instantaneos is None:
+        return None
+    return analisar_instantaneos(tipo, mes, ano, filial, num_filiais, instantaneos)
@@ -0,0 +1,164 @@
+# Teste de carga do app Dash em modo de produção (servir_dash.py) contra o gateway simulado:
+# mede requisições por segundo e latência p95 do callback "Analisar" conforme o número de workers.
+# Respostas com erro (status diferente de 200, corpo que não é JSON, resultado que não chega)
+# são contadas à parte e fazem o teste sair com erro
+#
+# Uso: python -m benchmarks.carga_dash [--workers 1 2 4] [--clientes 8] [--requisicoes 64]
+import argparse
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from servidor_simulado import iniciar_servidor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tempo máximo (s) esperando o resultado de um clique
+ESPERA_MAXIMA = 60
+
+
+# Função para escolher uma porta livre
+def porta_livre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Função para clicar em "Analisar" e esperar o resultado do callback em segundo plano
+def analisar(sessao, url, n_clicks, tipo, mes, ano):
+    payload = {
+        "output": "..grafico-resultados.figure...rastro-analise.data..",
+        "outputs": [
+            {"id": "grafico-resultados", "property": "figure"},
+            {"id": "rastro-analise", "property": "data"},
+        ],
+        "inputs": [{"id": "botao-analisar", "property": "n_clicks", "value": n_clicks}],
+        "state": [
+            {"id": "tipo-analise", "property": "value", "value": tipo},
+            {"id": "mes", "property": "value", "value": mes},
+            {"id": "ano", "property": "value", "value": ano},
+        ],
+        "changedPropIds": ["botao-analisar.n_clicks"],
+    }
+    resposta = ler_json(sessao.post(f"{url}/_dash-update-component", json=payload))
+    chave, job = resposta.get("cacheKey"), resposta.get("job")
+    limite = time.monotonic() + ESPERA_MAXIMA
+    while "response" not in resposta:
+        if time.monotonic() > limite:
+            raise ErroCarga(f"sem resultado após {ESPERA_MAXIMA} s")
+        time.sleep(0.05)
+        resposta = ler_json(sessao.post(f"{url}/_dash-update-component?cacheKey={chave}&job={job}", json=payload))
+    return resposta["response"]["grafico-resultados"]["figure"]
+
+
+class ErroCarga(Exception):
+    pass
+
+
+# Função para ler a resposta JSON do Dash; status diferente de 200 ou corpo que não é JSON
+# (ex.: página de erro 500) é erro
+def ler_json(resposta):
+    if resposta.status_code != 200:
+        raise ErroCarga(f"HTTP {resposta.status_code}")
+    try:
+        return resposta.json()
+    except ValueError:
+        raise ErroCarga("resposta que não é JSON") from None
+
+
+# Função para rodar uma rodada de carga com um número de workers
+def rodada(workers, clientes, total, gateway):
+    porta = porta_livre()
+    url = f"http://127.0.0.1:{porta}"
+    with tempfile.TemporaryDirectory() as diretorio:
+        ambiente = dict(
+            os.environ,
+            DEALERNET_URL=gateway.url,
+            DEALERNET_CACHE=os.path.join(diretorio, "razao.sqlite3"),
+            DEALERNET_CACHE_DASH=os.path.join(diretorio, "dash"),
+        )
+        processo = subprocess.Popen(
+            [sys.executable, "servir_dash.py", "--workers", str(workers), "--porta", str(porta), "--host", "127.0.0.1"],
+            cwd=RAIZ, env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            for _ in range(200):
+                try:
+                    if requests.get(url).status_code == 200:
+                        break
+                except requests.ConnectionError:
+                    time.sleep(0.1)
+
+            aleatorio = random.Random(0)
+            pedidos = [
+                (i + 1, aleatorio.choice(["Análise Setorial", "Análise Subsetorial"]), aleatorio.randint(1, 12), 2024)
+                for i in range(total)
+            ]
+            latencias, erros, trava = [], [], threading.Lock()
+            gateway.requisicoes = 0
+
+            def cliente(fatia):
+                sessao = requests.Session()
+                sessao.get(url)
+                for pedido in fatia:
+                    inicio = time.perf_counter()
+                    try:
+                        analisar(sessao, url, *pedido)
+                    except (ErroCarga, requests.RequestException) as erro:
+                        with trava:
+                            erros.append(str(erro))
+                        continue
+                    with trava:
+                        latencias.append(time.perf_counter() - inicio)
+
+            threads = [threading.Thread(target=cliente, args=(pedidos[i::clientes],)) for i in range(clientes)]
+            inicio = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            duracao = time.perf_counter() - inicio
+        finally:
+            processo.terminate()
+            processo.wait()
+
+    if len(latencias) >= 2:
+        p50 = f"{statistics.median(latencias) * 1e3:.0f}"
+        p95 = f"{statistics.quantiles(latencias, n=20)[-1] * 1e3:.0f}"
+    else:
+        p50 = p95 = "-"
+    print(
+        f"{workers:>7} {len(latencias) / duracao:>8.1f} {p50:>9} {p95:>9} {gateway.requisicoes:>10} {len(erros):>6}"
+    )
+    for erro in sorted(set(erros)):
+        print(f"        {erros.count(erro)}× {erro}")
+    return len(erros)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clientes", type=int, default=8)
+    parser.add_argument("--requisicoes", type=int, default=64)
+    parser.add_argument("--atraso", type=float, default=0.3, help="latência simulada do gateway (s)")
+    args = parser.parse_args()
+
+    gateway = iniciar_servidor(atraso=args.atraso)
+    print(f"{args.clientes} clientes, {args.requisicoes} cliques, gateway com {args.atraso:.1f} s de latência")
+    print(f"{'workers':>7} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'gateway':>10} {'erros':>6}")
+    erros = sum(rodada(workers, args.clientes, args.requisicoes, gateway) for workers in args.workers)
+    gateway.shutdown()
+    if erros:
+        raise SystemExit(f"{erros} cliques com erro")
+
+
+if __name__ == "__main__":
+    main()
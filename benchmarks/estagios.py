@@ -0,0 +1,222 @@
+# Benchmark por estágio do clique em "Analisar": busca no gateway (simulado), leitura do
+# envelope SOAP, leitura do CDATA, consultas às contas, margens, consolidação entre filiais
+# e montagem dos gráficos, com o soap.xml e razões sintéticos de 1k, 10k e 100k contas.
+# Os resultados são gravados em JSON e podem ser comparados com uma execução anterior.
+#
+# Uso: python -m benchmarks.estagios [--tamanhos 1000 10000] [--saida r.json] [--comparar anterior.json]
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+
+import numpy as np
+import plotly
+
+import arvore_contas
+import mapeamento
+from dealernet import obter_sessao
+from graficos import criar_grafico, criar_grafico_anual
+from motor_margens import calcular_analise
+from razao import TAG_XML_RETORNO, indexar_razao, ler_resposta_soap, obter_valor_conta
+from servidor_simulado import iniciar_servidor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TAMANHOS = [1_000, 10_000, 100_000]
+
+CONTAS = [
+    {"nome": f"Subsetor {grupo}.{conta}", "receita": f"3.1.1.{grupo}.{conta:06d}", "custo": f"3.3.1.{grupo}.{conta:06d}"}
+    for grupo, conta in [("001", 1), ("001", 2), ("002", 1)] + [("003", n) for n in range(1, 10)]
+]
+SETORES = [
+    {"nome": "Vendas", "subsetores": [conta["nome"] for conta in CONTAS[:3]]},
+    {"nome": "Pós-Vendas", "subsetores": [conta["nome"] for conta in CONTAS[3:]]},
+]
+MAPEAMENTO = mapeamento.validar_mapeamento({"subsetores": CONTAS, "setores": SETORES}, "benchmark")
+CONTAS_CONSULTADAS = [conta[campo] for conta in CONTAS for campo in ("receita", "custo")]
+FILIAIS = 3
+
+# Pedido no formato do gateway (filial 1, 11/2024)
+PEDIDO_SOAP = (
+    '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:deal="DealerNet">'
+    "<soapenv:Body><deal:WS_DealernetGateway.CONSULTASALDOCONTABIL>"
+    "<deal:Empresa_codigo>1</deal:Empresa_codigo><deal:Dtini>2024-11-01</deal:Dtini><deal:Dtfin>2024-11-30</deal:Dtfin>"
+    "</deal:WS_DealernetGateway.CONSULTASALDOCONTABIL></soapenv:Body></soapenv:Envelope>"
+)
+
+
+# Função para medir uma etapa: repete até somar tempo_minimo segundos (ao menos 3 vezes)
+def medir(funcao, tempo_minimo=0.3, max_repeticoes=500):
+    funcao()  # aquecimento
+    tempos = []
+    while len(tempos) < 3 or (sum(tempos) < tempo_minimo and len(tempos) < max_repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return {
+        "mediana_ms": statistics.median(tempos) * 1e3,
+        "minimo_ms": min(tempos) * 1e3,
+        "repeticoes": len(tempos),
+    }
+
+
+# Função para extrair só o CDATA do envelope (primeira metade da leitura da resposta)
+def extrair_cdata(conteudo):
+    partes = []
+    dentro = [False]
+
+    def inicio(tag, atributos):
+        dentro[0] = dentro[0] or tag == TAG_XML_RETORNO
+
+    def fim(tag):
+        dentro[0] = dentro[0] and tag != TAG_XML_RETORNO
+
+    def texto(dados):
+        if dentro[0]:
+            partes.append(dados)
+
+    parser = xml.parsers.expat.ParserCreate(namespace_separator=" ")
+    parser.StartElementHandler = inicio
+    parser.EndElementHandler = fim
+    parser.CharacterDataHandler = texto
+    parser.Parse(conteudo, True)
+    return "".join(partes).strip()
+
+
+# Função para montar árvores novas a cada repetição (o cache de árvores esconderia o custo);
+# os planos compilados por filial continuam valendo, só a resolução por razão é refeita
+def sem_cache_de_arvores(funcao):
+    def medida():
+        arvore_contas._arvores.limpar()
+        mapeamento._planos_razao.limpar()
+        return funcao()
+
+    return medida
+
+
+# Função para medir todas as etapas que dependem do tamanho do razão
+def medir_cenario(cenario, servidor):
+    sessao = obter_sessao()
+    conteudo = sessao.post(servidor.url, data=PEDIDO_SOAP).content
+    cdata = extrair_cdata(conteudo)
+    razao = ler_resposta_soap(conteudo)
+    filiais = [[dict(razao)] for _ in range(FILIAIS)]  # cópias: uma árvore por filial
+    codigos = list(range(1, FILIAIS + 1))
+
+    etapas = [
+        ("busca", lambda: sessao.post(servidor.url, data=PEDIDO_SOAP).content),
+        ("envelope", lambda: extrair_cdata(conteudo)),
+        ("cdata", lambda: indexar_razao(ET.fromstring(cdata))),
+        ("leitura completa", lambda: ler_resposta_soap(conteudo)),
+        ("consultas", lambda: [obter_valor_conta(razao, conta_id) for conta_id in CONTAS_CONSULTADAS]),
+        ("margens", sem_cache_de_arvores(lambda: calcular_analise([[razao]], [1], MAPEAMENTO))),
+        (f"consolidação {FILIAIS} filiais", sem_cache_de_arvores(lambda: calcular_analise(filiais, codigos, MAPEAMENTO))),
+    ]
+    resultados = []
+    for estagio, funcao in etapas:
+        resultado = {"estagio": estagio, "cenario": cenario, "contas": len(razao), "bytes": len(conteudo)}
+        resultado.update(medir(funcao))
+        resultados.append(resultado)
+        print(f"{cenario:<10} {estagio:<24} {resultado['mediana_ms']:>11.3f} {resultado['repeticoes']:>6}")
+    return resultados
+
+
+# Função para medir a montagem dos gráficos (não depende do tamanho do razão)
+def medir_graficos():
+    nomes = [conta["nome"] for conta in CONTAS]
+    valores = list(np.linspace(-500, 500, len(nomes)))
+    meses = ["Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
+    etapas = [
+        ("criar_grafico", lambda: criar_grafico(nomes, valores, valores, "Subsetores")),
+        ("criar_grafico_anual", lambda: criar_grafico_anual(meses, [[1.0, 2.0]] * 6, [[1.0, 2.0]] * 6, "Anual")),
+    ]
+    resultados = []
+    for estagio, funcao in etapas:
+        resultado = {"estagio": estagio, "cenario": "-", "contas": None, "bytes": None}
+        resultado.update(medir(funcao))
+        resultados.append(resultado)
+        print(f"{'-':<10} {estagio:<24} {resultado['mediana_ms']:>11.3f} {resultado['repeticoes']:>6}")
+    return resultados
+
+
+# Função para identificar a versão do código medida
+def commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Função para comparar com uma execução anterior; retorna as etapas que ficaram mais lentas
+# que a tolerância (diferenças abaixo de piso_ms são ruído e não contam)
+def comparar(atuais, anteriores, tolerancia, piso_ms=0.05):
+    referencia = {(r["estagio"], r["cenario"]): r for r in anteriores}
+    regressoes = []
+    print(f"\n{'cenário':<10} {'etapa':<24} {'antes (ms)':>11} {'agora (ms)':>11} {'razão':>7}")
+    for atual in atuais:
+        anterior = referencia.get((atual["estagio"], atual["cenario"]))
+        if anterior is None:
+            continue
+        razao = atual["mediana_ms"] / anterior["mediana_ms"] if anterior["mediana_ms"] else float("inf")
+        piorou = razao > 1 + tolerancia and atual["mediana_ms"] - anterior["mediana_ms"] > piso_ms
+        if piorou:
+            regressoes.append(atual)
+        print(
+            f"{atual['cenario']:<10} {atual['estagio']:<24} {anterior['mediana_ms']:>11.3f} "
+            f"{atual['mediana_ms']:>11.3f} {razao:>6.2f}x{'  <- regressão' if piorou else ''}"
+        )
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede cada estágio da análise de margens.")
+    parser.add_argument("--tamanhos", type=int, nargs="*", default=TAMANHOS, help="contas dos razões sintéticos")
+    parser.add_argument("--saida", help="arquivo JSON dos resultados (padrão: cache/benchmarks/estagios-<data>.json)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora aceita antes de acusar regressão")
+    args = parser.parse_args()
+
+    print(f"{'cenário':<10} {'etapa':<24} {'mediana (ms)':>11} {'vezes':>6}")
+    resultados = []
+    servidor = iniciar_servidor(fonte="fixture")
+    resultados += medir_cenario("soap.xml", servidor)
+    servidor.shutdown()
+    for tamanho in args.tamanhos:
+        servidor = iniciar_servidor(num_contas=tamanho)
+        resultados += medir_cenario(f"{tamanho // 1000}k", servidor)
+        servidor.shutdown()
+    resultados += medir_graficos()
+
+    agora = datetime.datetime.now()
+    saida = args.saida or os.path.join(RAIZ, "cache", "benchmarks", f"estagios-{agora:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump({
+            "data": agora.isoformat(timespec="seconds"),
+            "commit": commit_atual(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "numpy": np.__version__,
+            "plotly": plotly.__version__,
+            "resultados": resultados,
+        }, arquivo, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            regressoes = comparar(resultados, json.load(arquivo)["resultados"], args.tolerancia)
+        if regressoes:
+            print(f"{len(regressoes)} etapa(s) mais lenta(s) que a tolerância de {args.tolerancia:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
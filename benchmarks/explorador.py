@@ -0,0 +1,59 @@
+# Benchmark do explorador do plano de contas no consolidado (3 filiais): tempo para abrir o
+# primeiro nível, descer até um grupo grande e trocar de página, e tamanho (JSON) do que vai
+# ao navegador, comparado com mandar a árvore inteira já calculada. As árvores dos razões são
+# montadas antes (as análises já as deixam prontas); o índice de filhos entra no primeiro tempo.
+#
+# Uso: python -m benchmarks.explorador [--contas 10000 100000]
+import argparse
+import json
+import time
+
+from arvore_contas import obter_arvore
+from dados_sinteticos import gerar_envelope_soap
+from explorador import _linha, obter_indice, subarvore_visivel
+from mapeamento import carregar_mapeamento
+from razao import ler_resposta_soap
+
+CAMINHO = ["3", "3.1", "3.1.1", "3.1.1.003"]
+
+
+# Função para medir uma chamada em milissegundos
+def cronometrar(funcao):
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return resultado, (time.perf_counter() - inicio) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede o explorador do plano de contas.")
+    parser.add_argument("--contas", type=int, nargs="*", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    mapeamento = carregar_mapeamento()
+    print(
+        f"{'razão':<10} {'1º nível (ms)':>14} {'descer (ms)':>12} {'página (ms)':>12} {'visível (KB)':>13} "
+        f"{'árvore (KB)':>12}"
+    )
+    for contas in [None] + args.contas:
+        razoes = [ler_resposta_soap(gerar_envelope_soap(contas, codigo, 11, 2024)) for codigo in (1, 2, 3)]
+        arvores = [obter_arvore(razao) for razao in razoes]
+
+        _, raiz_ms = cronometrar(lambda: subarvore_visivel(razoes, {"": 0}))
+        abertos = {"": 0, **{conta: 0 for conta in CAMINHO}}
+        itens, descer_ms = cronometrar(lambda: subarvore_visivel(razoes, abertos))
+        _, pagina_ms = cronometrar(lambda: subarvore_visivel(razoes, {**abertos, CAMINHO[-1]: 1}))
+
+        indices = [obter_indice(razao) for razao in razoes]
+        todas = sorted(set().union(*arvores))
+        arvore_inteira = [_linha(conta, razoes, arvores, indices, mapeamento) for conta in todas]
+        visivel_kb = len(json.dumps(itens, ensure_ascii=False)) / 1024
+        inteira_kb = len(json.dumps(arvore_inteira, ensure_ascii=False)) / 1024
+        cenario = "soap.xml" if contas is None else f"{contas // 1000}k"
+        print(
+            f"{cenario:<10} {raiz_ms:>14.1f} {descer_ms:>12.1f} {pagina_ms:>12.1f} {visivel_kb:>13.1f} "
+            f"{inteira_kb:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
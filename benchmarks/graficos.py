@@ -0,0 +1,103 @@
+# Benchmark dos gráficos: figura montada do zero a cada análise (caminho anterior) x esqueleto
+# validado uma vez e preenchido só com os dados, no gráfico do mês (12 subsetores) e no
+# anual (12 meses × 2 setores); e bytes enviados ao navegador pelo Dash a cada análise:
+# figura inteira x Patch só com dados, título e eixo x.
+#
+# Uso: python -m benchmarks.graficos
+import json
+import time
+
+import plotly.graph_objects as go
+import plotly.io as pio
+from dash import Patch
+from plotly.utils import PlotlyJSONEncoder
+
+from graficos import criar_grafico, criar_grafico_anual
+
+NOMES = [f"Subsetor {indice}" for indice in range(1, 13)]
+MESES = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
+
+
+# Caminho anterior: figura do mês montada e validada do zero
+def grafico_anterior(nomes, resultados, margens, titulo):
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=nomes, y=resultados, name="Resultado (mil R$)", marker_color="DodgerBlue",
+        hovertemplate="<b>%{x}</b><br>Resultado: %{y:.2f} mil R$<extra></extra>",
+    ))
+    fig.add_trace(go.Scatter(
+        x=nomes, y=margens, name="Margem Bruta (%)", mode="lines+markers", line=dict(color="OrangeRed"),
+        marker=dict(size=8), hovertemplate="<b>%{x}</b><br>Margem: %{y:.2f}%<extra></extra>",
+    ))
+    fig.update_layout(
+        title=titulo, yaxis_title="Resultado (mil R$)", yaxis=dict(title="Resultado (mil R$)", side="left"),
+        yaxis2=dict(title="Margem Bruta (%)", overlaying="y", side="right"), legend=dict(x=0.6, y=1.1),
+        barmode="group", template="plotly_dark",
+    )
+    return fig
+
+
+# Caminho anterior: figura anual montada e validada do zero
+def grafico_anual_anterior(meses, resultados, margens, titulo):
+    fig = go.Figure()
+    setores = (("Vendas - Resultado", "DarkSlateBlue"), ("Pós-Vendas - Resultado", "RoyalBlue"))
+    for setor, (nome, cor) in enumerate(setores):
+        fig.add_trace(go.Bar(
+            x=meses, y=[resultado[setor] for resultado in resultados], name=nome, marker_color=cor,
+            hovertemplate="<b>%{x}</b><br>Resultado: %{y:.2f} mil R$<extra></extra>",
+        ))
+    fig.update_layout(
+        barmode="group", title=titulo, xaxis_title="Meses", yaxis_title="Valores", legend_title="Indicadores",
+        xaxis=dict(tickmode="linear"),
+    )
+    return fig
+
+
+# Função para medir o tempo médio (ms) de uma chamada
+def medir(funcao, repeticoes=200):
+    funcao()
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes * 1e3
+
+
+# Função para montar o Patch do Dash com os dados de cada traço e o título
+def patch(x, series, titulo):
+    grafico = Patch()
+    for traco, valores in enumerate(series):
+        grafico["data"][traco]["x"] = x
+        grafico["data"][traco]["y"] = valores
+    grafico["layout"]["title"]["text"] = titulo
+    return grafico
+
+
+def main():
+    resultados = [round(indice * 13.7 - 40, 2) for indice in range(12)]
+    margens = [round(indice * 2.1 + 5, 2) for indice in range(12)]
+    anuais = [[round(mes * 11.3, 2), round(mes * 7.9, 2)] for mes in range(12)]
+    casos = [
+        (
+            "mês (12 subsetores)",
+            lambda: grafico_anterior(NOMES, resultados, margens, "Subsetores"),
+            lambda: criar_grafico(NOMES, resultados, margens, "Subsetores"),
+            patch(NOMES, (resultados, margens), "Subsetores"),
+        ),
+        (
+            "anual (12 meses × 2)",
+            lambda: grafico_anual_anterior(MESES, anuais, anuais, "Anual"),
+            lambda: criar_grafico_anual(MESES, anuais, anuais, "Anual"),
+            patch(MESES, ([valor[0] for valor in anuais], [valor[1] for valor in anuais]), "Anual"),
+        ),
+    ]
+    print(f"{'gráfico':<22} {'do zero (ms)':>13} {'esqueleto (ms)':>15} {'figura (KB)':>12} {'Patch (KB)':>11}")
+    for nome, anterior, atual, mudancas in casos:
+        if anterior().to_dict() != atual().to_dict():
+            raise SystemExit(f"{nome}: figura do esqueleto difere da montada do zero")
+        figura_kb = len(pio.to_json(atual(), validate=False)) / 1024
+        patch_kb = len(json.dumps(mudancas, cls=PlotlyJSONEncoder)) / 1024
+        print(f"{nome:<22} {medir(anterior):>13.2f} {medir(atual):>15.2f} {figura_kb:>12.1f} {patch_kb:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Benchmark: consultas ao histórico colunar (memória mapeada) x leitura dos razões em JSON
+#
+# Uso: python -m benchmarks.historico
+import json
+import os
+import tempfile
+import time
+
+import historico
+from dados_sinteticos import gerar_envelope_soap
+from razao import ler_resposta_soap
+
+ANOS = range(2020, 2025)
+FILIAIS = (1, 2, 3)
+
+
+# Função para medir o menor tempo de várias repetições
+def medir(funcao, repeticoes=20):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor, resultado
+
+
+def main():
+    razoes = [
+        (filial, ano, mes, ler_resposta_soap(gerar_envelope_soap(empresa=filial, mes=mes, ano=ano)))
+        for filial in FILIAIS
+        for ano in ANOS
+        for mes in range(1, 13)
+    ]
+    with tempfile.TemporaryDirectory() as diretorio:
+        historico.DIRETORIO_HISTORICO = diretorio
+        inicio = time.perf_counter()
+        historico.gravar_historico(razoes)
+        print(f"gravação de {len(razoes)} razões: {(time.perf_counter() - inicio) * 1e3:.0f} ms")
+        tamanho = sum(os.path.getsize(os.path.join(diretorio, nome)) for nome in os.listdir(diretorio))
+        print(f"tamanho em disco: {tamanho / 1e6:.1f} MB")
+
+        textos = [json.dumps(razao) for *_, razao in razoes]
+        tempo, _ = medir(lambda: [json.loads(texto) for texto in textos], 3)
+        print(f"{'todos os razões em JSON (como no cache)':<45} {tempo * 1e3:8.2f} ms")
+
+        consultas = [
+            ("todas as filiais, 5 anos", {}),
+            ("uma filial, 5 anos", {"filiais": [2]}),
+            ("todas as filiais, 1 ano", {"inicio": (2024, 1), "fim": (2024, 12)}),
+        ]
+        for rotulo, filtros in consultas:
+            tempo, colunas = medir(lambda: historico.carregar_historico(**filtros))
+            print(f"{rotulo:<45} {tempo * 1e3:8.2f} ms ({len(colunas['Periodo'])} linhas)")
+
+        tempo, _ = medir(lambda: historico.carregar_historico()["SaldoFinal"].sum())
+        print(f"{'soma de SaldoFinal em todo o histórico':<45} {tempo * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
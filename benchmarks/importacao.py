@@ -0,0 +1,96 @@
+# Benchmark de inicialização: tempo de importação de cada módulo num interpretador novo e
+# quais dependências pesadas ele carrega. Cada módulo tem um orçamento (ms) e uma lista de
+# dependências que não pode carregar só por ser importado; estourar qualquer um dos dois
+# encerra com erro, para que uma importação pesada nova não passe despercebida.
+#
+# Uso: python -m benchmarks.importacao [--repeticoes 5] [--fator 2.0]
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PESADOS = ("requests", "numpy", "plotly", "pandas", "matplotlib", "dash", "streamlit")
+
+# Módulo -> (orçamento em ms, dependências pesadas permitidas na importação)
+ORCAMENTO = {
+    "nucleo": (5, ()),
+    "razao": (20, ()),
+    "cache_razao": (30, ()),
+    "metricas": (30, ()),
+    "dealernet": (60, ()),
+    "protecao_gateway": (40, ()),
+    "analises": (5, ()),
+    "consultas_periodo": (60, ()),
+    "relatorios": (80, ()),
+    "aquecimento": (70, ()),
+    "memo_lru": (40, ()),
+    "arvore_contas": (20, ()),
+    "mapeamento": (20, ()),
+    "explorador": (40, ()),
+    "servidor_simulado": (80, ()),
+    "motor_margens": (250, ("numpy",)),
+    "graficos": (150, ("plotly",)),
+    "historico": (250, ("numpy",)),
+    "dashboards_dash": (2000, ("requests", "plotly", "dash")),
+}
+
+# Código executado em cada interpretador novo: importa o módulo e mede
+MEDICAO = """
+import json, sys, time
+inicio = time.perf_counter()
+__import__(sys.argv[1])
+ms = (time.perf_counter() - inicio) * 1e3
+print(json.dumps({"ms": ms, "pesados": [nome for nome in sys.argv[2:] if nome in sys.modules]}))
+"""
+
+
+# Função para medir a importação de um módulo (menor tempo entre as repetições)
+def medir(modulo, repeticoes):
+    medidas = []
+    for _ in range(repeticoes):
+        saida = subprocess.run(
+            [sys.executable, "-c", MEDICAO, modulo, *PESADOS], cwd=RAIZ, capture_output=True, text=True
+        )
+        if saida.returncode != 0:
+            return None, saida.stderr.strip().splitlines()[-1]
+        medidas.append(json.loads(saida.stdout))
+    return min(medida["ms"] for medida in medidas), medidas[0]["pesados"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mede a importação de cada módulo contra um orçamento.")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--fator", type=float, default=1.0, help="multiplica os orçamentos (máquinas mais lentas)")
+    parser.add_argument("modulos", nargs="*", default=list(ORCAMENTO))
+    args = parser.parse_args()
+
+    estouros = []
+    print(f"{'módulo':<20} {'ms':>8} {'orçamento':>10}  dependências pesadas")
+    for modulo in args.modulos:
+        limite, permitidos = ORCAMENTO.get(modulo, (float("inf"), PESADOS))
+        limite *= args.fator
+        ms, pesados = medir(modulo, args.repeticoes)
+        if ms is None:
+            estouros.append(f"{modulo}: erro ao importar ({pesados})")
+            print(f"{modulo:<20} {'erro':>8} {limite:>10.0f}  {pesados}")
+            continue
+        proibidos = [nome for nome in pesados if nome not in permitidos]
+        if ms > limite:
+            estouros.append(f"{modulo}: {ms:.1f} ms, orçamento de {limite:.0f} ms")
+        if proibidos:
+            estouros.append(f"{modulo}: carrega {', '.join(proibidos)} já na importação")
+        marca = "  <- estourou" if ms > limite or proibidos else ""
+        print(f"{modulo:<20} {ms:>8.1f} {limite:>10.0f}  {', '.join(pesados) or '-'}{marca}")
+
+    if estouros:
+        print()
+        for estouro in estouros:
+            print(f"Estouro: {estouro}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Benchmark da renovação do mês em aberto: refazer tudo (árvores, análises e gráficos das
+# filiais e do consolidado) x atualização incremental (atualizacao.py), com razões
+# sintéticos de 3 filiais em que poucas contas mudam entre uma renovação e outra. O
+# download é o mesmo nos dois casos (o gateway não tem consulta de alterações). Também
+# confere que a árvore e os números incrementais batem com os refeitos do zero.
+#
+# Uso: python -m benchmarks.incremental [--contas 10000] [--alteradas 5] [--renovacoes 10]
+import argparse
+import math
+import random
+import statistics
+import time
+
+import arvore_contas
+import atualizacao
+from analises import TIPOS_ANALISE, codigos_filiais, numeros_analise
+from dados_sinteticos import gerar_envelope_soap
+from graficos import criar_grafico
+from mapeamento import carregar_mapeamento
+from razao import ler_resposta_soap
+
+FILIAIS = 3
+MES, ANO = 11, 2024
+ANALISES = [(tipo, filial) for filial in range(FILIAIS + 1) for tipo in TIPOS_ANALISE]
+
+
+# Função para refazer todas as análises do zero (o que cada renovação fazia antes)
+def refazer_tudo(razoes):
+    arvore_contas._arvores.limpar()
+    resultados = {}
+    for tipo, filial in ANALISES:
+        codigos = codigos_filiais(filial, FILIAIS)
+        numeros = numeros_analise(tipo, MES, ANO, [razoes[codigo] for codigo in codigos], codigos)
+        titulo, nomes, valores, margens = numeros
+        criar_grafico(nomes, valores, margens, titulo)
+        resultados[(tipo, filial)] = numeros
+    return resultados
+
+
+# Função para registrar os razões renovados e refazer só o que mudou
+def atualizar(razoes):
+    instantaneos = {codigo: atualizacao.registrar_razao(codigo, ANO, MES, razao) for codigo, razao in razoes.items()}
+    return {
+        (tipo, filial): atualizacao.analisar_instantaneos(
+            tipo, MES, ANO, filial, FILIAIS, [instantaneos[codigo] for codigo in codigos_filiais(filial, FILIAIS)]
+        )[0]
+        for tipo, filial in ANALISES
+    }
+
+
+# Função para gerar a próxima renovação: cópias dos razões com algumas contas folha alteradas
+def alterar(razoes, folhas, quantidade, aleatorio):
+    novos = {codigo: dict(razao) for codigo, razao in razoes.items()}
+    for _ in range(quantidade):
+        codigo = aleatorio.choice(list(novos))
+        conta_id = aleatorio.choice(folhas[codigo])
+        registro = dict(novos[codigo][conta_id])
+        lancamento = round(aleatorio.uniform(100, 10_000), 2)
+        registro["Debitos"] = round(registro["Debitos"] + lancamento, 2)
+        registro["SaldoFinal"] = round(registro["SaldoFinal"] + lancamento, 2)
+        novos[codigo][conta_id] = registro
+    return novos
+
+
+# Função para conferir números de duas análises (tolerância de arredondamento)
+def iguais(numeros, referencia):
+    return numeros[:2] == referencia[:2] and all(
+        math.isclose(a, b, abs_tol=0.01) for lista, outra in zip(numeros[2:], referencia[2:]) for a, b in zip(lista, outra)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara a renovação completa com a incremental.")
+    parser.add_argument("--contas", type=int, default=10_000)
+    parser.add_argument("--alteradas", type=int, default=5, help="contas alteradas por renovação")
+    parser.add_argument("--renovacoes", type=int, default=10)
+    args = parser.parse_args()
+
+    razoes = {
+        codigo: ler_resposta_soap(gerar_envelope_soap(args.contas, codigo, MES, ANO)) for codigo in range(1, FILIAIS + 1)
+    }
+    prefixos = tuple(carregar_mapeamento()["contas"])
+    folhas = {}
+    for codigo, razao in razoes.items():
+        pais = arvore_contas.contas_pais(razao)
+        folhas[codigo] = [conta_id for conta_id in razao if conta_id not in pais]
+    cenarios = [
+        ("sem mudanças", {codigo: [] for codigo in folhas}, 0),
+        ("fora dos subsetores", {c: [f for f in fs if not f.startswith(prefixos)] for c, fs in folhas.items()}, 1),
+        ("nos subsetores", {c: [f for f in fs if f.startswith(prefixos)] for c, fs in folhas.items()}, 1),
+    ]
+
+    atualizar(razoes)  # primeiro instantâneo (montado do zero)
+    divergencias = 0
+    aleatorio = random.Random(0)
+    print(f"{args.contas} contas por filial, {FILIAIS} filiais, {len(ANALISES)} análises por renovação")
+    print(f"{'alterações':<22} {'tudo (ms)':>10} {'incremental (ms)':>17} {'confere':>8}")
+    for nome, candidatas, fator in cenarios:
+        completos, incrementais = [], []
+        for _ in range(args.renovacoes):
+            novos = alterar(razoes, candidatas, args.alteradas * fator, aleatorio)
+            inicio = time.perf_counter()
+            obtidos = atualizar(novos)
+            incrementais.append((time.perf_counter() - inicio) * 1e3)
+            arvores = {codigo: arvore_contas.obter_arvore(atualizacao._instantaneos[(codigo, ANO, MES)]["razao"])
+                       for codigo in novos}
+            inicio = time.perf_counter()
+            esperados = refazer_tudo(novos)
+            completos.append((time.perf_counter() - inicio) * 1e3)
+            confere = all(iguais(obtidos[chave], esperados[chave]) for chave in esperados) and all(
+                math.isclose(no["Variacao"], arvores[codigo][prefixo]["Variacao"], abs_tol=0.01)
+                for codigo, razao in novos.items()
+                for prefixo, no in arvore_contas.montar_arvore(razao).items()
+            )
+            divergencias += not confere
+            razoes = novos
+        print(
+            f"{nome:<22} {statistics.median(completos):>10.1f} {statistics.median(incrementais):>17.1f} "
+            f"{'sim' if not divergencias else 'NÃO':>8}"
+        )
+
+    if divergencias:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
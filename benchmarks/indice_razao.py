@@ -0,0 +1,57 @@
+# Benchmark: busca linear no ElementTree x índice do razão por ContaIDNivel
+#
+# Uso: python -m benchmarks.indice_razao
+import time
+import xml.etree.ElementTree as ET
+
+from dados_sinteticos import gerar_razao_xml
+from razao import indexar_razao, obter_valor_conta
+
+# Contas consultadas por uma análise (receita e custo dos 12 subsetores)
+CONTAS_CONSULTADAS = [
+    f"3.{grupo}.1.{setor}.{conta:06d}"
+    for grupo in (1, 3)
+    for setor, conta in [("001", 1), ("001", 2), ("002", 1)] + [("003", n) for n in range(1, 10)]
+]
+TAMANHOS = [421, 1_000, 10_000, 100_000]
+
+
+# Implementação anterior: percorre todos os itens a cada consulta
+def obter_valor_conta_linear(cdata_root, conta_id):
+    for item in cdata_root.findall(".//SDT_SaldoContabilItem"):
+        if item.find("ContaIDNivel").text == conta_id:
+            saldo_inicial = item.find("SaldoInicial").text
+            saldo_final = item.find("SaldoFinal").text
+            return round(float(saldo_final) - float(saldo_inicial), 2)
+    return None
+
+
+# Função para medir o menor tempo de várias repetições
+def medir(funcao, repeticoes=5):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    print(f"{'contas':>8} {'linear (ms)':>12} {'índice: montar (ms)':>20} {'índice: consultas (ms)':>23} {'ganho':>8}")
+    for tamanho in TAMANHOS:
+        cdata_root = ET.fromstring(gerar_razao_xml(num_contas=tamanho))
+        razao = indexar_razao(cdata_root)
+        assert all(
+            obter_valor_conta_linear(cdata_root, conta) == obter_valor_conta(razao, conta)
+            for conta in CONTAS_CONSULTADAS
+        )
+        repeticoes = 1 if tamanho >= 100_000 else 5
+        linear = medir(lambda: [obter_valor_conta_linear(cdata_root, c) for c in CONTAS_CONSULTADAS], repeticoes)
+        montar = medir(lambda: indexar_razao(cdata_root), repeticoes)
+        consultas = medir(lambda: [obter_valor_conta(razao, c) for c in CONTAS_CONSULTADAS])
+        ganho = linear / (montar + consultas)
+        print(f"{len(razao):>8} {linear * 1e3:>12.2f} {montar * 1e3:>20.2f} {consultas * 1e3:>23.4f} {ganho:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Benchmark: laços por filial/mês x motor vetorizado, para 3 filiais × 12 meses
+#
+# Uso: python -m benchmarks.motor_margens
+import time
+
+import numpy as np
+
+from dados_sinteticos import gerar_envelope_soap
+from mapeamento import validar_mapeamento
+from motor_margens import calcular_analise, montar_valores, resultados_margens
+from razao import ler_resposta_soap, obter_valor_conta
+
+CONTAS = [
+    {"nome": f"Subsetor {grupo}.{conta}", "receita": f"3.1.1.{grupo}.{conta:06d}", "custo": f"3.3.1.{grupo}.{conta:06d}"}
+    for grupo, conta in [("001", 1), ("001", 2), ("002", 1)] + [("003", n) for n in range(1, 10)]
+]
+SETORES = [
+    {"nome": "Vendas", "subsetores": [conta["nome"] for conta in CONTAS[:3]]},
+    {"nome": "Pós-Vendas", "subsetores": [conta["nome"] for conta in CONTAS[3:]]},
+]
+MAPEAMENTO = validar_mapeamento({"subsetores": CONTAS, "setores": SETORES}, "benchmark")
+FILIAIS, MESES = (1, 2, 3), range(1, 13)
+
+
+# Implementação anterior: subsetores e setores calculados razão a razão, em Python puro
+def analise_em_lacos(razoes):
+    saida = []
+    for linha in razoes:
+        for razao in linha:
+            for conta in CONTAS:
+                receita = obter_valor_conta(razao, conta["receita"])
+                custo = obter_valor_conta(razao, conta["custo"])
+                resultado = -receita - custo
+                saida.append((resultado / 1000, -resultado / receita * 100 if receita != 0 else 0))
+            for setor in (CONTAS[:3], CONTAS[3:]):
+                receita = sum(obter_valor_conta(razao, conta["receita"]) for conta in setor)
+                custo = sum(obter_valor_conta(razao, conta["custo"]) for conta in setor)
+                saida.append(((-receita - custo) / 1000, (receita + custo) / receita * 100 if receita != 0 else 0))
+    return saida
+
+
+# Função para medir o menor tempo de várias repetições
+def medir(funcao, repeticoes=200):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    razoes = [[ler_resposta_soap(gerar_envelope_soap(empresa=f, mes=m, ano=2024)) for m in MESES] for f in FILIAIS]
+    receita, custo, _ = montar_valores(
+        [razao for linha in razoes for razao in linha], [f for f in FILIAIS for _ in MESES], MAPEAMENTO
+    )
+    receita = receita.reshape(len(FILIAIS), len(MESES), -1)
+    custo = custo.reshape(len(FILIAIS), len(MESES), -1)
+    composicao = np.array([[nome in s["subsetores"] for nome in (c["nome"] for c in CONTAS)] for s in SETORES], float)
+
+    def so_calculo():
+        resultados_margens(receita, custo)
+        resultados_margens(receita @ composicao.T, custo @ composicao.T)
+        resultados_margens(receita.sum(axis=0), custo.sum(axis=0))
+
+    print(f"{len(FILIAIS)} filiais × {len(MESES)} meses × {len(CONTAS)} subsetores")
+    print(f"laços em Python (por filial e mês):      {medir(lambda: analise_em_lacos(razoes)) * 1e6:8.1f} µs")
+    print(f"motor vetorizado (extração + cálculo):   {medir(lambda: calcular_analise(razoes, FILIAIS, MAPEAMENTO)) * 1e6:8.1f} µs")
+    print(f"motor vetorizado (só cálculo em NumPy):  {medir(so_calculo) * 1e6:8.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Benchmark: parse em duas etapas (envelope + CDATA) x parser em passada única
+#
+# Uso: python -m benchmarks.parser_soap
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from dados_sinteticos import ARQUIVO_FIXTURE, NAMESPACES, carregar_itens_fixture, gerar_envelope_soap
+from razao import indexar_razao, ler_resposta_soap
+
+TAMANHO_BLOCO = 64 * 1024  # blocos como os entregues por iter_content()
+
+
+# Implementação anterior: monta a árvore do envelope, extrai o CDATA e monta a segunda árvore
+def ler_resposta_duas_etapas(conteudo):
+    root = ET.fromstring(conteudo)
+    body = root.find("soapenv:Body", NAMESPACES)
+    resposta = body.find("deal:WS_DealernetGateway.CONSULTASALDOCONTABILResponse", NAMESPACES)
+    xml_retorno = resposta.find("deal:Xml_retorno", NAMESPACES)
+    return indexar_razao(ET.fromstring(xml_retorno.text.strip()))
+
+
+# Função para ler em blocos, simulando uma resposta recebida aos poucos
+def ler_resposta_em_blocos(conteudo):
+    return ler_resposta_soap(conteudo[i:i + TAMANHO_BLOCO] for i in range(0, len(conteudo), TAMANHO_BLOCO))
+
+
+# Função para medir tempo e pico de memória (sem contar os bytes da resposta)
+def medir(funcao, conteudo, repeticoes):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(conteudo)
+        melhor = min(melhor, time.perf_counter() - inicio)
+    tracemalloc.start()
+    funcao(conteudo)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return melhor, pico
+
+
+def main():
+    with open(ARQUIVO_FIXTURE, "rb") as arquivo:
+        fixture = arquivo.read()
+    cenarios = [
+        ("soap.xml", fixture, 5),
+        ("sintético 100x", gerar_envelope_soap(num_contas=100 * len(carregar_itens_fixture())), 1),
+    ]
+    implementacoes = [
+        ("duas etapas", ler_resposta_duas_etapas),
+        ("passada única", ler_resposta_soap),
+        ("passada única (blocos)", ler_resposta_em_blocos),
+    ]
+    print(f"{'cenário':<16} {'MB':>7} {'implementação':<24} {'tempo (ms)':>11} {'pico (MB)':>10}")
+    for nome, conteudo, repeticoes in cenarios:
+        referencia = ler_resposta_duas_etapas(conteudo)
+        for rotulo, funcao in implementacoes:
+            assert funcao(conteudo) == referencia
+            tempo, pico = medir(funcao, conteudo, repeticoes)
+            print(f"{nome:<16} {len(conteudo) / 1e6:>7.1f} {rotulo:<24} {tempo * 1e3:>11.1f} {pico / 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# Benchmark: chamadas ao gateway (simulado) das consultas de período com e sem o
+# planejador de consultas_periodo, para o acumulado do ano (YTD), os últimos 12 meses (TTM)
+# e a comparação com o ano anterior. Também confere que os totais de uma chamada única
+# batem com a soma dos razões mensais. Cada cenário começa com o cache vazio.
+#
+# Uso: python -m benchmarks.planejador
+import math
+import os
+import tempfile
+import time
+
+import cache_razao
+import dealernet
+from consultas_periodo import (
+    combinar_razoes,
+    comparar_ano_anterior,
+    consultar_periodo,
+    deslocar_mes,
+    meses_intervalo,
+    serie_acumulada_ano,
+    serie_doze_meses,
+)
+from servidor_simulado import iniciar_servidor
+
+FILIAL = 2
+ANO = 2024
+
+
+# Função para começar um cenário sem nada no cache (nem no SQLite nem na memória)
+def limpar_cache(diretorio, nome):
+    cache_razao.ARQUIVO_CACHE = os.path.join(diretorio, f"{nome}.sqlite3")
+    with dealernet._trava:
+        dealernet._recentes.clear()
+
+
+# Função para obter os totais de um intervalo somando os razões mensais (sem o planejador)
+def periodo_mes_a_mes(filial, inicio, fim):
+    return combinar_razoes(
+        dealernet.consultar_razoes([(mes, ano, filial) for ano, mes in meses_intervalo(inicio, fim)])
+    )
+
+
+# Função para rodar um cenário e devolver (resultado, chamadas ao gateway, milissegundos)
+def medir(servidor, diretorio, nome, funcao):
+    limpar_cache(diretorio, nome)
+    servidor.requisicoes = 0
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return resultado, servidor.requisicoes, (time.perf_counter() - inicio) * 1e3
+
+
+# Função para conferir dois razões conta a conta
+def iguais(razao, referencia):
+    return razao.keys() == referencia.keys() and all(
+        math.isclose(razao[conta][campo], referencia[conta][campo], abs_tol=0.005)
+        for conta in referencia
+        for campo in ("SaldoInicial", "Debitos", "Creditos", "SaldoFinal")
+    )
+
+
+def main():
+    servidor = iniciar_servidor(num_contas=2_000)
+    dealernet.URL_GATEWAY = servidor.url
+    inicio_ttm, fim_ttm = (ANO, 9), (ANO, 11)
+    cenarios = [
+        (
+            f"YTD 01-11/{ANO} (totais)",
+            lambda: periodo_mes_a_mes(FILIAL, (ANO, 1), (ANO, 11)),
+            lambda: consultar_periodo(FILIAL, (ANO, 1), (ANO, 11)),
+        ),
+        (
+            f"YTD 01-11/{ANO} (série)",
+            lambda: [
+                (mes, periodo_mes_a_mes(FILIAL, (ANO, 1), mes)) for mes in meses_intervalo((ANO, 1), (ANO, 11))
+            ],
+            lambda: serie_acumulada_ano(FILIAL, ANO, 11),
+        ),
+        (
+            f"TTM 09-11/{ANO} (série)",
+            lambda: [
+                (mes, periodo_mes_a_mes(FILIAL, deslocar_mes(mes, -11), mes))
+                for mes in meses_intervalo(inicio_ttm, fim_ttm)
+            ],
+            lambda: serie_doze_meses(FILIAL, inicio_ttm, fim_ttm),
+        ),
+        (
+            f"07-11/{ANO} x {ANO - 1}",
+            lambda: (
+                periodo_mes_a_mes(FILIAL, (ANO, 7), (ANO, 11)),
+                periodo_mes_a_mes(FILIAL, (ANO - 1, 7), (ANO - 1, 11)),
+            ),
+            lambda: comparar_ano_anterior(FILIAL, (ANO, 7), (ANO, 11)),
+        ),
+    ]
+
+    divergencias = 0
+    with tempfile.TemporaryDirectory() as diretorio:
+        print(f"{'cenário':<26} {'mês a mês':>16} {'planejado':>16} {'confere':>8}")
+        for numero, (nome, ingenuo, planejado) in enumerate(cenarios):
+            esperado, chamadas_ingenuo, ms_ingenuo = medir(servidor, diretorio, f"ingenuo-{numero}", ingenuo)
+            obtido, chamadas_planejado, ms_planejado = medir(servidor, diretorio, f"planejado-{numero}", planejado)
+            if isinstance(esperado, tuple):
+                confere = all(iguais(a, b) for a, b in zip(obtido, esperado))
+            elif isinstance(esperado, list):
+                confere = len(obtido) == len(esperado) and all(
+                    mes_a == mes_b and iguais(a, b) for (mes_a, a), (mes_b, b) in zip(obtido, esperado)
+                )
+            else:
+                confere = iguais(obtido, esperado)
+            divergencias += not confere
+            print(
+                f"{nome:<26} {chamadas_ingenuo:>4} ({ms_ingenuo:7.1f} ms) {chamadas_planejado:>4} "
+                f"({ms_planejado:7.1f} ms) {'sim' if confere else 'NÃO':>8}"
+            )
+
+        # meses já no cache: só o trecho que falta vai ao gateway
+        limpar_cache(diretorio, "parcial")
+        dealernet.consultar_razoes([(mes, ANO, FILIAL) for mes in range(7, 12)])
+        servidor.requisicoes = 0
+        parcial = consultar_periodo(FILIAL, (ANO, 1), (ANO, 11))
+        chamadas = servidor.requisicoes
+        confere = iguais(parcial, periodo_mes_a_mes(FILIAL, (ANO, 1), (ANO, 11)))
+        divergencias += not confere
+        print(f"YTD com 07-11 no cache: {chamadas} chamada(s) para o trecho 01-06, confere: {'sim' if confere else 'NÃO'}")
+
+    servidor.shutdown()
+    if divergencias:
+        print(f"{divergencias} cenário(s) com totais diferentes da soma mensal")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# Benchmark da proteção do gateway, contra o gateway simulado com capacidade limitada (só
+# CAPACIDADE requisições atendidas ao mesmo tempo, as demais esperam no servidor):
+# - carga: três trabalhos em lote (aquecimento, relatórios, série anual) disputando o gateway
+#   enquanto um analista pede, algumas vezes, a análise de um mês (3 filiais). Compara o
+#   comportamento anterior (sem limite no cliente, cada trabalho com suas threads), um limite
+#   fixo com fila única e o limitador adaptativo com fila justa: tempo médio do analista, tempo
+#   do lote, pico de requisições no servidor e limite final;
+# - disjuntor: o gateway passa a responder só 503 ao renovar o mês em aberto; mostra as
+#   consultas que ainda chegam ao gateway, o razão guardado entregue como desatualizado e a
+#   volta ao normal quando o gateway se recupera;
+# - fila e limite: com uma só vaga ocupada, quem espera na fila interativa entra antes de quem
+#   chegou primeiro na de lote; falhas e latência alta reduzem o limite.
+# Sai com erro se o disjuntor não abrir na FALHAS_DISJUNTOR-ésima falha seguida (ou deixar
+# consultas chegarem ao gateway aberto), se o lote passar à frente da consulta interativa ou
+# se o limite não cair com falhas e com latência alta.
+#
+# Uso: python -m benchmarks.protecao_gateway
+import datetime
+import os
+import tempfile
+import threading
+import time
+
+import cache_razao
+import dealernet
+import protecao_gateway
+from protecao_gateway import LimitadorAdaptativo, estado_disjuntor, prioridade_gateway
+from servidor_simulado import iniciar_servidor
+
+CAPACIDADE = 2
+ATRASO = 0.2
+TRABALHOS_LOTE = 3
+PEDIDOS_POR_TRABALHO = 12
+ANALISTA = (0.6, 1.2, 1.8, 2.4)  # segundos depois do início do lote em que o analista pede
+
+
+# Função para recomeçar do zero: cache novo, nada na memória e um limitador novo
+def recomecar(diretorio, nome, limitador):
+    cache_razao.ARQUIVO_CACHE = os.path.join(diretorio, f"{nome}.sqlite3")
+    with dealernet._trava:
+        dealernet._recentes.clear()
+    dealernet._limitador = limitador
+
+
+# Função para rodar um cenário de carga; fila_unica=True põe lote e analista no mesmo
+# trabalho (a ordem de chegada decide, como numa fila comum)
+def rodar_carga(servidor, fila_unica):
+    tempos_lote = []
+
+    def lote(numero):
+        inicio = time.perf_counter()
+        pedidos = [(mes, 2000 + numero, 1, True) for mes in range(1, PEDIDOS_POR_TRABALHO + 1)]
+        with prioridade_gateway("lote", trabalho="fila" if fila_unica else None):
+            dealernet.consultar_razoes(pedidos)
+        tempos_lote.append(time.perf_counter() - inicio)
+
+    servidor.pico_simultaneas = 0
+    threads = [threading.Thread(target=lote, args=(numero,)) for numero in range(TRABALHOS_LOTE)]
+    comeco = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    analista = []
+    for instante in ANALISTA:
+        time.sleep(max(0.0, comeco + instante - time.perf_counter()))
+        inicio = time.perf_counter()
+        pedidos = [(11, 2024, filial, True) for filial in (1, 2, 3)]
+        if fila_unica:
+            with prioridade_gateway("lote", trabalho="fila"):
+                dealernet.consultar_razoes(pedidos)
+        else:
+            dealernet.consultar_razoes(pedidos)
+        analista.append(time.perf_counter() - inicio)
+    for thread in threads:
+        thread.join()
+    return sum(analista) / len(analista), max(tempos_lote), servidor.pico_simultaneas
+
+
+def carga(diretorio):
+    servidor = iniciar_servidor(atraso=ATRASO, fonte="fixture", capacidade=CAPACIDADE)
+    dealernet.URL_GATEWAY = servidor.url
+    tolerancia = protecao_gateway.TOLERANCIA_LATENCIA
+    cenarios = [
+        ("antes (sem limite)", lambda: LimitadorAdaptativo(1000, inicial=1000), True, float("inf")),
+        ("limite fixo 6, fila única", lambda: LimitadorAdaptativo(6, inicial=6), True, float("inf")),
+        ("adaptativo, fila justa", lambda: LimitadorAdaptativo(6), False, tolerancia),
+    ]
+    print(
+        f"Carga: {TRABALHOS_LOTE} trabalhos em lote × {PEDIDOS_POR_TRABALHO} razões e um analista ({len(ANALISTA)} "
+        f"análises de 3 filiais); gateway atende {CAPACIDADE} por vez, {ATRASO * 1e3:.0f} ms cada"
+    )
+    print(f"{'cenário':<28} {'analista (ms)':>14} {'lote (s)':>9} {'pico no gateway':>16} {'limite final':>13}")
+    for numero, (nome, limitador, fila_unica, tolerancia_cenario) in enumerate(cenarios):
+        recomecar(diretorio, f"carga-{numero}", limitador())
+        protecao_gateway.TOLERANCIA_LATENCIA = tolerancia_cenario
+        analista, lote, pico = rodar_carga(servidor, fila_unica)
+        situacao = dealernet._limitador.situacao()
+        limite = "-" if situacao["maximo"] >= 1000 else situacao["limite"]
+        print(f"{nome:<28} {analista * 1e3:>14.0f} {lote:>9.2f} {pico:>16} {limite:>13}")
+    protecao_gateway.TOLERANCIA_LATENCIA = tolerancia
+    servidor.shutdown()
+
+
+def disjuntor(diretorio):
+    servidor = iniciar_servidor(fonte="fixture")
+    dealernet.URL_GATEWAY = servidor.url
+    recomecar(diretorio, "disjuntor", LimitadorAdaptativo(dealernet.MAX_REQUISICOES_SIMULTANEAS))
+    # uma nova tentativa rápida por consulta, para não esperar o recuo padrão a cada 503
+    dealernet.MAX_TENTATIVAS, dealernet.FATOR_ESPERA, dealernet._sessao = 1, 0.01, None
+    protecao_gateway.ESPERA_DISJUNTOR = 1.0
+    hoje = datetime.date.today()
+    mes, ano = hoje.month, hoje.year
+
+    def consultar(rotulo):
+        antes = servidor.requisicoes
+        inicio = time.perf_counter()
+        razao = dealernet.consultar_razao(mes, ano, 1, renovar=True)
+        ms = (time.perf_counter() - inicio) * 1e3
+        if razao is None:
+            origem = "nenhum"
+        else:
+            origem = "desatualizado" if cache_razao.desatualizado_desde(razao) else "atual"
+        chegaram = servidor.requisicoes - antes
+        print(f"{rotulo:<30} {ms:>8.1f} {chegaram:>9} {origem:>14} {estado_disjuntor():>12}")
+        return origem, chegaram
+
+    print(f"\nDisjuntor: abre após {protecao_gateway.FALHAS_DISJUNTOR} falhas seguidas, "
+          f"testa o gateway após {protecao_gateway.ESPERA_DISJUNTOR:.0f} s")
+    print(f"{'consulta (renovar mês aberto)':<30} {'ms':>8} {'no gateway':>9} {'razão':>14} {'disjuntor':>12}")
+    consultar("gateway normal")
+    cache_razao.TTL_MES_ABERTO = 0  # o razão guardado já venceu
+    servidor.taxa_falhas = 1.0
+    for falhas in range(1, protecao_gateway.FALHAS_DISJUNTOR + 4):
+        aberto_antes = estado_disjuntor() == "aberto"
+        origem, chegaram = consultar(f"gateway com 503 ({falhas})")
+        esperado = "aberto" if falhas >= protecao_gateway.FALHAS_DISJUNTOR else "fechado"
+        if estado_disjuntor() != esperado:
+            raise SystemExit(f"disjuntor {estado_disjuntor()} após {falhas} falhas seguidas (esperado: {esperado})")
+        if aberto_antes and chegaram:
+            raise SystemExit(f"{chegaram} requisições chegaram ao gateway com o disjuntor aberto")
+        if origem != "desatualizado":
+            raise SystemExit(f"com o gateway em falha a consulta devolveu {origem} (esperado: o razão guardado)")
+    servidor.taxa_falhas = 0.0
+    consultar("gateway recuperado")
+    time.sleep(protecao_gateway.ESPERA_DISJUNTOR)
+    consultar("após a espera (teste)")
+    if estado_disjuntor() != "fechado":
+        raise SystemExit("o disjuntor não fechou após a consulta de teste com o gateway recuperado")
+    consultar("normal de novo")
+    servidor.shutdown()
+
+
+# Função para esperar (pouco) até a fila do limitador ter `quantidade` esperas da classe
+def esperar_fila(limitador, classe, quantidade):
+    limite = time.monotonic() + 5
+    while limitador.situacao()["na_fila"][classe] < quantidade:
+        if time.monotonic() > limite:
+            raise SystemExit(f"a fila {classe} não chegou a {quantidade} esperas")
+        time.sleep(0.001)
+
+
+def fila_e_limite():
+    print("\nFila e limite")
+    # uma vaga, ocupada; o lote entra na fila antes da consulta interativa
+    limitador = LimitadorAdaptativo(1, inicial=1)
+    limitador.adquirir("lote", "ocupante")
+    ordem = []
+
+    def esperar(classe):
+        limitador.adquirir(classe, classe)
+        ordem.append(classe)
+        limitador.liberar(classe)
+
+    threads = []
+    for classe in ("lote", "interativa"):
+        threads.append(threading.Thread(target=esperar, args=(classe,)))
+        threads[-1].start()
+        esperar_fila(limitador, classe, 1)
+    limitador.liberar("lote")
+    for thread in threads:
+        thread.join()
+    print(f"ordem de entrada (lote chegou primeiro): {', '.join(ordem)}")
+    if ordem != ["interativa", "lote"]:
+        raise SystemExit(f"a fila não pôs a consulta interativa antes do lote: {ordem}")
+
+    # falhas: o limite cai pela metade
+    limitador = LimitadorAdaptativo(8, inicial=8)
+    limitador.adquirir("interativa")
+    limitador.liberar("interativa", resultado="falha")
+    print(f"limite 8 após uma falha: {limitador.situacao()['limite']}")
+    if limitador.situacao()["limite"] >= 8:
+        raise SystemExit("o limite não caiu após uma falha")
+
+    # latência alta: respostas dez vezes mais lentas que a de base reduzem o limite
+    limitador = LimitadorAdaptativo(8, inicial=8)
+    for latencia in [0.001] * 5 + [0.01] * 20:
+        limitador.adquirir("interativa")
+        limitador.liberar("interativa", latencia, "ok")
+    print(f"limite 8 após latência 10× a de base: {limitador.situacao()['limite']}")
+    if limitador.situacao()["limite"] >= 8:
+        raise SystemExit("o limite não caiu com a latência alta")
+
+
+def main():
+    with tempfile.TemporaryDirectory() as diretorio:
+        carga(diretorio)
+        disjuntor(diretorio)
+    fila_e_limite()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Benchmark: requests.post avulso x sessão compartilhada, contra um gateway local
+# (também confere o tempo limite e as novas tentativas em falhas transitórias). Sai com erro
+# se a sessão não reaproveitar uma única conexão ou se as novas tentativas e o limite de
+# leitura não funcionarem
+#
+# Uso: python -m benchmarks.sessao_http
+import os
+import tempfile
+import time
+
+import requests
+
+import cache_razao
+import dealernet
+from servidor_simulado import iniciar_servidor
+
+NUM_REQUISICOES = 24
+
+
+# Função para medir N consultas, contando as conexões abertas no servidor
+def medir(servidor, funcao):
+    servidor.conexoes = 0
+    inicio = time.perf_counter()
+    for _ in range(NUM_REQUISICOES):
+        funcao()
+    return time.perf_counter() - inicio, servidor.conexoes
+
+
+def main():
+    with tempfile.TemporaryDirectory() as diretorio:
+        # as consultas gravam razões e o estado do disjuntor: nada disso vai para o cache real
+        cache_razao.ARQUIVO_CACHE = os.path.join(diretorio, "razao.sqlite3")
+        medir_sessao()
+
+
+def medir_sessao():
+    servidor = iniciar_servidor(fonte="fixture")
+    dealernet.URL_GATEWAY = servidor.url
+
+    tempo, conexoes = medir(servidor, lambda: requests.post(dealernet.URL_GATEWAY, data="<x/>").content)
+    print(f"requests.post avulso: {tempo * 1e3:7.1f} ms, {conexoes} conexões para {NUM_REQUISICOES} requisições")
+    tempo, conexoes = medir(servidor, lambda: dealernet.obter_sessao().post(dealernet.URL_GATEWAY, data="<x/>").content)
+    print(f"sessão compartilhada: {tempo * 1e3:7.1f} ms, {conexoes} conexões para {NUM_REQUISICOES} requisições")
+    if conexoes != 1:
+        raise SystemExit(f"a sessão compartilhada abriu {conexoes} conexões (esperado: 1)")
+
+    servidor.falhas_restantes = dealernet.MAX_TENTATIVAS - 1
+    razao = dealernet.requisitar_razao(11, 2024, 1)
+    print(f"{dealernet.MAX_TENTATIVAS - 1} respostas 503 seguidas: {'recuperado' if razao else 'falhou'} após novas tentativas")
+    if razao is None:
+        raise SystemExit("as novas tentativas não recuperaram a consulta após respostas 503")
+
+    dealernet.TIMEOUT_LEITURA = 0.2
+    dealernet.MAX_TENTATIVAS = 0
+    dealernet._sessao = None
+    servidor.atraso = 2.0
+    inicio = time.perf_counter()
+    razao = dealernet.requisitar_razao(11, 2024, 1)
+    segundos = time.perf_counter() - inicio
+    print(f"gateway travado: retornou {razao} em {segundos:.2f} s (limite de leitura 0.2 s)")
+    if razao is not None or segundos > 1.0:
+        raise SystemExit("o limite de leitura não interrompeu a consulta ao gateway travado")
+    servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
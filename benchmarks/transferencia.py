@@ -0,0 +1,104 @@
+# Benchmark da transferência das respostas do gateway (simulado, com banda limitada):
+# resposta inteira sem compressão antes da leitura (caminho anterior) x corpo lido em fluxo
+# pelo parser, sem e com gzip, e gzip pedido a um gateway que não comprime (a resposta
+# chega sem compressão e é lida do mesmo jeito). Mede bytes na rede, tempo total e tempo
+# até a primeira conta, e confere que todos os caminhos leem o mesmo razão.
+#
+# Uso: python -m benchmarks.transferencia [--banda 1024] [--contas 10000] [--repeticoes 5]
+import argparse
+import statistics
+import time
+
+import dealernet
+from metricas import rastrear
+from razao import ler_resposta_soap
+from servidor_simulado import iniciar_servidor
+
+# Pedido no formato do gateway (filial 1, 11/2024)
+PEDIDO_SOAP = (
+    '<soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:deal="DealerNet">'
+    "<soapenv:Body><deal:WS_DealernetGateway.CONSULTASALDOCONTABIL>"
+    "<deal:Empresa_codigo>1</deal:Empresa_codigo><deal:Dtini>2024-11-01</deal:Dtini><deal:Dtfin>2024-11-30</deal:Dtfin>"
+    "</deal:WS_DealernetGateway.CONSULTASALDOCONTABIL></soapenv:Body></soapenv:Envelope>"
+)
+
+
+# Caminho anterior: baixa a resposta inteira (sem compressão) e só então a lê
+def caminho_anterior(servidor):
+    enviado = time.perf_counter()
+    primeiro = {}
+    resposta = dealernet.obter_sessao().post(servidor.url, data=PEDIDO_SOAP, headers={"Accept-Encoding": "identity"})
+    conteudo = resposta.content
+    razao = ler_resposta_soap(conteudo, lambda: primeiro.setdefault("ms", (time.perf_counter() - enviado) * 1e3))
+    return razao, primeiro["ms"], resposta.raw.tell()
+
+
+# Caminho atual (dealernet.requisitar_razao): tempo até a primeira conta e bytes na rede vêm
+# do rastro
+def caminho_em_fluxo(servidor, compressao):
+    dealernet.URL_GATEWAY = servidor.url
+    dealernet.COMPRESSAO = compressao
+    with rastrear("transferencia") as rastro:
+        razao = dealernet.requisitar_razao(11, 2024, 1)
+    leitura = next(medida for medida in rastro["etapas"] if medida["etapa"] == "leitura")
+    return razao, leitura["primeiro_registro_ms"], leitura["bytes_transferidos"]
+
+
+# Função para medir um caminho: medianas do tempo total e até a primeira conta, bytes por
+# resposta (contados no cliente, já recebidos: o contador do servidor pode ainda não ter
+# somado o último envio quando o cliente termina)
+def medir(funcao, repeticoes):
+    funcao()  # aquecimento (conexão aberta, envelope gerado e comprimido no servidor)
+    totais, primeiros, recebidos = [], [], []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        razao, primeiro_ms, transferidos = funcao()
+        totais.append((time.perf_counter() - inicio) * 1e3)
+        primeiros.append(primeiro_ms)
+        recebidos.append(transferidos)
+    return razao, {
+        "total_ms": statistics.median(totais),
+        "primeiro_ms": statistics.median(primeiros),
+        "bytes": sum(recebidos) // repeticoes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara a transferência das respostas do gateway.")
+    parser.add_argument("--banda", type=float, default=1024, help="KB/s de cada resposta (0 = sem limite)")
+    parser.add_argument("--contas", type=int, nargs="*", default=[10_000], help="razões sintéticos além do soap.xml")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    divergencias = 0
+    print(f"{'cenário':<10} {'caminho':<36} {'KB na rede':>10} {'total (ms)':>11} {'1ª conta (ms)':>14}")
+    for contas in [None] + args.contas:
+        opcoes = {"fonte": "fixture"} if contas is None else {"num_contas": contas}
+        comprime = iniciar_servidor(banda=args.banda * 1024, **opcoes)
+        nao_comprime = iniciar_servidor(banda=args.banda * 1024, compressao=False, **opcoes)
+        caminhos = [
+            ("inteira, sem compressão (anterior)", lambda: caminho_anterior(comprime)),
+            ("em fluxo, sem compressão", lambda: caminho_em_fluxo(comprime, False)),
+            ("em fluxo, gzip", lambda: caminho_em_fluxo(comprime, True)),
+            ("em fluxo, gzip recusado", lambda: caminho_em_fluxo(nao_comprime, True)),
+        ]
+        referencia = None
+        cenario = "soap.xml" if contas is None else f"{contas // 1000}k"
+        for nome, funcao in caminhos:
+            razao, medida = medir(funcao, args.repeticoes)
+            referencia = referencia or razao
+            confere = razao == referencia
+            divergencias += not confere
+            print(
+                f"{cenario:<10} {nome:<36} {medida['bytes'] / 1024:>10.1f} {medida['total_ms']:>11.1f} "
+                f"{medida['primeiro_ms']:>14.1f}{'' if confere else '  <- razão diferente'}"
+            )
+        comprime.shutdown()
+        nao_comprime.shutdown()
+
+    if divergencias:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+import contextlib
+import datetime
+import json
+import os
+import sqlite3
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: sem trava entre processos, vale só o cache
+    fcntl = None
+
+# Modo offline (DEALERNET_OFFLINE=1): as consultas vão para o gateway simulado local
+# (servidor_simulado) e os dados simulados ficam em cache/offline, separados dos reais
+MODO_OFFLINE = os.environ.get("DEALERNET_OFFLINE") == "1"
+DIRETORIO_CACHE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "cache", *(["offline"] if MODO_OFFLINE else [])
+)
+
+# Arquivo SQLite do cache e validade (em segundos) do mês ainda aberto
+ARQUIVO_CACHE = os.environ.get("DEALERNET_CACHE", os.path.join(DIRETORIO_CACHE, "razao.sqlite3"))
+TTL_MES_ABERTO = float(os.environ.get("DEALERNET_CACHE_TTL", 15 * 60))
+
+
+# Razão lido do cache depois de vencido, entregue quando o gateway não responde: é um razão
+# como os outros, que também guarda quando foi gravado (ver desatualizado_desde)
+class RazaoDesatualizado(dict):
+    def __init__(self, razao, gravado_em):
+        super().__init__(razao)
+        self.gravado_em = gravado_em
+
+    def __reduce__(self):
+        return RazaoDesatualizado, (dict(self), self.gravado_em)
+
+
+# Função para abrir o banco do cache (cria a tabela na primeira vez)
+def _conectar():
+    os.makedirs(os.path.dirname(ARQUIVO_CACHE) or ".", exist_ok=True)
+    conexao = sqlite3.connect(ARQUIVO_CACHE, timeout=30)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute(
+        """CREATE TABLE IF NOT EXISTS razoes (
+            empresa INTEGER NOT NULL,
+            ano INTEGER NOT NULL,
+            mes INTEGER NOT NULL,
+            gravado_em REAL NOT NULL,
+            conteudo TEXT NOT NULL,
+            PRIMARY KEY (empresa, ano, mes)
+        )"""
+    )
+    # razões de intervalos com mais de um mês (períodos como AAAAMM)
+    conexao.execute(
+        """CREATE TABLE IF NOT EXISTS intervalos (
+            empresa INTEGER NOT NULL,
+            inicio INTEGER NOT NULL,
+            fim INTEGER NOT NULL,
+            gravado_em REAL NOT NULL,
+            conteudo TEXT NOT NULL,
+            PRIMARY KEY (empresa, inicio, fim)
+        )"""
+    )
+    # estado do disjuntor do gateway, compartilhado pelos processos que usam este cache
+    conexao.execute(
+        """CREATE TABLE IF NOT EXISTS disjuntor (
+            nome TEXT PRIMARY KEY,
+            falhas INTEGER NOT NULL,
+            aberto_ate REAL NOT NULL,
+            sonda_ate REAL NOT NULL
+        )"""
+    )
+    return conexao
+
+
+# Função para saber se o mês já foi encerrado (seus saldos não mudam mais)
+def mes_fechado(mes, ano, hoje=None):
+    hoje = hoje or datetime.date.today()
+    return (ano, mes) < (hoje.year, hoje.month)
+
+
+# Função para saber se um razão gravado em gravado_em (segundos desde a época) vale para
+# sempre: só se foi gravado depois do fechamento do mês. Um razão gravado com o mês ainda
+# aberto é um retrato parcial e continua vencendo pelo TTL, até ser buscado de novo
+def gravado_apos_fechamento(mes, ano, gravado_em):
+    seguinte = datetime.date(ano + mes // 12, mes % 12 + 1, 1)
+    return gravado_em >= time.mktime(seguinte.timetuple())
+
+
+# Função para ler um razão do cache (None se ausente ou expirado; com vencido=True o razão
+# expirado também é devolvido, como RazaoDesatualizado). Só razões gravados depois do
+# fechamento do mês não expiram
+def ler_cache(filial, ano, mes, vencido=False):
+    with _conectar() as conexao:
+        linha = conexao.execute(
+            "SELECT gravado_em, conteudo FROM razoes WHERE empresa = ? AND ano = ? AND mes = ?",
+            (filial, ano, mes),
+        ).fetchone()
+    if linha is None:
+        return None
+    gravado_em, conteudo = linha
+    if not gravado_apos_fechamento(mes, ano, gravado_em) and time.time() - gravado_em > TTL_MES_ABERTO:
+        return RazaoDesatualizado(json.loads(conteudo), gravado_em) if vencido else None
+    return json.loads(conteudo)
+
+
+# Função para gravar um razão no cache
+def gravar_cache(filial, ano, mes, razao):
+    conteudo = json.dumps(razao, ensure_ascii=False, separators=(",", ":"))
+    with _conectar() as conexao:
+        conexao.execute(
+            "INSERT OR REPLACE INTO razoes (empresa, ano, mes, gravado_em, conteudo) VALUES (?, ?, ?, ?, ?)",
+            (filial, ano, mes, time.time(), conteudo),
+        )
+
+
+# Função para ler o razão de um intervalo ((ano, mes) inicial e final) do cache
+# (None se ausente ou expirado, salvo com vencido=True; o intervalo vale para sempre quando
+# foi gravado depois do fechamento do seu último mês)
+def ler_cache_intervalo(filial, inicio, fim, vencido=False):
+    with _conectar() as conexao:
+        linha = conexao.execute(
+            "SELECT gravado_em, conteudo FROM intervalos WHERE empresa = ? AND inicio = ? AND fim = ?",
+            (filial, inicio[0] * 100 + inicio[1], fim[0] * 100 + fim[1]),
+        ).fetchone()
+    if linha is None:
+        return None
+    gravado_em, conteudo = linha
+    if not gravado_apos_fechamento(fim[1], fim[0], gravado_em) and time.time() - gravado_em > TTL_MES_ABERTO:
+        return RazaoDesatualizado(json.loads(conteudo), gravado_em) if vencido else None
+    return json.loads(conteudo)
+
+
+# Função para gravar o razão de um intervalo no cache
+def gravar_cache_intervalo(filial, inicio, fim, razao):
+    conteudo = json.dumps(razao, ensure_ascii=False, separators=(",", ":"))
+    with _conectar() as conexao:
+        conexao.execute(
+            "INSERT OR REPLACE INTO intervalos (empresa, inicio, fim, gravado_em, conteudo) VALUES (?, ?, ?, ?, ?)",
+            (filial, inicio[0] * 100 + inicio[1], fim[0] * 100 + fim[1], time.time(), conteudo),
+        )
+
+
+# Função para saber desde quando um razão está desatualizado (instante em que foi gravado no
+# cache, em segundos desde a época); None para razões atuais
+def desatualizado_desde(razao):
+    return getattr(razao, "gravado_em", None)
+
+
+# Função para ler o estado do disjuntor: (falhas seguidas, aberto até, sonda até)
+def ler_disjuntor(nome="gateway"):
+    with _conectar() as conexao:
+        linha = conexao.execute(
+            "SELECT falhas, aberto_ate, sonda_ate FROM disjuntor WHERE nome = ?", (nome,)
+        ).fetchone()
+    return linha or (0, 0.0, 0.0)
+
+
+# Função para ler e alterar o estado do disjuntor numa só transação (nenhum outro processo o
+# altera no meio): alterar recebe o estado atual e retorna o novo, ou None para mantê-lo.
+# Retorna (estado anterior, estado atual)
+def alterar_disjuntor(alterar, nome="gateway"):
+    conexao = _conectar()
+    try:
+        conexao.execute("BEGIN IMMEDIATE")
+        linha = conexao.execute(
+            "SELECT falhas, aberto_ate, sonda_ate FROM disjuntor WHERE nome = ?", (nome,)
+        ).fetchone()
+        anterior = linha or (0, 0.0, 0.0)
+        novo = alterar(anterior)
+        if novo is not None and novo != anterior:
+            conexao.execute(
+                "INSERT OR REPLACE INTO disjuntor (nome, falhas, aberto_ate, sonda_ate) VALUES (?, ?, ?, ?)",
+                (nome, *novo),
+            )
+        conexao.commit()
+    finally:
+        conexao.close()
+    return anterior, anterior if novo is None else novo
+
+
+# Trava entre processos para um razão: enquanto um processo busca (filial, ano, mes)
+# no gateway, os demais esperam e depois leem o resultado do cache
+def travar_razao(filial, ano, mes):
+    return _travar(f"{filial}-{ano}-{mes:02d}")
+
+
+# Trava entre processos para o razão de um intervalo
+def travar_intervalo(filial, inicio, fim):
+    return _travar(f"{filial}-{inicio[0]}{inicio[1]:02d}-{fim[0]}{fim[1]:02d}")
+
+
+# Trava entre processos para o histórico colunar: uma gravação de cada vez lê a versão atual
+# e publica a seguinte
+def travar_historico():
+    return _travar("historico")
+
+
+@contextlib.contextmanager
+def _travar(nome):
+    if fcntl is None:
+        yield
+        return
+    diretorio = os.path.join(os.path.dirname(ARQUIVO_CACHE) or ".", "travas")
+    os.makedirs(diretorio, exist_ok=True)
+    with open(os.path.join(diretorio, f"{nome}.lock"), "a") as arquivo:
+        fcntl.flock(arquivo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(arquivo, fcntl.LOCK_UN)
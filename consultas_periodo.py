@@ -0,0 +1,149 @@
+# Consultas de qualquer intervalo de meses com o menor número de chamadas ao gateway.
+# O gateway aceita Dtini/Dtfin de vários meses e responde com os saldos no início e no fim
+# do intervalo e os débitos e créditos do período; assim, os totais de um intervalo saem de
+# uma única chamada, e só séries mês a mês precisam de uma chamada por mês (e apenas dos
+# meses que ainda não estão no cache).
+from cache_razao import ler_cache, ler_cache_intervalo
+from dealernet import consultar_intervalos
+
+
+# Função para listar os meses (ano, mes) de um intervalo, inclusivo
+def meses_intervalo(inicio, fim):
+    return [(indice // 12, indice % 12 + 1) for indice in range(inicio[0] * 12 + inicio[1] - 1, fim[0] * 12 + fim[1])]
+
+
+# Função para deslocar um mês (ano, mes) em alguns meses (negativo volta no tempo)
+def deslocar_mes(mes, quantidade):
+    indice = mes[0] * 12 + mes[1] - 1 + quantidade
+    return indice // 12, indice % 12 + 1
+
+
+# Função para juntar razões de meses (ou trechos) consecutivos, em ordem, no razão do
+# intervalo todo: saldo inicial do primeiro, débitos e créditos somados e saldo final do último
+def combinar_razoes(razoes):
+    combinado = {}
+    for razao in razoes:
+        for conta_id, registro in razao.items():
+            atual = combinado.get(conta_id)
+            if atual is None:
+                combinado[conta_id] = dict(registro)
+                continue
+            atual["Debitos"] = round(atual["Debitos"] + registro["Debitos"], 2)
+            atual["Creditos"] = round(atual["Creditos"] + registro["Creditos"], 2)
+            atual["SaldoFinal"] = registro["SaldoFinal"]
+    return combinado
+
+
+# Função para separar meses em trechos de meses consecutivos: [(inicio, fim), ...]
+def _trechos(meses):
+    trechos = []
+    for mes in meses:
+        if trechos and deslocar_mes(trechos[-1][1], 1) == mes:
+            trechos[-1] = (trechos[-1][0], mes)
+        else:
+            trechos.append((mes, mes))
+    return trechos
+
+
+# Função para planejar as chamadas de um intervalo. Com mensal=True (série mês a mês),
+# cada mês fora do cache vira uma chamada mensal. Sem série, basta o total do intervalo:
+# nenhuma chamada se todos os meses (ou o próprio intervalo) estão no cache, uma chamada
+# para o trecho que falta se os meses fora do cache são consecutivos e, senão, uma única
+# chamada para o intervalo todo
+def planejar(filial, inicio, fim, mensal=False):
+    meses = meses_intervalo(inicio, fim)
+    em_cache = {}
+    for ano, mes in meses:
+        razao = ler_cache(filial, ano, mes)
+        if razao is not None:
+            em_cache[(ano, mes)] = razao
+    faltando = [mes for mes in meses if mes not in em_cache]
+    plano = {"filial": filial, "inicio": inicio, "fim": fim, "mensal": mensal, "em_cache": em_cache}
+
+    if mensal:
+        plano["chamadas"] = [(mes, mes) for mes in faltando]
+    elif not faltando:
+        plano["chamadas"] = []
+    elif len(meses) > 1 and ler_cache_intervalo(filial, inicio, fim) is not None:
+        plano["chamadas"] = [(inicio, fim)]  # já está no cache de intervalos
+    else:
+        trechos = _trechos(faltando)
+        plano["chamadas"] = trechos if len(trechos) == 1 else [(inicio, fim)]
+    return plano
+
+
+# Função para executar vários planos de uma vez: todas as chamadas (sem repetição) vão ao
+# gateway em paralelo. Cada plano recebe "razoes" com o resultado de cada chamada, ou o
+# plano inteiro falha (None) se alguma delas falhar
+def executar(planos):
+    chamadas = list(dict.fromkeys(
+        (inicio, fim, plano["filial"]) for plano in planos for inicio, fim in plano["chamadas"]
+    ))
+    resultados = dict(zip(chamadas, consultar_intervalos(chamadas)))
+    for plano in planos:
+        plano["razoes"] = {
+            (inicio, fim): resultados[(inicio, fim, plano["filial"])] for inicio, fim in plano["chamadas"]
+        }
+    return planos
+
+
+# Função para montar o resultado de um plano executado: a série mês a mês
+# [((ano, mes), razao), ...] ou o razão com os totais do intervalo (None em caso de falha)
+def _resultado(plano):
+    if any(razao is None for razao in plano["razoes"].values()):
+        return None
+    if plano["mensal"]:
+        meses = meses_intervalo(plano["inicio"], plano["fim"])
+        return [(mes, plano["em_cache"].get(mes) or plano["razoes"][(mes, mes)]) for mes in meses]
+    if (plano["inicio"], plano["fim"]) in plano["razoes"]:
+        return plano["razoes"][(plano["inicio"], plano["fim"])]
+    # meses do cache e trechos buscados, juntados em ordem
+    pedacos = sorted(
+        [(mes, razao) for mes, razao in plano["em_cache"].items()]
+        + [(inicio, razao) for (inicio, _), razao in plano["razoes"].items()]
+    )
+    return combinar_razoes(razao for _, razao in pedacos)
+
+
+# Função para obter o razão com os totais de um intervalo ((ano, mes) inicial e final)
+def consultar_periodo(filial, inicio, fim):
+    return _resultado(executar([planejar(filial, inicio, fim)])[0])
+
+
+# Função para obter a série mês a mês de um intervalo: [((ano, mes), razao), ...]
+def consultar_serie(filial, inicio, fim):
+    return _resultado(executar([planejar(filial, inicio, fim, mensal=True)])[0])
+
+
+# Função para obter a série acumulada no ano (YTD): para cada mês de janeiro até ate_mes,
+# o razão de janeiro até aquele mês (calculada a partir da série mensal, sem outras chamadas)
+def serie_acumulada_ano(filial, ano, ate_mes):
+    serie = consultar_serie(filial, (ano, 1), (ano, ate_mes))
+    if serie is None:
+        return None
+    return [
+        (mes, combinar_razoes(razao for _, razao in serie[:posicao + 1])) for posicao, (mes, _) in enumerate(serie)
+    ]
+
+
+# Função para obter a série dos últimos 12 meses (TTM): para cada mês do intervalo, o razão
+# dos 12 meses terminados nele (uma única série mensal cobre todas as janelas)
+def serie_doze_meses(filial, inicio, fim):
+    serie = consultar_serie(filial, deslocar_mes(inicio, -11), fim)
+    if serie is None:
+        return None
+    return [
+        (mes, combinar_razoes(razao for _, razao in serie[posicao - 11:posicao + 1]))
+        for posicao, (mes, _) in enumerate(serie)
+        if posicao >= 11
+    ]
+
+
+# Função para comparar um intervalo com o mesmo intervalo do ano anterior: (atual, anterior),
+# com as chamadas dos dois períodos feitas juntas
+def comparar_ano_anterior(filial, inicio, fim):
+    planos = executar([
+        planejar(filial, inicio, fim),
+        planejar(filial, deslocar_mes(inicio, -12), deslocar_mes(fim, -12)),
+    ])
+    return _resultado(planos[0]), _resultado(planos[1])
@@ -0,0 +1,161 @@
+import os
+import random
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+ARQUIVO_FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "soap.xml")
+FILIAL_FIXTURE, MES_FIXTURE, ANO_FIXTURE = 1, 11, 2024  # filial e período do razão gravado no soap.xml
+NAMESPACES = {"soapenv": "http://schemas.xmlsoap.org/soap/envelope/", "deal": "DealerNet"}
+CAMPOS_ITEM = (
+    "ContaID", "ContaIDNivel", "ContaDescricao", "ContaNatureza", "ContaTipo", "ContaNivel",
+    "SaldoInicial", "Debitos", "Creditos", "SaldoFinal", "Empresa", "DataInicial", "DataFinal",
+)
+
+_itens_fixture = None
+
+
+# Função para ler os itens do razão contido no soap.xml (lido uma única vez)
+def carregar_itens_fixture():
+    global _itens_fixture
+    if _itens_fixture is None:
+        root = ET.parse(ARQUIVO_FIXTURE).getroot()
+        xml_retorno = root.find(
+            "soapenv:Body/deal:WS_DealernetGateway.CONSULTASALDOCONTABILResponse/deal:Xml_retorno", NAMESPACES
+        )
+        cdata_root = ET.fromstring(xml_retorno.text.strip())
+        _itens_fixture = [
+            {campo: item.findtext(campo) or "" for campo in CAMPOS_ITEM}
+            for item in cdata_root.iter("SDT_SaldoContabilItem")
+        ]
+    return _itens_fixture
+
+
+# Função para ordenar contas pela hierarquia do plano (1 < 1.1 < 1.1.1 < 1.2 ...)
+def _chave_conta(conta_id):
+    return [int(parte) for parte in conta_id.split(".")]
+
+
+# Função para gerar os itens de um razão sintético com pelo menos num_contas contas
+def gerar_itens(num_contas=None, empresa=1, mes=11, ano=2024, semente=0):
+    from calendar import monthrange
+
+    aleatorio = random.Random(f"{semente}-{empresa}-{ano}-{mes}")
+    fator = 0.5 + aleatorio.random()  # varia os valores por filial e período
+    data_inicial = f"01/{mes:02d}/{ano}"
+    data_final = f"{monthrange(ano, mes)[1]:02d}/{mes:02d}/{ano}"
+
+    itens = []
+    for original in carregar_itens_fixture():
+        item = dict(original)
+        for campo in ("SaldoInicial", "Debitos", "Creditos"):
+            item[campo] = f"{float(original[campo]) * fator:.2f}"
+        item["SaldoFinal"] = (
+            f"{float(item['SaldoInicial']) + float(item['Debitos']) - float(item['Creditos']):.2f}"
+        )
+        item["Empresa"] = str(empresa)
+        item["DataInicial"] = data_inicial
+        item["DataFinal"] = data_final
+        itens.append(item)
+
+    # Contas analíticas extras espalhadas sob as contas sintéticas de nível 4,
+    # para que o plano cresça "por dentro" e não só no final do arquivo
+    pais = [item for item in itens if item["ContaNivel"] == "4"]
+    proximo_sufixo = {}
+    while num_contas is not None and len(itens) < num_contas:
+        pai = pais[len(itens) % len(pais)]
+        sufixo = proximo_sufixo.get(pai["ContaIDNivel"], 900000)
+        proximo_sufixo[pai["ContaIDNivel"]] = sufixo + 1
+        saldo_inicial = round(aleatorio.uniform(-1e6, 1e6), 2)
+        debitos = round(aleatorio.uniform(0, 1e5), 2)
+        creditos = round(aleatorio.uniform(0, 1e5), 2)
+        itens.append({
+            "ContaID": str(len(itens) + 1_000_000),
+            "ContaIDNivel": f"{pai['ContaIDNivel']}.{sufixo:06d}",
+            "ContaDescricao": f"CONTA SINTETICA {sufixo}",
+            "ContaNatureza": pai["ContaNatureza"],
+            "ContaTipo": "A",
+            "ContaNivel": "5",
+            "SaldoInicial": f"{saldo_inicial:.2f}",
+            "Debitos": f"{debitos:.2f}",
+            "Creditos": f"{creditos:.2f}",
+            "SaldoFinal": f"{saldo_inicial + debitos - creditos:.2f}",
+            "Empresa": str(empresa),
+            "DataInicial": data_inicial,
+            "DataFinal": data_final,
+        })
+
+    itens.sort(key=lambda item: _chave_conta(item["ContaIDNivel"]))
+    return itens
+
+
+# Função para juntar os itens de meses consecutivos num razão do intervalo, como o gateway
+# responde a um Dtini/Dtfin de vários meses: saldo inicial do primeiro mês em que a conta
+# aparece, débitos e créditos somados e saldo final do último
+def combinar_itens(meses_itens):
+    combinados = {}
+    for itens in meses_itens:
+        for item in itens:
+            atual = combinados.get(item["ContaIDNivel"])
+            if atual is None:
+                combinados[item["ContaIDNivel"]] = dict(item)
+                continue
+            for campo in ("Debitos", "Creditos"):
+                atual[campo] = f"{float(atual[campo]) + float(item[campo]):.2f}"
+            atual["SaldoFinal"] = item["SaldoFinal"]
+            atual["DataFinal"] = item["DataFinal"]
+    return sorted(combinados.values(), key=lambda item: _chave_conta(item["ContaIDNivel"]))
+
+
+# Função para gerar os itens do razão de um intervalo ((ano, mes) inicial e final)
+def gerar_itens_intervalo(num_contas=None, empresa=1, inicio=(2024, 1), fim=(2024, 12), semente=0):
+    meses = [(indice // 12, indice % 12 + 1) for indice in range(inicio[0] * 12 + inicio[1] - 1, fim[0] * 12 + fim[1])]
+    return combinar_itens(itens_mes(num_contas, empresa, mes, ano, semente) for ano, mes in meses)
+
+
+# Função para obter os itens de um mês como o gateway simulado os responde: o período do
+# soap.xml com os valores reais, os demais sintéticos
+def itens_mes(num_contas=None, empresa=1, mes=11, ano=2024, semente=0):
+    if num_contas is None and (empresa, mes, ano) == (FILIAL_FIXTURE, MES_FIXTURE, ANO_FIXTURE):
+        return carregar_itens_fixture()
+    return gerar_itens(num_contas, empresa, mes, ano, semente)
+
+
+# Função para montar o XML interno (conteúdo do CDATA) de um razão sintético
+def gerar_razao_xml(num_contas=None, empresa=1, mes=11, ano=2024, semente=0):
+    return _xml_itens(gerar_itens(num_contas, empresa, mes, ano, semente))
+
+
+def _xml_itens(itens):
+    partes = ["<SDT_SaldoContabil>"]
+    for item in itens:
+        partes.append("<SDT_SaldoContabilItem>")
+        partes.extend(f"<{campo}>{escape(item[campo])}</{campo}>" for campo in CAMPOS_ITEM)
+        partes.append("</SDT_SaldoContabilItem>")
+    partes.append("</SDT_SaldoContabil>")
+    return "".join(partes)
+
+
+# Função para montar um envelope SOAP completo no mesmo formato do gateway
+def gerar_envelope_soap(num_contas=None, empresa=1, mes=11, ano=2024, semente=0):
+    return _envelope(gerar_razao_xml(num_contas, empresa, mes, ano, semente))
+
+
+# Função para montar o envelope SOAP do razão de um intervalo de meses
+def gerar_envelope_intervalo(num_contas=None, empresa=1, inicio=(2024, 1), fim=(2024, 12), semente=0):
+    return _envelope(_xml_itens(gerar_itens_intervalo(num_contas, empresa, inicio, fim, semente)))
+
+
+def _envelope(cdata):
+    return (
+        '<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/" '
+        'xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        'xmlns:SOAP-ENC="http://schemas.xmlsoap.org/soap/encoding/" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+        "   <SOAP-ENV:Body>\n"
+        '      <WS_DealernetGateway.CONSULTASALDOCONTABILResponse xmlns="DealerNet">\n'
+        "         <Msgretorno/>\n"
+        f"         <Xml_retorno><![CDATA[{cdata}]]></Xml_retorno>\n"
+        "      </WS_DealernetGateway.CONSULTASALDOCONTABILResponse>\n"
+        "   </SOAP-ENV:Body>\n"
+        "</SOAP-ENV:Envelope>"
+    ).encode("utf-8")
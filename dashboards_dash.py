@@ -1,78 +1,109 @@
+import os
+import time
 import dash
-from dash import dcc, html, Input, Output
+import diskcache
+import flask
+from dash import dcc, html, Input, Output, State, ALL, DiskcacheManager, Patch
 import plotly.graph_objects as go
-import requests
-import xml.etree.ElementTree as ET
-import numpy as np
-
-# Função para calcular o último dia do mês
-def ultimo_dia_mes(mes, ano):
-    if mes in {1, 3, 5, 7, 8, 10, 12}:
-        return 31
-    elif mes in {4, 6, 9, 11}:
-        return 30
-    else:
-        return 29 if (ano % 4 == 0 and (ano % 100 != 0 or ano % 400 == 0)) else 28
+from cache_razao import DIRETORIO_CACHE, MODO_OFFLINE, TTL_MES_ABERTO
+from nucleo import (
+    FILIAIS,
+    codigos_filiais,
+    consultar_razao,
+    consultar_razoes,
+    desatualizado_desde,
+    numeros_analise,
+    situacao_gateway,
+    subarvore_visivel,
+)
+from metricas import medido, medir, rastrear, registrar_rastro, texto_prometheus, usou_desatualizados
 
-# Função para fazer requisição SOAP e obter dados XML
+# Função para fazer requisição SOAP e obter dados XML (via cache local)
+@medido("requisicao_soap")
 def realizar_requisicao_soap(mes, ano):
-    ultimo_dia = ultimo_dia_mes(mes, ano)
-    url = "https://gaivota.dealernetworkflow.com.br/aws_dealernetgateway.aspx"
-    headers = {"Content-Type": "text/xml; charset=utf-8"}
-    soap_body = f"""
-    <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:deal="DealerNet">
-    <soapenv:Header/>
-    <soapenv:Body>
-        <deal:WS_DealernetGateway.CONSULTASALDOCONTABIL>
-            <deal:Usuario_identificador>portus</deal:Usuario_identificador>
-            <deal:Usuariosenha_senha>Portus25@</deal:Usuariosenha_senha>
-            <deal:Empresa_codigo>1</deal:Empresa_codigo>
-            <deal:Dtini>{ano}-{mes:02d}-01</deal:Dtini>
-            <deal:Dtfin>{ano}-{mes:02d}-{ultimo_dia}</deal:Dtfin>
-        </deal:WS_DealernetGateway.CONSULTASALDOCONTABIL>
-    </soapenv:Body>
-    </soapenv:Envelope>
-    """
-    response = requests.post(url, data=soap_body, headers=headers)
-    if response.status_code == 200:
-        root = ET.fromstring(response.content)
-        namespaces = {"soapenv": "http://schemas.xmlsoap.org/soap/envelope/", "deal": "DealerNet"}
-        body = root.find("soapenv:Body", namespaces)
-        response = body.find("deal:WS_DealernetGateway.CONSULTASALDOCONTABILResponse", namespaces)
-        xml_retorno = response.find("deal:Xml_retorno", namespaces)
-        if xml_retorno is not None and xml_retorno.text:
-            return ET.fromstring(xml_retorno.text.strip())
-    return None
-
-# Função para calcular resultados e margens
-def calcular_resultados_margens(contas, cdata_root):
-    resultados, margens, nomes = [], [], []
-    for conta in contas:
-        valor_receita = obter_valor_conta(cdata_root, conta["receita"])
-        valor_custo = obter_valor_conta(cdata_root, conta["custo"])
-        if valor_receita is not None and valor_custo is not None:
-            resultado = -valor_receita - valor_custo
-            margem = -resultado / valor_receita * 100 if valor_receita != 0 else 0
-            nomes.append(conta["nome"])
-            resultados.append(resultado / 1000)  # Em milhares de reais
-            margens.append(margem)
-    return nomes, resultados, margens
-
-# Função para extrair valores das contas
-def obter_valor_conta(cdata_root, conta_id):
-    for item in cdata_root.findall(".//SDT_SaldoContabilItem"):
-        if item.find("ContaIDNivel").text == conta_id:
-            saldo_inicial = item.find("SaldoInicial").text
-            saldo_final = item.find("SaldoFinal").text
-            return np.round(float(saldo_final) - float(saldo_inicial), 2)
-    return None
+    return consultar_razao(mes, ano, 1)
+
+# Função para montar o gráfico sem dados (traços e layout), enviado uma única vez com a
+# página; cada análise só manda ao navegador os dados, o título e o nome do eixo x
+def figura_inicial():
+    fig = go.Figure()
+    fig.add_trace(go.Bar(x=[], y=[], name="Resultado (mil R$)", marker_color="DodgerBlue"))
+    fig.add_trace(go.Scatter(x=[], y=[], name="Margem Bruta (%)", mode="lines+markers", marker_color="OrangeRed"))
+    fig.update_layout(
+        title="",
+        xaxis_title="Setores",
+        yaxis_title="Valores",
+        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
+    )
+    return fig
+
+# Gerenciador dos callbacks em segundo plano que só guarda no cache resultados completos:
+# falhas (PreventUpdate, exceções) e gráficos montados com razões desatualizados são
+# entregues uma vez e descartados, para que o próximo pedido volte ao gateway
+class GerenciadorCallbacks(DiskcacheManager):
+    def get_result(self, key, job):
+        resultado = super().get_result(key, job)
+        if not resultado_guardavel(resultado):
+            self.clear_cache_entry(key)
+        return resultado
+
+    # Função para encerrar o processo de um callback. Com vários workers a consulta pelo
+    # resultado pode cair num worker que não criou o processo: só os filhos deste worker são
+    # encerrados (os demais ficam com o seu), e um processo que já terminou é ignorado
+    def terminate_job(self, job):
+        import psutil
+
+        if job is None:
+            return
+        try:
+            if psutil.Process(int(job)).ppid() != os.getpid():
+                return
+            super().terminate_job(job)
+        except psutil.NoSuchProcess:
+            pass
+
+    # Função para saber se o processo de um callback ainda roda (o de outro worker também conta)
+    def job_running(self, job):
+        import psutil
+
+        try:
+            return super().job_running(job)
+        except psutil.NoSuchProcess:
+            return False
+
+
+# Função para saber se o resultado de um callback pode ficar no cache
+def resultado_guardavel(resultado):
+    if isinstance(resultado, dict):
+        return "_dash_no_update" not in resultado and "background_callback_error" not in resultado
+    if isinstance(resultado, (list, tuple)) and resultado and isinstance(resultado[-1], dict):
+        rastro = resultado[-1]
+        return "cache" not in rastro or not usou_desatualizados(rastro)
+    return True
+
+
+# Callbacks longos rodam em segundo plano; seus resultados ficam num cache em disco de
+# tamanho limitado (descarta os menos usados). A chave muda a cada TTL_MES_ABERTO
+# segundos para que o mês ainda aberto seja recalculado periodicamente
+cache_callbacks = diskcache.Cache(
+    os.environ.get("DEALERNET_CACHE_DASH", os.path.join(DIRETORIO_CACHE, "dash")),
+    size_limit=64 * 1024 * 1024,
+    eviction_policy="least-recently-used",
+)
+gerenciador_callbacks = GerenciadorCallbacks(
+    cache_callbacks,
+    cache_by=[lambda: int(time.time() // TTL_MES_ABERTO)],
+    expire=TTL_MES_ABERTO,
+)
 
 # Configuração inicial do Dash
-app = dash.Dash(__name__)
+app = dash.Dash(__name__, background_callback_manager=gerenciador_callbacks)
 app.title = "Análise de Margens Contábeis"
+server = app.server  # aplicação WSGI usada por servir_dash.py
 
 app.layout = html.Div([
     html.H1("Análise de Margens Contábeis", style={"textAlign": "center"}),
+    html.P("Modo offline: dados do gateway simulado", style={"textAlign": "center"}) if MODO_OFFLINE else None,
 
     html.Div([
         html.Label("Tipo de Análise:"),
@@ -96,56 +127,197 @@ app.layout = html.Div([
         ),
 
         html.Button("Analisar", id="botao-analisar", n_clicks=0),
+        html.Progress(id="progresso", value="0", max="3"),
     ], style={"width": "50%", "margin": "auto"}),
 
-    dcc.Graph(id="grafico-resultados")
+    dcc.Graph(id="grafico-resultados", figure=figura_inicial()),
+
+    # Explorador do plano de contas: só as contas abertas (uma página de filhas por conta)
+    # são calculadas no servidor e enviadas ao navegador
+    html.Div([
+        html.H2("Explorador do plano de contas"),
+        html.Label("Filial:"),
+        dcc.Dropdown(
+            id="explorador-filial",
+            options=[{"label": nome, "value": codigo} for codigo, nome in enumerate(FILIAIS)],
+            value=1,
+        ),
+        html.Button("Explorar", id="botao-explorar", n_clicks=0),
+        dcc.Store(id="explorador-estado"),
+        html.Div(id="explorador"),
+    ], style={"width": "50%", "margin": "auto"}),
+
+    # Painel de diagnóstico: tempos de cada etapa do último clique
+    dcc.Store(id="rastro-analise"),
+    html.Details([
+        html.Summary("Diagnóstico"),
+        html.Div(id="diagnostico"),
+    ], style={"width": "50%", "margin": "auto"}),
 ])
 
+
+# Texto do Prometheus com os tempos das etapas somados neste processo
+@server.route("/metricas")
+def pagina_metricas():
+    return flask.Response(texto_prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+# Só consulta o gateway ao clicar em "Analisar"; os demais campos são lidos como State
 @app.callback(
-    Output("grafico-resultados", "figure"),
+    [Output("grafico-resultados", "figure"), Output("rastro-analise", "data")],
     Input("botao-analisar", "n_clicks"),
-    [Input("tipo-analise", "value"), Input("mes", "value"), Input("ano", "value")],
+    [State("tipo-analise", "value"), State("mes", "value"), State("ano", "value")],
+    background=True,
+    running=[(Output("botao-analisar", "disabled"), True, False)],
+    progress=[Output("progresso", "value"), Output("progresso", "max")],
+    cache_args_to_ignore=[0],  # n_clicks não faz parte da chave do cache
+    prevent_initial_call=True,
+)
+def atualizar_grafico(set_progress, n_clicks, tipo, mes, ano):
+    # o callback roda em outro processo: o rastro volta junto com o gráfico
+    with rastrear("analisar", app="dash", tipo=tipo, mes=mes, ano=ano) as rastro:
+        fig = montar_grafico(set_progress, tipo, mes, ano)
+    return fig, rastro
+
+
+# Função para buscar o razão e calcular a análise; devolve só as mudanças do gráfico já
+# desenhado (dados dos traços, título e eixo x), aplicadas no navegador
+def montar_grafico(set_progress, tipo, mes, ano):
+    set_progress(("0", "3"))
+    grafico = Patch()
+    razao = realizar_requisicao_soap(mes, ano)
+    if razao is None:
+        # sem razão (nem guardado): nada muda no gráfico e nada fica no cache dos callbacks
+        raise dash.exceptions.PreventUpdate
+    set_progress(("1", "3"))
+
+    _, nomes, resultados, margens = numeros_analise(tipo, mes, ano, [razao], [1])
+    set_progress(("2", "3"))
+
+    with medir("grafico"):
+        for traco, valores in enumerate((resultados, margens)):
+            grafico["data"][traco]["x"] = nomes
+            grafico["data"][traco]["y"] = valores
+        titulo = f"{tipo} - {mes:02d}/{ano}"
+        gravado_em = desatualizado_desde(razao)
+        if gravado_em is not None:
+            # gateway fora do ar: o razão veio do cache, já vencido
+            titulo += f" (dados de {time.strftime('%d/%m %H:%M', time.localtime(gravado_em))}, gateway indisponível)"
+        grafico["layout"]["title"]["text"] = titulo
+        grafico["layout"]["xaxis"]["title"]["text"] = "Subsetores" if tipo == "Análise Subsetorial" else "Setores"
+
+    return grafico
+
+
+# Estado do explorador (filial, mês e contas abertas com a página de cada uma): "Explorar"
+# recomeça do primeiro nível; clicar numa conta a abre ou fecha (com as abertas abaixo dela)
+@app.callback(
+    Output("explorador-estado", "data"),
+    [
+        Input("botao-explorar", "n_clicks"),
+        Input({"tipo": "explorador-conta", "conta": ALL}, "n_clicks"),
+        Input({"tipo": "explorador-pagina", "conta": ALL, "pagina": ALL}, "n_clicks"),
+    ],
+    [
+        State("explorador-filial", "value"),
+        State("mes", "value"),
+        State("ano", "value"),
+        State("explorador-estado", "data"),
+    ],
+    prevent_initial_call=True,
 )
-def atualizar_grafico(n_clicks, tipo, mes, ano):
-    cdata_root = realizar_requisicao_soap(mes, ano)
-    if cdata_root is None:
-        return go.Figure()
-
-    if tipo == "Análise Subsetorial":
-        contas = [
-            {"nome": "VN Passageiros", "receita": "3.1.1.001.000001", "custo": "3.3.1.001.000001"},
-            {"nome": "VN Comerciais Leves", "receita": "3.1.1.001.000002", "custo": "3.3.1.001.000002"},
-            {"nome": "Seminovos", "receita": "3.1.1.002.000001", "custo": "3.3.1.002.000001"},
-            {"nome": "Peças Atacado", "receita": "3.1.1.003.000001", "custo": "3.3.1.003.000001"},
-            {"nome": "Peças Varejo", "receita": "3.1.1.003.000002", "custo": "3.3.1.003.000002"},
-            {"nome": "Peças Mecânica", "receita": "3.1.1.003.000003", "custo": "3.3.1.003.000003"},
-            {"nome": "Peças Funilaria e Pintura", "receita": "3.1.1.003.000004", "custo": "3.3.1.003.000004"},
-            {"nome": "Peças Garantia", "receita": "3.1.1.003.000005", "custo": "3.3.1.003.000005"},
-            {"nome": "Peças Interna", "receita": "3.1.1.003.000006", "custo": "3.3.1.003.000006"},
-            {"nome": "Acessórios", "receita": "3.1.1.003.000007", "custo": "3.3.1.003.000007"},
-            {"nome": "Combustíveis e Lubrificantes", "receita": "3.1.1.003.000008", "custo": "3.3.1.003.000008"},
-            {"nome": "Pneus e Câmaras", "receita": "3.1.1.003.000009", "custo": "3.3.1.003.000009"},
-        ]
+def navegar_explorador(n_clicks, cliques_contas, cliques_paginas, filial, mes, ano, estado):
+    acionado = dash.ctx.triggered_id
+    if acionado == "botao-explorar" or estado is None:
+        return {"filial": filial, "mes": mes, "ano": ano, "abertos": {"": 0}}
+    if not dash.ctx.triggered[0]["value"]:
+        raise dash.exceptions.PreventUpdate  # botões recém-desenhados, sem clique
+    abertos = dict(estado["abertos"])
+    conta = acionado["conta"]
+    if acionado["tipo"] == "explorador-pagina":
+        abertos[conta] = acionado["pagina"]
+    elif conta in abertos:
+        abertos = {aberta: pagina for aberta, pagina in abertos.items() if not (aberta + ".").startswith(conta + ".")}
     else:
-        contas = [
-            {"nome": "Vendas", "receita": "3.1.1.001.000001", "custo": "3.3.1.001.000001"},
-            {"nome": "Pós-Vendas", "receita": "3.1.1.002.000001", "custo": "3.3.1.002.000001"},
-        ]
+        abertos[conta] = 0
+    return {**estado, "abertos": abertos}
 
-    nomes, resultados, margens = calcular_resultados_margens(contas, cdata_root)
 
-    fig = go.Figure()
-    fig.add_trace(go.Bar(x=nomes, y=resultados, name="Resultado (mil R$)", marker_color="DodgerBlue"))
-    fig.add_trace(go.Scatter(x=nomes, y=margens, name="Margem Bruta (%)", mode="lines+markers", marker_color="OrangeRed"))
+# Função para formatar um valor da tabela do explorador (vazio quando não se aplica)
+def formatar_valor(valor, sufixo=""):
+    return "" if valor is None else f"{valor:,.1f}{sufixo}"
 
-    fig.update_layout(
-        title=f"{tipo} - {mes:02d}/{ano}",
-        xaxis_title="Subsetores" if tipo == "Análise Subsetorial" else "Setores",
-        yaxis_title="Valores",
-        legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-    )
 
-    return fig
+# Desenha a parte visível da árvore: uma linha por conta e uma linha de paginação abaixo
+# das contas abertas com muitas filhas
+@app.callback(Output("explorador", "children"), Input("explorador-estado", "data"), prevent_initial_call=True)
+def mostrar_explorador(estado):
+    codigos = codigos_filiais(estado["filial"], len(FILIAIS) - 1)
+    razoes = consultar_razoes([(estado["mes"], estado["ano"], codigo) for codigo in codigos])
+    if any(razao is None for razao in razoes):
+        return html.P("Erro na requisição ou processamento de dados.")
+    botao = {"border": "none", "background": "none", "cursor": "pointer", "padding": 0}
+    linhas = []
+    for item in subarvore_visivel(razoes, estado["abertos"]):
+        recuo = {"paddingLeft": f"{item['profundidade'] * 1.5}em"}
+        if item["tipo"] == "paginacao":
+            pagina, paginas = item["pagina"], item["paginas"]
+            linhas.append(html.Tr(html.Td([
+                html.Button("‹", id={"tipo": "explorador-pagina", "conta": item["conta"], "pagina": pagina - 1},
+                            disabled=pagina == 0),
+                html.Span(f" página {pagina + 1} de {paginas} ({item['total']} contas) "),
+                html.Button("›", id={"tipo": "explorador-pagina", "conta": item["conta"], "pagina": pagina + 1},
+                            disabled=pagina == paginas - 1),
+            ], colSpan=5, style=recuo)))
+            continue
+        if item["tem_filhos"]:
+            conta = html.Button(
+                ("▾ " if item["aberta"] else "▸ ") + item["conta"],
+                id={"tipo": "explorador-conta", "conta": item["conta"]},
+                style=botao,
+            )
+        else:
+            conta = html.Span(item["conta"])
+        linhas.append(html.Tr([
+            html.Td(conta, style=recuo),
+            html.Td(item["descricao"]),
+            html.Td(formatar_valor(item["variacao"])),
+            html.Td(formatar_valor(item["resultado"])),
+            html.Td(formatar_valor(item["margem"], "%")),
+        ]))
+    cabecalho = html.Tr([
+        html.Th("Conta"), html.Th("Descrição"), html.Th("Variação (mil R$)"), html.Th("Resultado (mil R$)"),
+        html.Th("Margem Bruta"),
+    ])
+    return html.Table([cabecalho] + linhas)
+
+
+# Mostra o rastro do último clique e o soma às métricas deste processo
+@app.callback(Output("diagnostico", "children"), Input("rastro-analise", "data"), prevent_initial_call=True)
+def mostrar_diagnostico(rastro):
+    if not rastro:
+        return None
+    registrar_rastro(rastro)
+    linhas = [
+        html.Tr([
+            html.Td(medida["etapa"]),
+            html.Td(f"{medida['duracao_ms']:.1f} ms"),
+            html.Td(f"{medida['bytes'] / 1024:.0f} KiB" if medida.get("bytes") else ""),
+        ])
+        for medida in rastro["etapas"]
+    ]
+    cache = ", ".join(f"{evento['camada']}: {evento['resultado']}" for evento in rastro["cache"])
+    gateway = situacao_gateway()  # limitador deste processo; o disjuntor vale para todos
+    return [
+        html.P(f"Total: {rastro['duracao_ms']:.0f} ms"),
+        html.Table([html.Tr([html.Th("Etapa"), html.Th("Duração"), html.Th("Tamanho")])] + linhas),
+        html.P(f"Cache: {cache}" if cache else "Cache: sem consultas"),
+        *[html.P(f"{chave}: {', '.join(valor)}") for chave, valor in rastro.get("anotacoes", {}).items()],
+        html.P(
+            f"Gateway: limite {gateway['limite']} de {gateway['maximo']}, {gateway['em_uso']} em uso, "
+            f"disjuntor {gateway['disjuntor']}"
+        ),
+    ]
 
 if __name__ == "__main__":
-    app.run_server(debug=True)
+    app.run(debug=True)
@@ -1,261 +1,228 @@
+import contextvars
+import functools
+import os
+import time
 import streamlit as st
-import requests
-import xml.etree.ElementTree as ET
-import numpy as np
-import plotly.graph_objects as go
-
-
-# Função para calcular o último dia do mês
-def ultimo_dia_mes(mes, ano):
-    if mes in {1, 3, 5, 7, 8, 10, 12}:
-        return 31
-    elif mes in {4, 6, 9, 11}:
-        return 30
+from aquecimento import iniciar_aquecimento
+from atualizacao import INTERVALO_ATUALIZACAO, atualizar_analise
+from nucleo import (
+    FILIAIS,
+    TIPOS_ANALISE,
+    calcular_analise,
+    codigos_filiais,
+    consultar_razoes,
+    consultar_serie,
+    criar_grafico,
+    criar_grafico_anual,
+    desatualizado_desde,
+    explorar_conta,
+    numeros_analise,
+    situacao_gateway,
+)
+from cache_razao import MODO_OFFLINE, TTL_MES_ABERTO, mes_fechado
+from memo_lru import memoizar
+from metricas import medido, medir, rastrear, resumo_etapas, servir_metricas, usou_desatualizados
+
+
+# Validade (em segundos) das análises memoizadas de meses fechados: longa, mas o memo não
+# segura para sempre um razão corrigido depois do fechamento
+VALIDADE_MES_FECHADO = int(os.environ.get("DEALERNET_VALIDADE_MES_FECHADO", 24 * 3600))
+
+_avisos = contextvars.ContextVar("avisos_analise", default=None)
+
+
+# Função para mostrar um aviso ("warning" ou "error"); dentro de uma análise memoizada ele é
+# anotado e guardado junto com o resultado, para ser mostrado de novo a cada acerto do memo
+def avisar(nivel, texto):
+    anotados = _avisos.get()
+    if anotados is None:
+        getattr(st, nivel)(texto)
     else:
-        return 29 if (ano % 4 == 0 and (ano % 100 != 0 or ano % 400 == 0)) else 28
-
-# Função para fazer requisição SOAP e obter dados XML
-def realizar_requisicao_soap(mes, ano, filial):
-    ultimo_dia = ultimo_dia_mes(mes, ano)
-    url = "https://gaivota.dealernetworkflow.com.br/aws_dealernetgateway.aspx"
-    headers = {"Content-Type": "text/xml; charset=utf-8"}
-    soap_body = f"""
-    <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:deal="DealerNet">
-    <soapenv:Header/>
-    <soapenv:Body>
-        <deal:WS_DealernetGateway.CONSULTASALDOCONTABIL>
-            <deal:Usuario_identificador>portus</deal:Usuario_identificador>
-            <deal:Usuariosenha_senha>Portus25@</deal:Usuariosenha_senha>
-            <deal:Empresa_codigo>{filial}</deal:Empresa_codigo>
-            <deal:Dtini>{ano}-{mes:02d}-01</deal:Dtini>
-            <deal:Dtfin>{ano}-{mes:02d}-{ultimo_dia}</deal:Dtfin>
-        </deal:WS_DealernetGateway.CONSULTASALDOCONTABIL>
-    </soapenv:Body>
-    </soapenv:Envelope>
-    """
-    response = requests.post(url, data=soap_body, headers=headers)
-    if response.status_code == 200:
-        root = ET.fromstring(response.content)
-        namespaces = {"soapenv": "http://schemas.xmlsoap.org/soap/envelope/", "deal": "DealerNet"}
-        body = root.find("soapenv:Body", namespaces)
-        response = body.find("deal:WS_DealernetGateway.CONSULTASALDOCONTABILResponse", namespaces)
-        xml_retorno = response.find("deal:Xml_retorno", namespaces)
-        if xml_retorno is not None and xml_retorno.text:
-            return ET.fromstring(xml_retorno.text.strip())
-    st.error("Erro na requisição ou processamento de dados.")
-    return None
-
-# Função para calcular resultados e margens
-def calcular_resultados_margens(contas, cdata_root):
-    resultados, margens, nomes = [], [], []
-    for conta in contas:
-        valor_receita = obter_valor_conta(cdata_root, conta["receita"])
-        valor_custo = obter_valor_conta(cdata_root, conta["custo"])
-        if valor_receita is not None and valor_custo is not None:
-            resultado = -valor_receita - valor_custo
-            margem = -resultado / valor_receita * 100 if valor_receita != 0 else 0
-            nomes.append(conta["nome"])
-            resultados.append(resultado / 1000)  # Em milhares de reais
-            margens.append(margem)
-    return nomes, resultados, margens
-
-# Função para criar gráficos com Plotly
-def criar_grafico(nomes, resultados, margens, titulo):
-    fig = go.Figure()
-
-    # Adicionar barras de resultados
-    fig.add_trace(
-        go.Bar(
-            x=nomes,
-            y=resultados,
-            name="Resultado (mil R$)",
-            marker_color="DodgerBlue",
-            hovertemplate="<b>%{x}</b><br>Resultado: %{y:.2f} mil R$<extra></extra>"
+        anotados.append((nivel, texto))
+
+
+# Decorador para memoizar uma análise (ver memoizar) junto com os avisos emitidos ao calculá-la
+def memoizar_com_avisos(max_itens, validade):
+    def decorador(funcao):
+        @memoizar(max_itens, validade=validade)
+        @functools.wraps(funcao)
+        def calcular(*args, **kwargs):
+            token = _avisos.set([])
+            try:
+                valor = funcao(*args, **kwargs)
+                avisos = _avisos.get()
+            finally:
+                _avisos.reset(token)
+            if valor is None:
+                # erros não ficam no memo: os avisos saem só desta vez
+                for aviso in avisos:
+                    avisar(*aviso)
+                return None
+            return valor, avisos
+
+        @functools.wraps(funcao)
+        def memoizada(*args, **kwargs):
+            guardado = calcular(*args, **kwargs)
+            if guardado is None:
+                return None
+            valor, avisos = guardado
+            for aviso in avisos:
+                avisar(*aviso)
+            return valor
+
+        memoizada.estatisticas = calcular.estatisticas
+        return memoizada
+
+    return decorador
+
+
+# Função para fazer as requisições SOAP em paralelo (pedidos de (mes, ano, filial), via cache local)
+@medido("requisicao_soap")
+def realizar_requisicoes_soap(pedidos):
+    razoes = consultar_razoes(pedidos)
+    if any(razao is None for razao in razoes):
+        avisar("error", "Erro na requisição ou processamento de dados.")
+        return None
+    gravados = [desatualizado_desde(razao) for razao in razoes if desatualizado_desde(razao) is not None]
+    if gravados:
+        avisar(
+            "warning",
+            "Gateway DealerNet indisponível: exibindo os dados guardados em "
+            f"{time.strftime('%d/%m/%Y %H:%M', time.localtime(min(gravados)))} (desatualizados).",
         )
-    )
+    return razoes
+
 
-    # Adicionar linha de margens
-    fig.add_trace(
-        go.Scatter(
-            x=nomes,
-            y=margens,
-#            yaxis="y2",
-            name="Margem Bruta (%)",
-            mode="lines+markers",
-            line=dict(color="OrangeRed"),
-            marker=dict(size=8),
-            hovertemplate="<b>%{x}</b><br>Margem: %{y:.2f}%<extra></extra>"
+# Função para avisar que a análise usou razões guardados porque o gateway não respondeu (ou
+# que o gateway está fora, com o disjuntor aberto)
+def avisar_gateway(rastro):
+    if usou_desatualizados(rastro) or situacao_gateway()["disjuntor"] != "fechado":
+        st.warning(
+            "Gateway DealerNet instável: os dados exibidos podem vir do cache e estar desatualizados. "
+            "Novas consultas voltam a ser feitas assim que ele responder."
         )
-    )
 
-    # Ajustar layout
-    fig.update_layout(
-        title=titulo,
-        yaxis_title="Resultado (mil R$)",
-        yaxis=dict(title="Resultado (mil R$)", side="left"),
-        yaxis2=dict(
-            title="Margem Bruta (%)",
-            overlaying="y",
-            side="right"
-        ),
-        legend=dict(x=0.6, y=1.1),
-        barmode="group",
-        template="plotly_dark"
-    )
 
-    return fig
+# Validade dos números e gráficos memoizados: o mês ainda aberto é renovado a cada
+# intervalo de atualização (de forma incremental, ver analise_margens)
+def validade_analise(tipo, mes, ano, filial, num_filiais):
+    return VALIDADE_MES_FECHADO if mes_fechado(mes, ano) else INTERVALO_ATUALIZACAO
 
 
-# Função para extrair valores das contas
-def obter_valor_conta(cdata_root, conta_id):
-    for item in cdata_root.findall(".//SDT_SaldoContabilItem"):
-        if item.find("ContaIDNivel").text == conta_id:
-            saldo_inicial = item.find("SaldoInicial").text
-            saldo_final = item.find("SaldoFinal").text
-            return np.round(float(saldo_final) - float(saldo_inicial), 2)
-    return None
+# Função para calcular os números da análise (título, nomes, resultados e margens),
+# memoizados por parâmetros e compartilhados entre as sessões
+@memoizar_com_avisos(max_itens=256, validade=validade_analise)
+def numeros_margens(tipo, mes, ano, filial, num_filiais):
+    codigos = codigos_filiais(filial, num_filiais)
+    razoes = realizar_requisicoes_soap([(mes, ano, codigo) for codigo in codigos])
+    if razoes is None:
+        return
+    return numeros_analise(tipo, mes, ano, razoes, codigos)
 
-# Função principal de análise
-def analise_margens(tipo, mes, ano, filial, num_filiais):
-    
-    contas = [
-        {"nome": "VN Passageiros", "receita": "3.1.1.001.000001", "custo": "3.3.1.001.000001"},
-        {"nome": "VN Comerciais Leves", "receita": "3.1.1.001.000002", "custo": "3.3.1.001.000002"},
-        {"nome": "Seminovos", "receita": "3.1.1.002.000001", "custo": "3.3.1.002.000001"},
-        {"nome": "Peças Atacado", "receita": "3.1.1.003.000001", "custo": "3.3.1.003.000001"},
-        {"nome": "Peças Varejo", "receita": "3.1.1.003.000002", "custo": "3.3.1.003.000002"},
-        {"nome": "Peças Mecânica", "receita": "3.1.1.003.000003", "custo": "3.3.1.003.000003"},
-        {"nome": "Peças Funilaria e Pintura", "receita": "3.1.1.003.000004", "custo": "3.3.1.003.000004"},
-        {"nome": "Peças Garantia", "receita": "3.1.1.003.000005", "custo": "3.3.1.003.000005"},
-        {"nome": "Peças Interna", "receita": "3.1.1.003.000006", "custo": "3.3.1.003.000006"},
-        {"nome": "Acessórios", "receita": "3.1.1.003.000007", "custo": "3.3.1.003.000007"},
-        {"nome": "Combustíveis e Lubrificantes", "receita": "3.1.1.003.000008", "custo": "3.3.1.003.000008"},
-        {"nome": "Pneus e Câmaras", "receita": "3.1.1.003.000009", "custo": "3.3.1.003.000009"},
-    ]
-
-    iterations = num_filiais if filial == 0 else 1
-
-    if tipo == "Análise Subsetorial":
-        titulo = f"Resultados e Margens Brutas por Subsetor - {mes:02d}/{ano}"
-        for i in range(iterations):
-            cdata_root = realizar_requisicao_soap(mes, ano, i+1)
-            if cdata_root is None:
-                return
-            if i == 0:
-                nomes, resultados, margens = calcular_resultados_margens(contas, cdata_root)
-            else:
-                _, res, mgs = calcular_resultados_margens(contas, cdata_root)
-                resultados = [a + b for a, b in zip(resultados, res)]
-                margens = [a + b for a, b in zip(margens, mgs)]
-        
-    else:
-        for i in range(iterations):
-            cdata_root = realizar_requisicao_soap(mes, ano, i+1)
-            if cdata_root is None:
-                return
-            # Consolidar os subsetores para os setores "Vendas" e "Pós-Vendas"
-            vendas_receita = sum(obter_valor_conta(cdata_root, conta["receita"]) for conta in contas[:3])
-            vendas_custo = sum(obter_valor_conta(cdata_root, conta["custo"]) for conta in contas[:3])
-            # gambiarra pois Ourinhos não tem "Peças Atacado"
-            if filial == 3 or iterations == 3:
-                pos_vendas_receita = sum(obter_valor_conta(cdata_root, conta["receita"]) for conta in contas[4:])
-                pos_vendas_custo = sum(obter_valor_conta(cdata_root, conta["custo"]) for conta in contas[4:])
-            else:
-                pos_vendas_receita = sum(obter_valor_conta(cdata_root, conta["receita"]) for conta in contas[3:])
-                pos_vendas_custo = sum(obter_valor_conta(cdata_root, conta["custo"]) for conta in contas[3:])
-            res = [(-vendas_receita - vendas_custo)/1000, (-pos_vendas_receita - pos_vendas_custo)/1000] # em milhares de reais
-            mgs = [(vendas_receita + vendas_custo)/vendas_receita * 100 if vendas_receita != 0 else 0,
-                    (pos_vendas_receita + pos_vendas_custo)/pos_vendas_receita * 100 if pos_vendas_receita != 0 else 0]
-            resultados = [a + b for a, b in zip(resultados, res)] if i > 0 else res
-            margens = [a + b for a, b in zip(margens, mgs)] if i > 0 else mgs
-        titulo = f"Resultados e Margens Brutas por Setor"
-        nomes = ["Vendas", "Pós-Vendas"]
-        
 
+# Função principal de análise (o gráfico pronto também fica memoizado; quem o recebe
+# apenas o exibe, sem alterá-lo)
+@memoizar_com_avisos(max_itens=64, validade=validade_analise)
+def analise_margens(tipo, mes, ano, filial, num_filiais):
+    # mês em aberto: só as contas alteradas desde a última renovação são refeitas, e o
+    # gráfico só é redesenhado se os números mudaram
+    if not mes_fechado(mes, ano):
+        atualizada = atualizar_analise(tipo, mes, ano, filial, num_filiais)
+        if atualizada is None:
+            avisar("error", "Erro na requisição ou processamento de dados.")
+            return
+        return atualizada[1]
+    numeros = numeros_margens(tipo, mes, ano, filial, num_filiais)
+    if numeros is None:
+        return
+    titulo, nomes, resultados, margens = numeros
     grafico = criar_grafico(nomes, resultados, margens, titulo)
     return grafico
 
+@memoizar_com_avisos(
+    max_itens=16, validade=lambda ano, filial: VALIDADE_MES_FECHADO if mes_fechado(12, ano) else TTL_MES_ABERTO
+)
 def analise_margens_ano(ano, filial):
-    margens_ano = []
-    resultados_ano = []
-    for i in range(7,13): #começando a partir de julho, troca de sistema
-        cdata_root = realizar_requisicao_soap(i, ano, filial)
-        if cdata_root is None:
-            return
+    # começando a partir de julho, troca de sistema; só os meses fora do cache vão ao gateway
+    serie = consultar_serie(filial, (ano, 7), (ano, 12))
+    if serie is None:
+        avisar("error", "Erro na requisição ou processamento de dados.")
+        return
+    razoes = [razao for _, razao in serie]
 
-        contas = [
-            {"nome": "VN Passageiros", "receita": "3.1.1.001.000001", "custo": "3.3.1.001.000001"},
-            {"nome": "VN Comerciais Leves", "receita": "3.1.1.001.000002", "custo": "3.3.1.001.000002"},
-            {"nome": "Seminovos", "receita": "3.1.1.002.000001", "custo": "3.3.1.002.000001"},
-            {"nome": "Peças Atacado", "receita": "3.1.1.003.000001", "custo": "3.3.1.003.000001"},
-            {"nome": "Peças Varejo", "receita": "3.1.1.003.000002", "custo": "3.3.1.003.000002"},
-            {"nome": "Peças Mecânica", "receita": "3.1.1.003.000003", "custo": "3.3.1.003.000003"},
-            {"nome": "Peças Funilaria e Pintura", "receita": "3.1.1.003.000004", "custo": "3.3.1.003.000004"},
-            {"nome": "Peças Garantia", "receita": "3.1.1.003.000005", "custo": "3.3.1.003.000005"},
-            {"nome": "Peças Interna", "receita": "3.1.1.003.000006", "custo": "3.3.1.003.000006"},
-            {"nome": "Acessórios", "receita": "3.1.1.003.000007", "custo": "3.3.1.003.000007"},
-            {"nome": "Combustíveis e Lubrificantes", "receita": "3.1.1.003.000008", "custo": "3.3.1.003.000008"},
-            {"nome": "Pneus e Câmaras", "receita": "3.1.1.003.000009", "custo": "3.3.1.003.000009"},
-        ]
-
-        # Consolidar os subsetores para os setores "Vendas" e "Pós-Vendas"
-        vendas_receita = sum(
-            obter_valor_conta(cdata_root, conta["receita"]) for conta in contas[:3]
-        )
-        vendas_custo = sum(
-            obter_valor_conta(cdata_root, conta["custo"]) for conta in contas[:3]
-        )
+    # Uma única filial com os seis meses: setores × meses calculados de uma vez
+    setoriais = calcular_analise([razoes], [filial])["setores"]
+    titulo = f"Resultados e Margens Brutas por Setor"
+    meses = ["Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
+    resultados_ano = setoriais["resultado"][0].tolist()
+    margens_ano = setoriais["margem"][0].tolist()
 
-        pos_vendas_receita = sum(
-            obter_valor_conta(cdata_root, conta["receita"]) for conta in contas[3:]
-        )
-        pos_vendas_custo = sum(
-            obter_valor_conta(cdata_root, conta["custo"]) for conta in contas[3:]
-        )
-        titulo = f"Resultados e Margens Brutas por Setor"
-        meses = ["Julho", "Agosto", "Setembro", "Outubro", "Novembro", "Dezembro"]
-        resultados_ano.append([(-vendas_receita - vendas_custo)/1000, (-pos_vendas_receita - pos_vendas_custo)/1000]) # em milhares de reais
-        margens_ano.append([(vendas_receita + vendas_custo)/vendas_receita * 100 if vendas_receita != 0 else 0,
-                (pos_vendas_receita + pos_vendas_custo)/pos_vendas_receita * 100 if pos_vendas_receita != 0 else 0])
-        
-        grafico = criar_grafico_anual(meses, resultados_ano, margens_ano, titulo)
+    grafico = criar_grafico_anual(meses, resultados_ano, margens_ano, titulo)
     return grafico
-    
-def criar_grafico_anual(meses, resultados, margens, titulo):
-    fig = go.Figure()
-
-    # Adicionar barras de resultados
-    fig.add_trace(
-        go.Bar(
-            x=meses,
-            y=[resultado[0] for resultado in resultados],
-            name="Vendas - Resultado",
-            marker_color="DarkSlateBlue",
-            hovertemplate="<b>%{x}</b><br>Resultado: %{y:.2f} mil R$<extra></extra>"
-        )
-    )
 
-    fig.add_trace(
-        go.Bar(
-            x=meses,
-            y=[resultado[1] for resultado in resultados],
-            name="Pós-Vendas - Resultado",
-            marker_color="RoyalBlue",
-            hovertemplate="<b>%{x}</b><br>Resultado: %{y:.2f} mil R$<extra></extra>"
-        )
-    )
-    
-    # Ajustar layout
-    fig.update_layout(
-        barmode='group',  # Define agrupamento das barras
-        title=titulo,
-        xaxis_title="Meses",
-        yaxis_title="Valores",
-        legend_title="Indicadores",
-        xaxis=dict(tickmode='linear')  # Garante que todos os meses sejam exibidos
-    )
 
-    return fig
+# Função para deixar prontos os gráficos dos meses aquecidos (cada filial e o consolidado)
+def pre_calcular_graficos(meses, num_filiais=3):
+    for mes, ano in meses:
+        for filial in range(num_filiais + 1):
+            for tipo in TIPOS_ANALISE:
+                analise_margens(tipo, mes, ano, filial, num_filiais)
+
+
+# Função para mostrar o explorador do plano de contas: a conta aberta e a página ficam na
+# sessão, e só as contas filhas da página visível são calculadas e enviadas
+def mostrar_explorador(mes, ano, filial, num_filiais):
+    codigos = codigos_filiais(filial, num_filiais)
+    razoes = realizar_requisicoes_soap([(mes, ano, codigo) for codigo in codigos])
+    if razoes is None:
+        return
+    estado = st.session_state.setdefault("explorador", {"conta": "", "pagina": 0})
+    visao = explorar_conta(razoes, estado["conta"], estado["pagina"])
+
+    # caminho até a conta aberta: cada ancestral volta para ele
+    caminho = [("", "Plano de contas")] + visao["caminho"]
+    for coluna, (conta, descricao) in zip(st.columns(len(caminho)), caminho):
+        if coluna.button(conta or descricao, key=f"explorador-caminho-{conta}", help=descricao):
+            estado.update(conta=conta, pagina=0)
+            st.rerun()
+
+    st.dataframe(
+        [
+            {
+                "Conta": linha["conta"],
+                "Descrição": linha["descricao"],
+                "Variação (mil R$)": linha["variacao"],
+                "Resultado (mil R$)": linha["resultado"],
+                "Margem Bruta (%)": linha["margem"],
+                "Subcontas": "sim" if linha["tem_filhos"] else "",
+            }
+            for linha in visao["linhas"]
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+    abriveis = {linha["conta"]: linha["descricao"] for linha in visao["linhas"] if linha["tem_filhos"]}
+    if abriveis:
+        abrir = st.selectbox(
+            "Abrir conta",
+            [""] + list(abriveis),
+            format_func=lambda conta: f"{conta} - {abriveis[conta]}" if conta else "",
+            key=f"explorador-abrir-{estado['conta']}",
+        )
+        if abrir:
+            estado.update(conta=abrir, pagina=0)
+            st.rerun()
+    if visao["paginas"] > 1:
+        pagina = st.number_input(
+            f"Página (de {visao['paginas']}, {visao['total']} contas)",
+            min_value=1,
+            max_value=visao["paginas"],
+            value=visao["pagina"] + 1,
+            key=f"explorador-pagina-{estado['conta']}",
+        )
+        if pagina - 1 != estado["pagina"]:
+            estado["pagina"] = pagina - 1
+            st.rerun()
 
 
 # Configuração inicial do Streamlit
@@ -267,9 +234,14 @@ col_param, col_space, col_graficos = st.columns([0.6, 0.2, 3])  # Aumente ou dim
 # Coluna de parâmetros (lado esquerdo)
 with col_param:
     st.markdown("### Selecione os parâmetros de análise")
+    if MODO_OFFLINE:
+        st.caption("Modo offline: dados do gateway simulado")
     ano = st.number_input("Ano", min_value=2000, max_value=2100, value=2024, step=1)
     mes = st.number_input("Mês", min_value=1, max_value=12, value=11, step=1)
-    filiais = ["Grupo Consolidado", "Araras", "Assis", "Ourinhos"]
+    filiais = FILIAIS
+    # Aquecimento opcional dos meses recentes em segundo plano (uma vez por processo)
+    if os.environ.get("DEALERNET_AQUECIMENTO") == "1":
+        iniciar_aquecimento(range(1, len(filiais)), pre_calcular=pre_calcular_graficos)
     # Caixa de seleção com várias possibilidades
     filial = st.selectbox(
         "Filial",
@@ -281,13 +253,54 @@ with col_param:
     col_graficos_dir.subheader("Análise Subsetorial")
 
     if st.button("Analisar"):
-        indice_filial = filiais.index(filial)
-        grafico_setorial = analise_margens(tipo="Análise Setorial", mes=mes, ano=ano, filial=indice_filial, num_filiais=len(filiais)-1)
-        grafico_subsetorial = analise_margens(tipo="Análise Subsetorial", mes=mes, ano=ano, filial=indice_filial, num_filiais=len(filiais)-1)
-        #grafico_anual = analise_margens_ano(ano=ano, filial=indice_filial)
-        col_graficos_esq.plotly_chart(grafico_setorial, use_container_width=True)
-        col_graficos_dir.plotly_chart(grafico_subsetorial, use_container_width=True)
-        #col_graficos.plotly_chart(grafico_anual, use_container_width=True)
+        # tempos de cada etapa deste clique, guardados na sessão para o painel de diagnóstico
+        with rastrear("analisar", app="streamlit", mes=mes, ano=ano, filial=filial) as rastro:
+            indice_filial = filiais.index(filial)
+            grafico_setorial = analise_margens(tipo="Análise Setorial", mes=mes, ano=ano, filial=indice_filial, num_filiais=len(filiais)-1)
+            grafico_subsetorial = analise_margens(tipo="Análise Subsetorial", mes=mes, ano=ano, filial=indice_filial, num_filiais=len(filiais)-1)
+            #grafico_anual = analise_margens_ano(ano=ano, filial=indice_filial)
+            with medir("exibicao"):
+                col_graficos_esq.plotly_chart(grafico_setorial, use_container_width=True)
+                col_graficos_dir.plotly_chart(grafico_subsetorial, use_container_width=True)
+            #col_graficos.plotly_chart(grafico_anual, use_container_width=True)
+        st.session_state["rastro"] = rastro
+        with col_graficos:
+            avisar_gateway(rastro)
+
+    # O explorador só consulta e calcula enquanto estiver ligado
+    if st.toggle("Explorar plano de contas"):
+        with col_graficos:
+            st.subheader("Plano de contas")
+            mostrar_explorador(mes, ano, filiais.index(filial), len(filiais) - 1)
+
+    # Acertos e falhas dos memos de números e gráficos (compartilhados entre as sessões)
+    for nome, memo in (("Números", numeros_margens), ("Gráficos", analise_margens)):
+        contagem = memo.estatisticas()
+        st.caption(f"{nome}: {contagem['acertos']} acertos, {contagem['falhas']} falhas, {contagem['itens']} guardados")
+
+# Painel de diagnóstico: etapas do último clique desta sessão e médias do processo
+with st.expander("Diagnóstico", expanded=False):
+    rastro = st.session_state.get("rastro")
+    if rastro is None:
+        st.caption("Clique em Analisar para medir as etapas.")
+    else:
+        st.caption(f"Último clique: {rastro['duracao_ms']:.0f} ms")
+        st.dataframe(rastro["etapas"], use_container_width=True)
+        st.dataframe(rastro["cache"], use_container_width=True)
+        for chave, valor in rastro.get("anotacoes", {}).items():
+            st.caption(f"{chave}: {', '.join(valor)}")
+    st.dataframe(resumo_etapas(), use_container_width=True)
+    gateway = situacao_gateway()
+    st.caption(
+        f"Gateway: limite {gateway['limite']} de {gateway['maximo']} consultas simultâneas, "
+        f"{gateway['em_uso']} em uso, "
+        f"na fila: {gateway['na_fila']['interativa']} interativas e {gateway['na_fila']['lote']} de lote; "
+        f"disjuntor {gateway['disjuntor']}"
+    )
+
+# Texto do Prometheus numa porta própria (opcional, uma vez por processo)
+if os.environ.get("DEALERNET_METRICAS_PORTA"):
+    servir_metricas(int(os.environ["DEALERNET_METRICAS_PORTA"]))
 
 # Recuperar parâmetros selecionados
 #ano = st.session_state.get('ano', 2024)
@@ -0,0 +1,331 @@
+import contextvars
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from cache_razao import (
+    MODO_OFFLINE,
+    desatualizado_desde,
+    gravar_cache,
+    gravar_cache_intervalo,
+    ler_cache,
+    ler_cache_intervalo,
+    travar_intervalo,
+    travar_razao,
+)
+from metricas import medir, registrar_cache
+from protecao_gateway import LimitadorAdaptativo, estado_disjuntor, trabalho_gateway, vaga_gateway
+from razao import ler_resposta_soap
+
+URL_GATEWAY = os.environ.get("DEALERNET_URL", "https://gaivota.dealernetworkflow.com.br/aws_dealernetgateway.aspx")
+
+# Limite máximo de requisições simultâneas ao gateway (o limite efetivo se ajusta à latência
+# e às falhas observadas, ver protecao_gateway)
+MAX_REQUISICOES_SIMULTANEAS = int(os.environ.get("DEALERNET_MAX_REQUISICOES", 6))
+
+# Tempos limite (em segundos) para conectar e para esperar a resposta do gateway
+TIMEOUT_CONEXAO = float(os.environ.get("DEALERNET_TIMEOUT_CONEXAO", 5))
+TIMEOUT_LEITURA = float(os.environ.get("DEALERNET_TIMEOUT_LEITURA", 60))
+
+# Novas tentativas, com espera crescente, para falhas transitórias de rede ou do gateway
+MAX_TENTATIVAS = int(os.environ.get("DEALERNET_MAX_TENTATIVAS", 3))
+FATOR_ESPERA = 0.5
+STATUS_TRANSITORIOS = (429, 500, 502, 503, 504)
+
+# Compressão pedida ao gateway (gzip/deflate); se ele não comprimir, a resposta vem sem
+# compressão e é lida do mesmo jeito. DEALERNET_COMPRESSAO=0 pede a resposta sem compressão
+COMPRESSAO = os.environ.get("DEALERNET_COMPRESSAO", "1") == "1"
+
+# Tamanho dos blocos da resposta (já descomprimidos) entregues ao parser enquanto chegam
+TAMANHO_BLOCO = 16 * 1024
+
+# Por quanto tempo (em segundos) um razão recém-obtido é reaproveitado da memória
+VALIDADE_RECENTES = float(os.environ.get("DEALERNET_RECENTES_TTL", 60))
+
+# Consultas em andamento e resultados recentes, compartilhados por todas as sessões do processo
+_trava = threading.Lock()
+_em_andamento = {}
+_recentes = {}
+_sessao = None
+_gateway_offline = None
+_limitador = LimitadorAdaptativo(MAX_REQUISICOES_SIMULTANEAS)
+
+
+# Função para calcular o último dia do mês
+def ultimo_dia_mes(mes, ano):
+    if mes in {1, 3, 5, 7, 8, 10, 12}:
+        return 31
+    elif mes in {4, 6, 9, 11}:
+        return 30
+    else:
+        return 29 if (ano % 4 == 0 and (ano % 100 != 0 or ano % 400 == 0)) else 28
+
+
+# Função para obter a sessão HTTP compartilhada (conexões keep-alive reaproveitadas por todas as consultas);
+# requests e urllib3 só são carregados aqui, na primeira consulta que vai ao gateway
+def obter_sessao():
+    global _sessao
+    with _trava:
+        if _sessao is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            tentativas = Retry(
+                total=MAX_TENTATIVAS,
+                backoff_factor=FATOR_ESPERA,
+                status_forcelist=STATUS_TRANSITORIOS,
+                allowed_methods=frozenset({"POST"}),  # a consulta só lê saldos, repetir é seguro
+                raise_on_status=False,
+            )
+            adaptador = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=MAX_REQUISICOES_SIMULTANEAS,
+                max_retries=tentativas,
+            )
+            sessao = requests.Session()
+            sessao.mount("https://", adaptador)
+            sessao.mount("http://", adaptador)
+            _sessao = sessao
+        return _sessao
+
+
+# Função para obter o endereço do gateway (no modo offline, o gateway simulado é iniciado
+# dentro do processo na primeira consulta)
+def obter_url_gateway():
+    global _gateway_offline
+    if not MODO_OFFLINE:
+        return URL_GATEWAY
+    with _trava:
+        if _gateway_offline is None:
+            from servidor_simulado import iniciar_servidor_offline
+
+            _gateway_offline = iniciar_servidor_offline()
+        return _gateway_offline.url
+
+
+# Função para fazer requisição SOAP e obter o razão da filial no mês
+def requisitar_razao(mes, ano, filial):
+    return requisitar_intervalo((ano, mes), (ano, mes), filial)
+
+
+# Função para fazer requisição SOAP e obter o razão da filial num intervalo de meses
+# ((ano, mes) inicial e final, inclusivos): saldos no início e no fim do intervalo e
+# débitos e créditos somados no período
+def requisitar_intervalo(inicio, fim, filial):
+    ultimo_dia = ultimo_dia_mes(fim[1], fim[0])
+    headers = {
+        "Content-Type": "text/xml; charset=utf-8",
+        "Accept-Encoding": "gzip, deflate" if COMPRESSAO else "identity",
+    }
+    soap_body = f"""
+    <soapenv:Envelope xmlns:soapenv="http://schemas.xmlsoap.org/soap/envelope/" xmlns:deal="DealerNet">
+    <soapenv:Header/>
+    <soapenv:Body>
+        <deal:WS_DealernetGateway.CONSULTASALDOCONTABIL>
+            <deal:Usuario_identificador>portus</deal:Usuario_identificador>
+            <deal:Usuariosenha_senha>Portus25@</deal:Usuariosenha_senha>
+            <deal:Empresa_codigo>{filial}</deal:Empresa_codigo>
+            <deal:Dtini>{inicio[0]}-{inicio[1]:02d}-01</deal:Dtini>
+            <deal:Dtfin>{fim[0]}-{fim[1]:02d}-{ultimo_dia}</deal:Dtfin>
+        </deal:WS_DealernetGateway.CONSULTASALDOCONTABIL>
+    </soapenv:Body>
+    </soapenv:Envelope>
+    """
+    import requests
+
+    # "busca" vai até os cabeçalhos da resposta (sem a espera na fila do limitador); o corpo é
+    # lido em "leitura", já pelo parser, ainda ocupando a vaga no gateway
+    with vaga_gateway(_limitador, TIMEOUT_CONEXAO + TIMEOUT_LEITURA) as vaga:
+        enviado = time.perf_counter()
+        inicio_texto, fim_texto = f"{inicio[1]:02d}/{inicio[0]}", f"{fim[1]:02d}/{fim[0]}"
+        with medir("busca", filial=filial, inicio=inicio_texto, fim=fim_texto) as medida:
+            if vaga["recusada"]:
+                medida["erro"] = vaga["recusada"]
+                return None
+            try:
+                response = obter_sessao().post(
+                    obter_url_gateway(),
+                    data=soap_body,
+                    headers=headers,
+                    timeout=(TIMEOUT_CONEXAO, TIMEOUT_LEITURA),
+                    stream=True,
+                )
+            except requests.RequestException as erro:
+                medida["erro"] = type(erro).__name__
+                vaga["resultado"] = "falha"
+                return None
+            medida["status"] = response.status_code
+        vaga["latencia"] = time.perf_counter() - enviado
+        with response:
+            if response.status_code != 200:
+                # erros do próprio pedido (4xx) nada dizem sobre a carga do gateway
+                if response.status_code >= 500 or response.status_code in STATUS_TRANSITORIOS:
+                    vaga["resultado"] = "falha"
+                return None
+            # respondeu, mas só depois de novas tentativas: gateway no limite
+            tentativas = getattr(response.raw, "retries", None)
+            vaga["resultado"] = "sobrecarga" if tentativas is not None and tentativas.history else "ok"
+            razao = ler_resposta_em_fluxo(response, enviado)
+            if razao is None:
+                vaga["resultado"] = "falha"
+            return razao
+
+
+# Função para ler o corpo da resposta enquanto ele chega (descomprimido pelo requests) direto
+# no parser, sem guardar a resposta inteira. Registra os bytes lidos e os que passaram pela
+# rede (menos, com compressão) e o tempo até a primeira conta desde o envio do pedido
+def ler_resposta_em_fluxo(response, enviado):
+    import requests
+
+    codificacao = response.headers.get("Content-Encoding", "identity")
+    with medir("leitura", codificacao=codificacao) as medida:
+        lidos = [0]
+
+        def blocos():
+            for bloco in response.iter_content(TAMANHO_BLOCO):
+                lidos[0] += len(bloco)
+                yield bloco
+
+        def primeiro_registro():
+            medida["primeiro_registro_ms"] = round((time.perf_counter() - enviado) * 1e3, 3)
+
+        try:
+            razao = ler_resposta_soap(blocos(), primeiro_registro)
+        except requests.RequestException as erro:  # conexão interrompida no meio do corpo
+            medida["erro"] = type(erro).__name__
+            return None
+        except (ET.ParseError, xml.parsers.expat.ExpatError) as erro:  # corpo que não é XML ou cortado
+            medida["erro"] = type(erro).__name__
+            return None
+        finally:
+            medida["bytes"] = lidos[0]
+            medida["bytes_transferidos"] = response.raw.tell()
+        medida["contas"] = len(razao) if razao else 0
+    return razao
+
+
+# Função para obter o razão passando pelo cache local (meses fechados não voltam ao gateway;
+# com renovar=True a consulta vai ao gateway mesmo com o razão no cache)
+def _consultar_razao_cache(mes, ano, filial, renovar=False):
+    razao = None if renovar else ler_cache(filial, ano, mes)
+    registrar_cache("sqlite", razao is not None)
+    if razao is not None:
+        return razao
+    # outro processo (ex.: outro worker do Dash) pode estar buscando o mesmo razão;
+    # quem chega depois espera a trava e encontra o resultado no cache
+    with travar_razao(filial, ano, mes):
+        razao = None if renovar else ler_cache(filial, ano, mes)
+        if razao is not None:
+            return razao
+        razao = requisitar_razao(mes, ano, filial)
+        if razao is not None:
+            gravar_cache(filial, ano, mes, razao)
+        else:
+            # gateway fora do ar (ou disjuntor aberto): o último razão guardado, desatualizado
+            razao = ler_cache(filial, ano, mes, vencido=True)
+            registrar_cache("desatualizado", razao is not None)
+    return razao
+
+
+# Função para obter o razão de um intervalo passando pelo cache local
+def _consultar_intervalo_cache(inicio, fim, filial, renovar=False):
+    razao = None if renovar else ler_cache_intervalo(filial, inicio, fim)
+    registrar_cache("sqlite", razao is not None)
+    if razao is not None:
+        return razao
+    with travar_intervalo(filial, inicio, fim):
+        razao = None if renovar else ler_cache_intervalo(filial, inicio, fim)
+        if razao is not None:
+            return razao
+        razao = requisitar_intervalo(inicio, fim, filial)
+        if razao is not None:
+            gravar_cache_intervalo(filial, inicio, fim, razao)
+        else:
+            razao = ler_cache_intervalo(filial, inicio, fim, vencido=True)
+            registrar_cache("desatualizado", razao is not None)
+    return razao
+
+
+# Função para obter o razão sem repetir consultas idênticas: quem chega enquanto a
+# mesma (filial, ano, mes) está em andamento espera por ela, e resultados recentes
+# são devolvidos direto da memória (renovar=True ignora os resultados já guardados).
+# Com o gateway fora do ar, devolve o último razão do cache (ver desatualizado_desde)
+def consultar_razao(mes, ano, filial, renovar=False):
+    return _consultar_uma_vez((filial, ano, mes), lambda: _consultar_razao_cache(mes, ano, filial, renovar), renovar)
+
+
+# Função para obter o razão de um intervalo de meses ((ano, mes) inicial e final), com o
+# mesmo cache e a mesma proteção contra consultas repetidas dos razões mensais
+def consultar_intervalo(inicio, fim, filial, renovar=False):
+    if inicio == fim:
+        return consultar_razao(inicio[1], inicio[0], filial, renovar)
+    return _consultar_uma_vez(
+        (filial, inicio, fim), lambda: _consultar_intervalo_cache(inicio, fim, filial, renovar), renovar
+    )
+
+
+def _consultar_uma_vez(chave, consultar, renovar):
+    with _trava:
+        recente = _recentes.get(chave)
+        if not renovar and recente is not None and time.monotonic() - recente[0] <= VALIDADE_RECENTES:
+            registrar_cache("memoria", True)
+            return recente[1]
+        futuro = _em_andamento.get(chave)
+        responsavel = futuro is None
+        if responsavel:
+            futuro = _em_andamento[chave] = Future()
+    if not responsavel:
+        registrar_cache("em andamento", True)
+        return futuro.result()
+    registrar_cache("memoria", False)
+
+    try:
+        razao = consultar()
+    except BaseException as erro:
+        with _trava:
+            del _em_andamento[chave]
+        futuro.set_exception(erro)
+        raise
+    with _trava:
+        del _em_andamento[chave]
+        agora = time.monotonic()
+        for expirada in [c for c, (instante, _) in _recentes.items() if agora - instante > VALIDADE_RECENTES]:
+            del _recentes[expirada]
+        if razao is not None and desatualizado_desde(razao) is None:
+            _recentes[chave] = (agora, razao)
+    futuro.set_result(razao)
+    return razao
+
+
+# Função para obter vários razões em paralelo, cada pedido sendo (mes, ano, filial);
+# os resultados voltam na mesma ordem dos pedidos (cada thread leva uma cópia do contexto,
+# para que as etapas medidas entrem no rastro de quem pediu e os pedidos formem um só
+# trabalho na fila do gateway)
+def consultar_razoes(pedidos):
+    return _em_paralelo(consultar_razao, pedidos)
+
+
+# Função para obter os razões de vários intervalos em paralelo, cada pedido sendo
+# ((ano, mes) inicial, (ano, mes) final, filial)
+def consultar_intervalos(pedidos):
+    return _em_paralelo(consultar_intervalo, pedidos)
+
+
+def _em_paralelo(consultar, pedidos):
+    pedidos = list(pedidos)
+    if len(pedidos) <= 1:
+        return [consultar(*pedido) for pedido in pedidos]
+    maximo = min(MAX_REQUISICOES_SIMULTANEAS, len(pedidos))
+    with trabalho_gateway(), ThreadPoolExecutor(max_workers=maximo) as executor:
+        futuros = [executor.submit(contextvars.copy_context().run, consultar, *pedido) for pedido in pedidos]
+        return [futuro.result() for futuro in futuros]
+
+
+# Função para resumir o estado da proteção do gateway neste processo: limite atual, vagas em
+# uso, consultas na fila por classe, latências e o disjuntor (comum a todos os processos)
+def situacao_gateway():
+    return {**_limitador.situacao(), "disjuntor": estado_disjuntor()}
@@ -0,0 +1,154 @@
+# Explorador do plano de contas completo: parte dos grupos do primeiro nível e abre as contas
+# filhas só quando pedido. Variação, resultado e margem bruta são calculados no servidor
+# apenas para as contas da página visível de cada conta aberta, e só essas linhas vão para o
+# navegador. No consolidado cada conta soma as árvores das filiais na hora, sem montar uma
+# árvore combinada.
+import os
+
+from arvore_contas import obter_arvore
+from mapeamento import carregar_mapeamento
+from memo_lru import CachePorObjeto
+from metricas import medido
+
+# Quantas contas filhas aparecem por página
+TAMANHO_PAGINA = int(os.environ.get("DEALERNET_EXPLORADOR_PAGINA", 50))
+
+# Quantos índices de filhos (um por razão) ficam guardados
+MAX_INDICES = 64
+
+_indices = CachePorObjeto(MAX_INDICES)  # razão -> {conta pai: [contas filhas na ordem do plano]}
+
+
+# Função para ordenar contas irmãs (mesmo pai) pelo último segmento: 1.2 < 1.10 < 1.A
+def _chave_conta(conta_id):
+    ultima = conta_id.rsplit(".", 1)[-1]
+    return (0, int(ultima), "") if ultima.isdigit() else (1, 0, ultima)
+
+
+# Função para montar o índice de filhos de uma árvore: conta pai -> contas filhas em ordem
+# ("" é a raiz, pai dos grupos do primeiro nível)
+def montar_indice(arvore):
+    filhos = {}
+    for conta_id in arvore:
+        filhos.setdefault(conta_id.rsplit(".", 1)[0] if "." in conta_id else "", []).append(conta_id)
+    for lista in filhos.values():
+        lista.sort(key=_chave_conta)
+    return filhos
+
+
+# Função para obter o índice de filhos de um razão, montado uma única vez por razão
+def obter_indice(razao):
+    indice = _indices.obter(razao)
+    if indice is None:
+        indice = montar_indice(obter_arvore(razao))
+        _indices.guardar(razao, indice)
+    return indice
+
+
+# Função para listar as contas filhas de uma conta em todas as filiais (união, na ordem do plano)
+def _filhos(indices, conta_id):
+    if len(indices) == 1:
+        return indices[0].get(conta_id, [])
+    return sorted({filho for indice in indices for filho in indice.get(conta_id, ())}, key=_chave_conta)
+
+
+# Função para somar a variação de uma conta nas árvores das filiais (None se nenhuma a tem)
+def _variacao(arvores, conta_id):
+    nos = [arvore[conta_id] for arvore in arvores if conta_id in arvore]
+    return sum(no["Variacao"] for no in nos) if nos else None
+
+
+# Função para achar a conta de custo correspondente a uma conta de receita (contrapartidas do
+# mapeamento, ex.: 3.1.1.003 -> 3.3.1.003); None se a conta não for de receita
+def contrapartida(conta_id, mapeamento):
+    for receita, custo in mapeamento["contrapartidas"]:
+        if conta_id == receita or conta_id.startswith(receita + "."):
+            return custo + conta_id[len(receita):]
+    return None
+
+
+# Função para descrever uma conta (descrição do primeiro razão que a tem)
+def _descricao(razoes, conta_id):
+    for razao in razoes:
+        registro = razao.get(conta_id)
+        if registro is not None:
+            return registro.get("ContaDescricao", "")
+    return ""
+
+
+# Função para calcular a linha de uma conta: variação (mil R$) e, para contas de receita com
+# custo correspondente, resultado (mil R$) e margem bruta (%) como nas análises
+def _linha(conta_id, razoes, arvores, indices, mapeamento):
+    variacao = _variacao(arvores, conta_id) or 0.0
+    conta_custo = contrapartida(conta_id, mapeamento)
+    custo = None if conta_custo is None else _variacao(arvores, conta_custo)
+    resultado = margem = None
+    if custo is not None:
+        resultado = -(variacao + custo) / 1000
+        margem = (variacao + custo) / variacao * 100 if variacao != 0 else 0.0
+    return {
+        "conta": conta_id,
+        "descricao": _descricao(razoes, conta_id),
+        "nivel": conta_id.count(".") + 1,
+        "tem_filhos": any(conta_id in indice for indice in indices),
+        "variacao": variacao / 1000,
+        "resultado": resultado,
+        "margem": margem,
+    }
+
+
+# Função para calcular uma página das contas filhas de uma conta ("" para o primeiro nível)
+def _pagina(conta_id, pagina, tamanho, razoes, arvores, indices, mapeamento):
+    filhos = _filhos(indices, conta_id)
+    paginas = max(1, -(-len(filhos) // tamanho))
+    pagina = min(max(pagina, 0), paginas - 1)
+    linhas = [
+        _linha(filho, razoes, arvores, indices, mapeamento)
+        for filho in filhos[pagina * tamanho:(pagina + 1) * tamanho]
+    ]
+    return {"total": len(filhos), "pagina": pagina, "paginas": paginas, "linhas": linhas}
+
+
+# Função para abrir uma conta dos razões das filiais (um só razão ou os do consolidado):
+# caminho até ela, com descrições, e uma página das contas filhas já calculadas
+@medido("explorador")
+def explorar_conta(razoes, conta_id="", pagina=0, tamanho=TAMANHO_PAGINA, mapeamento=None):
+    mapeamento = mapeamento or carregar_mapeamento()
+    arvores = [obter_arvore(razao) for razao in razoes]
+    indices = [obter_indice(razao) for razao in razoes]
+    partes = conta_id.split(".") if conta_id else []
+    ancestrais = [".".join(partes[:nivel]) for nivel in range(1, len(partes) + 1)]
+    caminho = [(ancestral, _descricao(razoes, ancestral)) for ancestral in ancestrais]
+    visao = _pagina(conta_id, pagina, tamanho, razoes, arvores, indices, mapeamento)
+    return {"conta": conta_id, "caminho": caminho, **visao}
+
+
+# Função para listar, em ordem de exibição, a parte visível da árvore: as contas abertas
+# (abertos: conta -> página; a raiz "" está sempre aberta) mostram uma página de filhas logo
+# abaixo delas, seguida de uma linha de paginação quando há mais de uma página
+@medido("explorador")
+def subarvore_visivel(razoes, abertos, tamanho=TAMANHO_PAGINA, mapeamento=None):
+    mapeamento = mapeamento or carregar_mapeamento()
+    arvores = [obter_arvore(razao) for razao in razoes]
+    indices = [obter_indice(razao) for razao in razoes]
+    itens = []
+
+    def abrir(conta_id, profundidade):
+        visao = _pagina(conta_id, abertos.get(conta_id, 0), tamanho, razoes, arvores, indices, mapeamento)
+        for linha in visao["linhas"]:
+            aberta = linha["tem_filhos"] and linha["conta"] in abertos
+            itens.append({"tipo": "conta", "profundidade": profundidade, "aberta": aberta, **linha})
+            if aberta:
+                abrir(linha["conta"], profundidade + 1)
+        if visao["paginas"] > 1:
+            itens.append({
+                "tipo": "paginacao",
+                "conta": conta_id,
+                "profundidade": profundidade,
+                "pagina": visao["pagina"],
+                "paginas": visao["paginas"],
+                "total": visao["total"],
+            })
+
+    abrir("", 0)
+    return itens
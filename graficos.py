@@ -0,0 +1,119 @@
+import functools
+
+import plotly.graph_objects as go
+
+from metricas import medido
+
+
+# Função para montar o esqueleto do gráfico de margens: traços sem dados e todo o layout
+# (inclusive o template), validado uma única vez por processo
+@functools.lru_cache(maxsize=None)
+def esqueleto_grafico():
+    fig = go.Figure()
+
+    # Adicionar barras de resultados
+    fig.add_trace(
+        go.Bar(
+            x=[],
+            y=[],
+            name="Resultado (mil R$)",
+            marker_color="DodgerBlue",
+            hovertemplate="<b>%{x}</b><br>Resultado: %{y:.2f} mil R$<extra></extra>"
+        )
+    )
+
+    # Adicionar linha de margens
+    fig.add_trace(
+        go.Scatter(
+            x=[],
+            y=[],
+#            yaxis="y2",
+            name="Margem Bruta (%)",
+            mode="lines+markers",
+            line=dict(color="OrangeRed"),
+            marker=dict(size=8),
+            hovertemplate="<b>%{x}</b><br>Margem: %{y:.2f}%<extra></extra>"
+        )
+    )
+
+    # Ajustar layout
+    fig.update_layout(
+        yaxis_title="Resultado (mil R$)",
+        yaxis=dict(title="Resultado (mil R$)", side="left"),
+        yaxis2=dict(
+            title="Margem Bruta (%)",
+            overlaying="y",
+            side="right"
+        ),
+        legend=dict(x=0.6, y=1.1),
+        barmode="group",
+        template="plotly_dark"
+    )
+
+    return fig.to_dict()
+
+
+# Função para montar o esqueleto do gráfico anual (resultados de Vendas e Pós-Vendas mês a mês)
+@functools.lru_cache(maxsize=None)
+def esqueleto_grafico_anual():
+    fig = go.Figure()
+
+    # Adicionar barras de resultados
+    fig.add_trace(
+        go.Bar(
+            x=[],
+            y=[],
+            name="Vendas - Resultado",
+            marker_color="DarkSlateBlue",
+            hovertemplate="<b>%{x}</b><br>Resultado: %{y:.2f} mil R$<extra></extra>"
+        )
+    )
+
+    fig.add_trace(
+        go.Bar(
+            x=[],
+            y=[],
+            name="Pós-Vendas - Resultado",
+            marker_color="RoyalBlue",
+            hovertemplate="<b>%{x}</b><br>Resultado: %{y:.2f} mil R$<extra></extra>"
+        )
+    )
+
+    # Ajustar layout
+    fig.update_layout(
+        barmode='group',  # Define agrupamento das barras
+        xaxis_title="Meses",
+        yaxis_title="Valores",
+        legend_title="Indicadores",
+        xaxis=dict(tickmode='linear')  # Garante que todos os meses sejam exibidos
+    )
+
+    return fig.to_dict()
+
+
+# Função para preencher um esqueleto com os dados de cada traço e o título. Layout e template
+# já foram validados ao montar o esqueleto e não são validados de novo (só os dados mudam de
+# um gráfico para outro); a figura nova não altera o esqueleto
+def preencher_esqueleto(esqueleto, dados, titulo):
+    figura = {
+        "data": [dict(traco, **valores) for traco, valores in zip(esqueleto["data"], dados)],
+        "layout": dict(esqueleto["layout"], title={"text": titulo}),
+    }
+    return go.Figure(figura, _validate=False)
+
+
+# Função para criar gráficos com Plotly
+@medido("grafico")
+def criar_grafico(nomes, resultados, margens, titulo):
+    dados = [{"x": list(nomes), "y": list(resultados)}, {"x": list(nomes), "y": list(margens)}]
+    return preencher_esqueleto(esqueleto_grafico(), dados, titulo)
+
+
+# Função para criar o gráfico anual (resultados de Vendas e Pós-Vendas mês a mês)
+@medido("grafico")
+def criar_grafico_anual(meses, resultados, margens, titulo):
+    dados = [
+        {"x": list(meses), "y": [resultado[0] for resultado in resultados]},
+        {"x": list(meses), "y": [resultado[1] for resultado in resultados]},
+    ]
+    return preencher_esqueleto(esqueleto_grafico_anual(), dados, titulo)
@@ -0,0 +1,152 @@
+import argparse
+import datetime
+import glob
+import json
+import os
+
+import numpy as np
+
+from cache_razao import DIRETORIO_CACHE, travar_historico
+from razao import CAMPOS_NUMERICOS
+
+# Diretório do histórico colunar: um .npy por coluna, abertos com memória mapeada
+DIRETORIO_HISTORICO = os.environ.get("DEALERNET_HISTORICO", os.path.join(DIRETORIO_CACHE, "historico"))
+COLUNAS = ("ContaIDNivel", "ContaNivel", "ContaNatureza") + CAMPOS_NUMERICOS + ("Empresa", "Periodo")
+
+
+# Função para codificar o período como inteiro AAAAMM
+def periodo(ano, mes):
+    return ano * 100 + mes
+
+
+# Função para converter um razão indexado em colunas tipadas
+def colunas_do_razao(filial, ano, mes, razao):
+    registros = list(razao.values())
+    quantidade = len(registros)
+    colunas = {
+        "ContaIDNivel": np.array(list(razao), dtype="S"),
+        "ContaNivel": np.fromiter((r["ContaNivel"] for r in registros), np.int8, quantidade),
+        "ContaNatureza": np.array([r["ContaNatureza"] or "" for r in registros], dtype="S1"),
+    }
+    for campo in CAMPOS_NUMERICOS:
+        colunas[campo] = np.fromiter((r[campo] for r in registros), np.float64, quantidade)
+    colunas["Empresa"] = np.full(quantidade, filial, np.int16)
+    colunas["Periodo"] = np.full(quantidade, periodo(ano, mes), np.int32)
+    return colunas
+
+
+# Função para ler o manifesto com a versão atual dos arquivos de coluna
+def _ler_manifesto():
+    try:
+        with open(os.path.join(DIRETORIO_HISTORICO, "historico.json"), encoding="utf-8") as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+
+
+def _arquivo_coluna(coluna, versao):
+    return os.path.join(DIRETORIO_HISTORICO, f"{coluna}-{versao}.npy")
+
+
+# Função para abrir todas as colunas do histórico (memória mapeada, sem cópia)
+def abrir_historico():
+    for _ in range(3):
+        manifesto = _ler_manifesto()
+        if manifesto is None:
+            return None
+        try:
+            return {
+                coluna: np.load(_arquivo_coluna(coluna, manifesto["versao"]), mmap_mode="r")
+                for coluna in COLUNAS
+            }
+        except FileNotFoundError:
+            continue  # uma gravação trocou a versão enquanto abríamos; tenta de novo
+    raise RuntimeError("Histórico sendo regravado; tente novamente.")
+
+
+# Função para consultar o histórico por filiais e intervalo de períodos ((ano, mes) inclusivos)
+def carregar_historico(filiais=None, inicio=None, fim=None):
+    colunas = abrir_historico()
+    if colunas is None:
+        return None
+    mascara = np.ones(len(colunas["Periodo"]), dtype=bool)
+    if filiais is not None:
+        mascara &= np.isin(colunas["Empresa"], list(filiais))
+    if inicio is not None:
+        mascara &= colunas["Periodo"] >= periodo(*inicio)
+    if fim is not None:
+        mascara &= colunas["Periodo"] <= periodo(*fim)
+    if mascara.all():
+        return colunas
+    return {coluna: valores[mascara] for coluna, valores in colunas.items()}
+
+
+# Função para identificar cada linha pelo razão de origem (filial e período)
+def _chave_razao(colunas):
+    return colunas["Empresa"].astype(np.int64) * 1_000_000 + colunas["Periodo"]
+
+
+# Função para gravar razões no histórico, cada item sendo (filial, ano, mes, razao);
+# períodos já gravados para a mesma filial são substituídos
+def gravar_historico(razoes):
+    novas = [colunas_do_razao(*item) for item in razoes]
+    if not novas:
+        return
+    # o histórico atual é lido, mesclado e regravado sob a trava: duas gravações ao mesmo
+    # tempo não usam a mesma versão nem descartam as linhas uma da outra
+    with travar_historico():
+        atuais = abrir_historico()
+        if atuais is not None:
+            substituidas = np.isin(_chave_razao(atuais), np.concatenate([_chave_razao(n) for n in novas]))
+            novas.insert(0, {coluna: np.asarray(valores[~substituidas]) for coluna, valores in atuais.items()})
+        colunas = {coluna: np.concatenate([n[coluna] for n in novas]) for coluna in COLUNAS}
+
+        # ordena por filial e período, mantendo a ordem do plano de contas dentro de cada razão
+        ordem = np.lexsort((colunas["Periodo"], colunas["Empresa"]))
+        colunas = {coluna: valores[ordem] for coluna, valores in colunas.items()}
+
+        os.makedirs(DIRETORIO_HISTORICO, exist_ok=True)
+        manifesto = _ler_manifesto()
+        versao = manifesto["versao"] + 1 if manifesto else 1
+        for coluna, valores in colunas.items():
+            np.save(_arquivo_coluna(coluna, versao), np.ascontiguousarray(valores))
+        temporario = os.path.join(DIRETORIO_HISTORICO, f"historico.json.{os.getpid()}")
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            json.dump({"versao": versao, "linhas": int(len(colunas["Periodo"]))}, arquivo)
+        os.replace(temporario, os.path.join(DIRETORIO_HISTORICO, "historico.json"))
+
+        # remove as versões antigas (leitores já abertos continuam com seus mapas)
+        for caminho in glob.glob(os.path.join(DIRETORIO_HISTORICO, "*-*.npy")):
+            if not caminho.endswith(f"-{versao}.npy"):
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+
+
+# Função para buscar (via cache) e gravar no histórico todos os meses dos anos pedidos
+def atualizar_historico(anos, filiais):
+    from dealernet import consultar_razoes
+
+    hoje = datetime.date.today()
+    pedidos = [
+        (mes, ano, filial)
+        for filial in filiais
+        for ano in anos
+        for mes in range(1, 13)
+        if (ano, mes) <= (hoje.year, hoje.month)
+    ]
+    razoes = consultar_razoes(pedidos)
+    gravar_historico(
+        (filial, ano, mes, razao) for (mes, ano, filial), razao in zip(pedidos, razoes) if razao is not None
+    )
+    return sum(razao is not None for razao in razoes), len(pedidos)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Atualiza o histórico colunar de saldos contábeis.")
+    parser.add_argument("--anos", type=int, nargs="+", required=True)
+    parser.add_argument("--filiais", type=int, nargs="+", default=[1, 2, 3])
+    args = parser.parse_args()
+    obtidos, pedidos = atualizar_historico(args.anos, args.filiais)
+    print(f"{obtidos} de {pedidos} razões gravados em {DIRETORIO_HISTORICO}")
@@ -0,0 +1,202 @@
+# Mapeamento de contas das análises: subsetores (contas de receita e custo), setores e
+# exceções por filial ficam em mapeamento_contas.json, lido e validado uma única vez. Para
+# cada filial o mapeamento é compilado contra o plano de contas do razão num plano com
+# vetores de índices (quais nós da árvore somam em qual subsetor), e as análises só aplicam
+# o plano, sem procurar contas a cada pedido nem caminhos especiais por filial.
+import functools
+import json
+import os
+import re
+import threading
+
+from arvore_contas import obter_arvore
+from memo_lru import CachePorObjeto
+
+ARQUIVO_MAPEAMENTO = os.environ.get(
+    "DEALERNET_MAPEAMENTO", os.path.join(os.path.dirname(os.path.abspath(__file__)), "mapeamento_contas.json")
+)
+
+# Quantos razões guardam o plano já resolvido (como as árvores, um por razão)
+MAX_PLANOS = 256
+
+FORMATO_CONTA = re.compile(r"\d+(\.\d+)*")
+
+_trava = threading.Lock()
+_planos_razao = CachePorObjeto(MAX_PLANOS)  # razão -> (filial, mapeamento, plano)
+
+
+# Função para validar um mapeamento (como lido do JSON) e normalizá-lo: contas de receita e
+# custo sempre em tuplas, filiais indexadas pelo código. Todos os problemas encontrados vão
+# juntos num único ValueError
+def validar_mapeamento(dados, origem="mapeamento"):
+    if not isinstance(dados, dict):
+        raise ValueError(f"{origem}: esperado um objeto com subsetores, setores e filiais")
+    erros = []
+
+    subsetores = []
+    for posicao, subsetor in enumerate(dados.get("subsetores") or [], start=1):
+        nome = subsetor.get("nome") if isinstance(subsetor, dict) else None
+        if not isinstance(nome, str) or not nome:
+            erros.append(f"subsetor {posicao}: sem nome")
+            continue
+        if any(nome == outro["nome"] for outro in subsetores):
+            erros.append(f"subsetor {nome!r}: nome repetido")
+            continue
+        normalizado = {"nome": nome}
+        for campo in ("receita", "custo"):
+            contas = subsetor.get(campo)
+            contas = [contas] if isinstance(contas, str) else contas
+            if not isinstance(contas, list) or not contas or not all(
+                isinstance(conta, str) and FORMATO_CONTA.fullmatch(conta) for conta in contas
+            ):
+                erros.append(f"subsetor {nome!r}: {campo} deve ser uma conta (ex.: 3.1.1.003) ou uma lista delas")
+                continue
+            normalizado[campo] = tuple(contas)
+        subsetores.append(normalizado)
+    if not subsetores:
+        erros.append("nenhum subsetor definido")
+    nomes = [subsetor["nome"] for subsetor in subsetores]
+
+    setores = []
+    for posicao, setor in enumerate(dados.get("setores") or [], start=1):
+        nome = setor.get("nome") if isinstance(setor, dict) else None
+        if not isinstance(nome, str) or not nome:
+            erros.append(f"setor {posicao}: sem nome")
+            continue
+        membros = setor.get("subsetores")
+        if not isinstance(membros, list) or not membros:
+            erros.append(f"setor {nome!r}: sem subsetores")
+            continue
+        desconhecidos = [membro for membro in membros if membro not in nomes]
+        if desconhecidos:
+            erros.append(f"setor {nome!r}: subsetores desconhecidos {desconhecidos}")
+        setores.append({"nome": nome, "subsetores": tuple(membros)})
+
+    filiais = {}
+    for codigo, filial in (dados.get("filiais") or {}).items():
+        if not str(codigo).isdigit() or not isinstance(filial, dict):
+            erros.append(f"filial {codigo!r}: esperado o código numérico com um objeto de exceções")
+            continue
+        ausentes = filial.get("ausentes", [])
+        desconhecidos = [nome for nome in ausentes if nome not in nomes]
+        if desconhecidos:
+            erros.append(f"filial {codigo}: ausentes desconhecidos {desconhecidos}")
+        filiais[int(codigo)] = {"nome": filial.get("nome", str(codigo)), "ausentes": frozenset(ausentes)}
+
+    # pares de grupos de receita e custo (ex.: 3.1 e 3.3): a conta de receita 3.1.x.y tem como
+    # custo a conta 3.3.x.y, o que dá resultado e margem a qualquer conta no explorador
+    contrapartidas = []
+    for posicao, par in enumerate(dados.get("contrapartidas") or [], start=1):
+        contas = [par.get(campo) for campo in ("receita", "custo")] if isinstance(par, dict) else [None]
+        if not all(isinstance(conta, str) and FORMATO_CONTA.fullmatch(conta) for conta in contas):
+            erros.append(f"contrapartida {posicao}: esperado receita e custo (ex.: 3.1 e 3.3)")
+            continue
+        contrapartidas.append(tuple(contas))
+
+    if erros:
+        raise ValueError(f"{origem}: mapeamento de contas inválido:\n  " + "\n  ".join(erros))
+    return {
+        "origem": origem,
+        "subsetores": subsetores,
+        "setores": setores,
+        "filiais": filiais,
+        "contrapartidas": contrapartidas,
+        "nomes_subsetores": nomes,
+        "nomes_setores": [setor["nome"] for setor in setores],
+        # todas as contas citadas: só elas importam no plano de contas de cada filial
+        "contas": frozenset(
+            conta for subsetor in subsetores for campo in ("receita", "custo") for conta in subsetor[campo]
+        ),
+        "planos": {},  # (filial, contas presentes) -> plano compilado
+    }
+
+
+# Função para ler e validar o arquivo de mapeamento (uma única vez por arquivo)
+@functools.lru_cache(maxsize=None)
+def carregar_mapeamento(arquivo=ARQUIVO_MAPEAMENTO):
+    with open(arquivo, encoding="utf-8") as entrada:
+        try:
+            dados = json.load(entrada)
+        except json.JSONDecodeError as erro:
+            raise ValueError(f"{arquivo}: JSON inválido ({erro})") from erro
+    return validar_mapeamento(dados, arquivo)
+
+
+# Função para compilar o mapeamento para uma filial, dado o conjunto das contas citadas que
+# existem no seu plano de contas. O plano lista esses nós da árvore e, para receita e custo,
+# dois vetores de índices (nó de origem e subsetor de destino). Subsetor declarado ausente
+# para a filial no mapeamento fica fora da análise; o que não tem conta de receita ou de custo
+# na filial sem ter sido declarado também fica, mas vai para "sem_contas" e gera um aviso
+def compilar_plano(mapeamento, presentes, filial):
+    import logging
+
+    import numpy as np
+
+    contas = sorted(presentes)
+    posicao = {conta: indice for indice, conta in enumerate(contas)}
+    ausentes = mapeamento["filiais"].get(filial, {}).get("ausentes", frozenset())
+    plano = {"filial": filial, "contas": contas, "ausentes": sorted(ausentes), "sem_contas": []}
+    destinos_campo = {}
+    for campo in ("receita", "custo"):
+        origens, destinos = [], []
+        for destino, subsetor in enumerate(mapeamento["subsetores"]):
+            if subsetor["nome"] in ausentes:
+                continue
+            for conta in subsetor[campo]:
+                if conta in posicao:
+                    origens.append(posicao[conta])
+                    destinos.append(destino)
+        plano[campo] = {"origens": np.array(origens, dtype=np.intp), "destinos": np.array(destinos, dtype=np.intp)}
+        destinos_campo[campo] = set(destinos)
+
+    presente = []
+    for destino, subsetor in enumerate(mapeamento["subsetores"]):
+        tem_contas = destino in destinos_campo["receita"] and destino in destinos_campo["custo"]
+        if not tem_contas and subsetor["nome"] not in ausentes:
+            plano["sem_contas"].append(subsetor["nome"])
+        presente.append(tem_contas)
+    plano["presente"] = np.array(presente, dtype=bool)
+    if plano["sem_contas"]:
+        logging.getLogger("dealernet.mapeamento").warning(
+            "%s: filial %s sem contas de receita ou custo para %s (não declarados ausentes); fora da análise",
+            mapeamento["origem"], filial, ", ".join(plano["sem_contas"]),
+        )
+
+    return plano
+
+
+# Função para obter a matriz setores × subsetores do mapeamento (1 onde o subsetor compõe o
+# setor), a mesma para todas as filiais e montada uma única vez
+def matriz_setores(mapeamento):
+    import numpy as np
+
+    with _trava:
+        composicao = mapeamento.get("composicao")
+        if composicao is None:
+            nomes = mapeamento["nomes_subsetores"]
+            composicao = mapeamento["composicao"] = np.array(
+                [[nome in setor["subsetores"] for nome in nomes] for setor in mapeamento["setores"]], dtype=float
+            ).reshape(len(mapeamento["setores"]), len(nomes))
+    return composicao
+
+
+# Função para obter o plano de um razão da filial: resolvido uma vez por razão e compilado
+# uma vez por filial e conjunto de contas presentes (o plano de contas raramente muda entre
+# um mês e outro)
+def obter_plano(razao, filial, mapeamento=None):
+    mapeamento = mapeamento or carregar_mapeamento()
+    guardado = _planos_razao.obter(razao)
+    if guardado is not None and guardado[0] == filial and guardado[1] is mapeamento:
+        return guardado[2]
+
+    arvore = obter_arvore(razao)
+    presentes = frozenset(conta for conta in mapeamento["contas"] if conta in arvore)
+    with _trava:
+        plano = mapeamento["planos"].get((filial, presentes))
+    if plano is None:
+        plano = compilar_plano(mapeamento, presentes, filial)
+        with _trava:
+            plano = mapeamento["planos"].setdefault((filial, presentes), plano)
+
+    _planos_razao.guardar(razao, (filial, mapeamento, plano))
+    return plano
@@ -0,0 +1,119 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+# Memos registrados pelo nome da função: o Streamlit reexecuta o script a cada interação e
+# redefine as funções decoradas, mas elas continuam usando o mesmo memo (compartilhado
+# entre todas as sessões do processo)
+_trava = threading.Lock()
+_memos = {}
+
+
+# Função para guardar um valor num OrderedDict usado como cache LRU, descartando os menos
+# usados quando passar de max_itens (quem chama segura a trava do cache)
+def guardar_lru(itens, chave, valor, max_itens):
+    itens[chave] = valor
+    itens.move_to_end(chave)
+    while len(itens) > max_itens:
+        itens.popitem(last=False)
+
+
+# Cache LRU de valores derivados de um objeto (ex.: a árvore de um razão), pela identidade do
+# objeto: a chave é o id e o próprio objeto fica guardado junto, para que seu id não seja
+# reaproveitado por outro objeto enquanto o valor estiver no cache
+class CachePorObjeto:
+    def __init__(self, max_itens):
+        self.max_itens = max_itens
+        self.itens = OrderedDict()  # id(objeto) -> (objeto, valor)
+        self.trava = threading.Lock()
+
+    # Função para obter o valor guardado para o objeto (None se não houver)
+    def obter(self, objeto):
+        with self.trava:
+            guardado = self.itens.get(id(objeto))
+            if guardado is None or guardado[0] is not objeto:
+                return None
+            self.itens.move_to_end(id(objeto))
+            return guardado[1]
+
+    # Função para guardar o valor do objeto
+    def guardar(self, objeto, valor):
+        with self.trava:
+            guardar_lru(self.itens, id(objeto), (objeto, valor), self.max_itens)
+
+    # Função para esvaziar o cache
+    def limpar(self):
+        with self.trava:
+            self.itens.clear()
+
+
+class _Memo:
+    def __init__(self, max_itens):
+        self.max_itens = max_itens
+        self.itens = OrderedDict()  # chave -> (valor, expira_em ou None)
+        self.acertos = 0
+        self.falhas = 0
+
+
+# Decorador para guardar os resultados de uma função, descartando os menos usados quando
+# passar de max_itens. validade (opcional) recebe os mesmos argumentos da função e
+# retorna por quantos segundos o resultado vale (None = não expira). Resultados None
+# (erros) não são guardados
+def memoizar(max_itens, validade=None):
+    # importados só ao decorar: o cache por objeto (usado pelas árvores e planos) não paga
+    # pelo inspect nem pelas métricas
+    import inspect
+
+    from metricas import registrar_cache
+
+    def decorador(funcao):
+        nome = f"{funcao.__module__}.{funcao.__qualname__}"
+        with _trava:
+            memo = _memos.get(nome)
+            if memo is None:
+                memo = _memos[nome] = _Memo(max_itens)
+            memo.max_itens = max_itens
+
+        assinatura = inspect.signature(funcao)
+
+        @functools.wraps(funcao)
+        def memoizada(*args, **kwargs):
+            # argumentos por posição ou por nome geram a mesma chave
+            chamada = assinatura.bind(*args, **kwargs)
+            chamada.apply_defaults()
+            args = tuple(chamada.arguments.values())
+            agora = time.monotonic()
+            with _trava:
+                guardado = memo.itens.get(args)
+                acerto = guardado is not None and (guardado[1] is None or guardado[1] > agora)
+                if acerto:
+                    memo.itens.move_to_end(args)
+                    memo.acertos += 1
+                else:
+                    memo.falhas += 1
+            registrar_cache(funcao.__name__, acerto)
+            if acerto:
+                return guardado[0]
+            valor = funcao(*args)
+            if valor is None:
+                return None
+            segundos = validade(*args) if validade is not None else None
+            with _trava:
+                guardar_lru(memo.itens, args, (valor, None if segundos is None else agora + segundos), memo.max_itens)
+            return valor
+
+        memoizada.estatisticas = lambda: estatisticas(nome)[nome]
+        return memoizada
+
+    return decorador
+
+
+# Função para consultar acertos, falhas e itens guardados de um memo (ou de todos)
+def estatisticas(nome=None):
+    with _trava:
+        memos = _memos.items() if nome is None else [(nome, _memos[nome])]
+        return {
+            chave: {"acertos": memo.acertos, "falhas": memo.falhas, "itens": len(memo.itens)}
+            for chave, memo in memos
+        }
@@ -0,0 +1,232 @@
+# Medição de tempos por etapa (busca no gateway, leitura do XML, margens, gráficos...):
+# cada etapa medida entra no rastro da requisição em andamento (um clique em "Analisar") e
+# nos totais do processo, exportados no formato de texto do Prometheus. Com
+# DEALERNET_METRICAS_LOG=1, cada rastro concluído também é registrado como uma linha JSON.
+import bisect
+import collections
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+# Limites (em segundos) das faixas do histograma de duração das etapas
+FAIXAS_DURACAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Quantos rastros recentes ficam guardados para o painel de diagnóstico
+MAX_RASTROS = 50
+
+_rastro_atual = contextvars.ContextVar("rastro_atual", default=None)
+_trava = threading.Lock()
+_duracoes = {}  # etapa -> [contagem por faixa..., soma, total]
+_bytes = collections.Counter()  # etapa -> bytes processados
+_transferidos = collections.Counter()  # etapa -> bytes que passaram pela rede (comprimidos ou não)
+_cache = collections.Counter()  # (camada, resultado) -> ocorrências
+_rastros = collections.deque(maxlen=MAX_RASTROS)
+_registrados = collections.OrderedDict()  # ids já somados (rastros recebidos de outro processo)
+_servidor = None
+
+registro = logging.getLogger("dealernet.metricas")
+if os.environ.get("DEALERNET_METRICAS_LOG") == "1" and not registro.handlers:
+    registro.addHandler(logging.StreamHandler())
+    registro.setLevel(logging.INFO)
+
+
+# Função para somar a duração (e os bytes) de uma etapa aos totais do processo
+def _acumular(etapa, segundos, tamanho=None, transferidos=None):
+    with _trava:
+        totais = _duracoes.setdefault(etapa, [0] * (len(FAIXAS_DURACAO) + 3))  # faixas, +Inf, soma, total
+        totais[bisect.bisect_left(FAIXAS_DURACAO, segundos)] += 1
+        totais[-2] += segundos
+        totais[-1] += 1
+        if tamanho:
+            _bytes[etapa] += tamanho
+        if transferidos:
+            _transferidos[etapa] += transferidos
+
+
+# Medição de uma etapa: o dicionário entregue ao bloco aceita atributos extras, como
+# bytes (tamanho do conteúdo), bytes_transferidos (o que passou pela rede) e cache (de onde
+# veio o resultado)
+@contextlib.contextmanager
+def medir(etapa, **atributos):
+    medida = {"etapa": etapa, **atributos}
+    inicio = time.perf_counter()
+    try:
+        yield medida
+    finally:
+        segundos = time.perf_counter() - inicio
+        medida["duracao_ms"] = round(segundos * 1e3, 3)
+        _acumular(etapa, segundos, medida.get("bytes"), medida.get("bytes_transferidos"))
+        rastro = _rastro_atual.get()
+        if rastro is not None:
+            rastro["etapas"].append(medida)
+
+
+# Decorador para medir cada chamada de uma função como uma etapa
+def medido(etapa):
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def medida(*args, **kwargs):
+            with medir(etapa):
+                return funcao(*args, **kwargs)
+
+        return medida
+
+    return decorador
+
+
+# Função para registrar um acerto ou falha de cache (camada: "memoria", "sqlite", um memo...)
+def registrar_cache(camada, acerto):
+    resultado = "acerto" if acerto else "falha"
+    with _trava:
+        _cache[(camada, resultado)] += 1
+    rastro = _rastro_atual.get()
+    if rastro is not None:
+        rastro["cache"].append({"camada": camada, "resultado": resultado})
+
+
+# Rastro de uma requisição: junta as etapas medidas dentro do bloco (inclusive nas threads
+# que copiam o contexto, como as de dealernet.consultar_razoes)
+@contextlib.contextmanager
+def rastrear(nome, **atributos):
+    rastro = {"id": uuid.uuid4().hex, "nome": nome, "inicio": time.time(), **atributos, "etapas": [], "cache": []}
+    token = _rastro_atual.set(rastro)
+    inicio = time.perf_counter()
+    try:
+        yield rastro
+    finally:
+        _rastro_atual.reset(token)
+        rastro["duracao_ms"] = round((time.perf_counter() - inicio) * 1e3, 3)
+        _acumular(nome, time.perf_counter() - inicio)
+        _guardar(rastro)
+
+
+def _guardar(rastro):
+    with _trava:
+        _rastros.append(rastro)
+        _registrados[rastro["id"]] = True
+        while len(_registrados) > 4 * MAX_RASTROS:
+            _registrados.popitem(last=False)
+    registro.info(json.dumps(rastro, ensure_ascii=False))
+
+
+# Função para somar aos totais deste processo um rastro concluído em outro processo (ex.:
+# callbacks em segundo plano do Dash); rastros já somados são ignorados
+def registrar_rastro(rastro):
+    with _trava:
+        if rastro["id"] in _registrados:
+            return
+    for medida in rastro["etapas"]:
+        _acumular(medida["etapa"], medida["duracao_ms"] / 1e3, medida.get("bytes"), medida.get("bytes_transferidos"))
+    with _trava:
+        for evento in rastro["cache"]:
+            _cache[(evento["camada"], evento["resultado"])] += 1
+    _acumular(rastro["nome"], rastro["duracao_ms"] / 1e3)
+    _guardar(rastro)
+
+
+# Função para anotar uma informação no rastro em andamento (ex.: subsetores sem contas no
+# plano de uma filial), mostrada no painel de diagnóstico
+def anotar_rastro(chave, valor):
+    rastro = _rastro_atual.get()
+    if rastro is not None:
+        rastro.setdefault("anotacoes", {})[chave] = valor
+
+
+# Função para saber se o rastro entregou algum razão guardado já vencido (gateway fora do ar)
+def usou_desatualizados(rastro):
+    return any(evento["camada"] == "desatualizado" and evento["resultado"] == "acerto" for evento in rastro["cache"])
+
+
+# Função para listar os rastros mais recentes (o último primeiro)
+def rastros_recentes(quantidade=MAX_RASTROS):
+    with _trava:
+        return list(_rastros)[::-1][:quantidade]
+
+
+# Função para resumir, por etapa, quantas vezes foi medida e o tempo médio
+def resumo_etapas():
+    with _trava:
+        return [
+            {"etapa": etapa, "vezes": totais[-1], "media_ms": round(totais[-2] / totais[-1] * 1e3, 3)}
+            for etapa, totais in sorted(_duracoes.items())
+        ]
+
+
+def _rotulos(**rotulos):
+    def escapar(valor):
+        return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    return ",".join(f'{nome}="{escapar(valor)}"' for nome, valor in rotulos.items())
+
+
+# Função para exportar os totais no formato de texto do Prometheus
+def texto_prometheus():
+    linhas = [
+        "# HELP dealernet_etapa_segundos Duração das etapas da análise.",
+        "# TYPE dealernet_etapa_segundos histogram",
+    ]
+    with _trava:
+        for etapa, totais in sorted(_duracoes.items()):
+            acumulado = 0
+            for limite, quantidade in zip(FAIXAS_DURACAO + ("+Inf",), totais):
+                acumulado += quantidade
+                linhas.append(f"dealernet_etapa_segundos_bucket{{{_rotulos(etapa=etapa, le=limite)}}} {acumulado}")
+            linhas.append(f"dealernet_etapa_segundos_sum{{{_rotulos(etapa=etapa)}}} {totais[-2]:.6f}")
+            linhas.append(f"dealernet_etapa_segundos_count{{{_rotulos(etapa=etapa)}}} {totais[-1]}")
+        linhas += [
+            "# HELP dealernet_etapa_bytes_total Bytes processados por etapa.",
+            "# TYPE dealernet_etapa_bytes_total counter",
+        ]
+        linhas += [
+            f"dealernet_etapa_bytes_total{{{_rotulos(etapa=etapa)}}} {total}" for etapa, total in sorted(_bytes.items())
+        ]
+        linhas += [
+            "# HELP dealernet_etapa_bytes_transferidos_total Bytes recebidos pela rede por etapa (comprimidos).",
+            "# TYPE dealernet_etapa_bytes_transferidos_total counter",
+        ]
+        linhas += [
+            f"dealernet_etapa_bytes_transferidos_total{{{_rotulos(etapa=etapa)}}} {total}"
+            for etapa, total in sorted(_transferidos.items())
+        ]
+        linhas += [
+            "# HELP dealernet_cache_total Acertos e falhas de cada camada de cache.",
+            "# TYPE dealernet_cache_total counter",
+        ]
+        linhas += [
+            f"dealernet_cache_total{{{_rotulos(camada=camada, resultado=resultado)}}} {total}"
+            for (camada, resultado), total in sorted(_cache.items())
+        ]
+    return "\n".join(linhas) + "\n"
+
+
+# Função para servir o texto do Prometheus numa porta própria (para apps sem rota HTTP
+# própria, como o Streamlit); iniciada uma única vez por processo. O servidor HTTP só é
+# importado aqui, para não pesar na importação de quem apenas mede
+def servir_metricas(porta):
+    global _servidor
+    import http.server
+
+    class PaginaMetricas(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            conteudo = texto_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(conteudo)))
+            self.end_headers()
+            self.wfile.write(conteudo)
+
+        def log_message(self, *args):
+            pass
+
+    with _trava:
+        if _servidor is None:
+            _servidor = http.server.ThreadingHTTPServer(("0.0.0.0", porta), PaginaMetricas)
+            _servidor.daemon_threads = True
+            threading.Thread(target=_servidor.serve_forever, daemon=True).start()
+        return _servidor
@@ -0,0 +1,100 @@
+import numpy as np
+
+from arvore_contas import obter_arvore
+from mapeamento import carregar_mapeamento, matriz_setores, obter_plano
+from metricas import anotar_rastro, medido
+
+
+# Função para somar os valores dos nós (razões × nós do plano) nos subsetores de destino,
+# seguindo os vetores de índices do plano (um nó pode compor mais de um subsetor)
+def somar_por_subsetor(valores, ligacao, num_subsetores):
+    linhas = len(valores)
+    destinos = (np.arange(linhas)[:, None] * num_subsetores + ligacao["destinos"]).ravel()
+    somas = np.bincount(destinos, valores[:, ligacao["origens"]].ravel(), linhas * num_subsetores)
+    return somas.reshape(linhas, num_subsetores)
+
+
+# Função para montar as matrizes de receita, custo e presença (razões × subsetores) aplicando
+# o plano compilado da filial de cada razão: os razões que compartilham um plano têm os nós
+# listados nele lidos da árvore de uma vez e somados por subsetor pelos índices do plano.
+# Subsetores sem contas numa filial (não declarados ausentes) ficam anotados no rastro
+def montar_valores(razoes, filiais, mapeamento=None):
+    mapeamento = mapeamento or carregar_mapeamento()
+    forma = (len(razoes), len(mapeamento["subsetores"]))
+    receita, custo, presente = np.zeros(forma), np.zeros(forma), np.zeros(forma, dtype=bool)
+    grupos = {}  # id(plano) -> (plano, linhas)
+    for linha, (razao, filial) in enumerate(zip(razoes, filiais)):
+        plano = obter_plano(razao, filial, mapeamento)
+        grupos.setdefault(id(plano), (plano, []))[1].append(linha)
+    for plano, linhas in grupos.values():
+        arvores = [obter_arvore(razoes[linha]) for linha in linhas]
+        valores = np.array(
+            [[arvore[conta]["Variacao"] for conta in plano["contas"]] for arvore in arvores], dtype=float
+        ).reshape(len(linhas), len(plano["contas"]))
+        receita[linhas] = somar_por_subsetor(valores, plano["receita"], forma[1])
+        custo[linhas] = somar_por_subsetor(valores, plano["custo"], forma[1])
+        presente[linhas] = plano["presente"]
+        if plano["sem_contas"]:
+            anotar_rastro(f"Subsetores sem contas (filial {plano['filial']})", plano["sem_contas"])
+    return receita, custo, presente
+
+
+# Função para calcular resultados (mil R$) e margens brutas (%) a partir de receitas e custos
+def resultados_margens(receita, custo):
+    resultado = -(receita + custo) / 1000  # em milhares de reais
+    with np.errstate(divide="ignore", invalid="ignore"):
+        margem = np.where(receita != 0, (receita + custo) / receita * 100, 0.0)
+    return resultado, margem
+
+
+# Função para montar um nível da análise (subsetores ou setores) com seus indicadores
+def _nivel(nomes, receita, custo, presente):
+    resultado, margem = resultados_margens(receita, custo)
+    return {
+        "nomes": nomes,
+        "receita": receita,
+        "custo": custo,
+        "resultado": resultado,
+        "margem": margem,
+        "presente": presente,
+    }
+
+
+# Função para calcular, numa só passada, subsetores e setores de uma pilha de razões
+# (lista de filiais, cada uma com a lista de razões dos meses, e o código de cada filial).
+# As dimensões dos resultados são (filiais, meses, subsetores/setores); no consolidado,
+# receitas e custos são somados entre as filiais antes de calcular resultados e margens
+@medido("margens")
+def calcular_analise(razoes, filiais, mapeamento=None):
+    mapeamento = mapeamento or carregar_mapeamento()
+    num_filiais, num_meses = len(razoes), len(razoes[0])
+    receita, custo, presente = montar_valores(
+        [razao for linha in razoes for razao in linha],
+        [filial for linha, filial in zip(razoes, filiais) for _ in linha],
+        mapeamento,
+    )
+    forma = (num_filiais, num_meses, len(mapeamento["subsetores"]))
+    receita, custo, presente = receita.reshape(forma), custo.reshape(forma), presente.reshape(forma)
+
+    # subsetor só entra na conta se o plano da filial tiver tanto receita quanto custo
+    receita = np.where(presente, receita, 0.0)
+    custo = np.where(presente, custo, 0.0)
+
+    # matriz setores × subsetores indicando quais subsetores compõem cada setor
+    composicao = matriz_setores(mapeamento)
+    nomes_subsetores = mapeamento["nomes_subsetores"]
+    nomes_setores = mapeamento["nomes_setores"]
+    receita_setor = receita @ composicao.T
+    custo_setor = custo @ composicao.T
+    presente_setor = (presente.astype(float) @ composicao.T) > 0
+
+    return {
+        "subsetores": _nivel(nomes_subsetores, receita, custo, presente),
+        "setores": _nivel(nomes_setores, receita_setor, custo_setor, presente_setor),
+        "consolidado": {
+            "subsetores": _nivel(nomes_subsetores, receita.sum(axis=0), custo.sum(axis=0), presente.any(axis=0)),
+            "setores": _nivel(
+                nomes_setores, receita_setor.sum(axis=0), custo_setor.sum(axis=0), presente_setor.any(axis=0)
+            ),
+        },
+    }
@@ -0,0 +1,50 @@
+# Núcleo compartilhado pelos dashboards, pelas ferramentas em lote e pelos testes: um único
+# lugar de onde importar as funções comuns (consultas ao gateway, leitura do razão, motor de
+# margens, gráficos). Cada nome só carrega o seu módulo no primeiro acesso, e esses módulos
+# só carregam as dependências pesadas (requests, numpy, plotly) quando precisam delas.
+#
+# Orçamento de tempo de importação: python -m benchmarks.importacao
+import importlib
+
+# Nome exportado -> módulo que o define
+_EXPORTADOS = {
+    "ultimo_dia_mes": "dealernet",
+    "consultar_razao": "dealernet",
+    "consultar_razoes": "dealernet",
+    "consultar_intervalos": "dealernet",
+    "situacao_gateway": "dealernet",
+    "desatualizado_desde": "cache_razao",
+    "prioridade_gateway": "protecao_gateway",
+    "ler_resposta_soap": "razao",
+    "obter_valor_conta": "razao",
+    "calcular_analise": "motor_margens",
+    "resultados_margens": "motor_margens",
+    "carregar_mapeamento": "mapeamento",
+    "obter_plano": "mapeamento",
+    "FILIAIS": "analises",
+    "TIPOS_ANALISE": "analises",
+    "codigos_filiais": "analises",
+    "numeros_analise": "analises",
+    "criar_grafico": "graficos",
+    "criar_grafico_anual": "graficos",
+    "explorar_conta": "explorador",
+    "subarvore_visivel": "explorador",
+    "consultar_periodo": "consultas_periodo",
+    "consultar_serie": "consultas_periodo",
+    "meses_intervalo": "consultas_periodo",
+}
+
+__all__ = sorted(_EXPORTADOS)
+
+
+def __getattr__(nome):
+    modulo = _EXPORTADOS.get(nome)
+    if modulo is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+    valor = getattr(importlib.import_module(modulo), nome)
+    globals()[nome] = valor  # os próximos acessos não passam mais por aqui
+    return valor
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTADOS))
@@ -0,0 +1,266 @@
+# Proteção do gateway DealerNet, compartilhado por todos os analistas:
+# - limitador adaptativo: quantas requisições podem estar no gateway ao mesmo tempo, ajustado
+#   à latência (tempo até os cabeçalhos da resposta) e às falhas observadas. Sobe devagar
+#   enquanto o gateway responde bem e cai quando a latência passa da tolerância sobre a de base
+#   (a menor latência recente) ou quando há falhas e novas tentativas;
+# - fila justa: quem passa do limite espera numa fila por classe ("interativa" antes de
+#   "lote") e, dentro da classe, por trabalho (cada consulta em paralelo, um aquecimento, um
+#   lote de relatórios), servidos em rodízio: um trabalho longo não segura os demais. Uma vaga
+#   fica reservada para as consultas interativas;
+# - disjuntor: depois de várias falhas seguidas o gateway deixa de ser consultado por um tempo
+#   (quem consulta recebe o último razão guardado no cache, marcado como desatualizado); então
+#   uma única consulta de teste decide se ele volta. O estado do disjuntor fica no cache SQLite
+#   e vale para todos os processos (workers e callbacks em segundo plano do Dash, relatórios);
+#   o limitador e a fila valem para o processo.
+import collections
+import contextlib
+import contextvars
+import itertools
+import os
+import threading
+import time
+
+from cache_razao import alterar_disjuntor, ler_disjuntor
+from metricas import medir
+
+# Classes da fila, da mais para a menos urgente
+CLASSES = ("interativa", "lote")
+
+# Limite inicial de requisições simultâneas (o máximo é dado por quem cria o limitador)
+LIMITE_INICIAL = int(os.environ.get("DEALERNET_LIMITE_INICIAL", 2))
+
+# Latência recente acima de TOLERANCIA_LATENCIA vezes a de base indica gateway sobrecarregado
+TOLERANCIA_LATENCIA = float(os.environ.get("DEALERNET_LIMITE_TOLERANCIA", 1.5))
+
+# Quanto o limite cai com latência alta e com falhas (novas tentativas contam como falha)
+RECUO_LATENCIA = 0.8
+RECUO_FALHA = 0.5
+
+# Latências guardadas para a de base e peso de cada nova na média recente
+JANELA_LATENCIAS = 100
+PESO_RECENTE = 0.2
+
+# Vagas reservadas para as consultas interativas (o lote nunca as ocupa, salvo com limite 1)
+RESERVA_INTERATIVA = 1
+
+# Tempo máximo (em segundos) de espera na fila antes de desistir da consulta
+ESPERA_MAXIMA = float(os.environ.get("DEALERNET_ESPERA_FILA", 60))
+
+# Falhas seguidas que abrem o disjuntor e por quanto tempo (em segundos) ele fica aberto
+FALHAS_DISJUNTOR = int(os.environ.get("DEALERNET_DISJUNTOR_FALHAS", 5))
+ESPERA_DISJUNTOR = float(os.environ.get("DEALERNET_DISJUNTOR_ESPERA", 30))
+
+_classe = contextvars.ContextVar("classe_gateway", default="interativa")
+_trabalho = contextvars.ContextVar("trabalho_gateway", default=None)
+_numeros = itertools.count(1)
+
+
+class LimitadorAdaptativo:
+    def __init__(self, maximo, inicial=LIMITE_INICIAL, minimo=1):
+        self.minimo = minimo
+        self.maximo = max(minimo, maximo)
+        self.limite = float(min(max(inicial, minimo), self.maximo))
+        self.em_uso = dict.fromkeys(CLASSES, 0)
+        self.filas = {classe: collections.OrderedDict() for classe in CLASSES}  # trabalho -> deque de esperas
+        self.latencias = collections.deque(maxlen=JANELA_LATENCIAS)
+        self.recente = None
+        self.ultimo_recuo = 0.0
+        self.trava = threading.Lock()
+
+    # Função para saber se uma consulta da classe cabe agora
+    def _cabe(self, classe):
+        vagas = int(self.limite)
+        ocupadas = sum(self.em_uso.values())
+        if classe == "lote" and vagas > RESERVA_INTERATIVA:
+            return ocupadas < vagas and self.em_uso["lote"] < vagas - RESERVA_INTERATIVA
+        return ocupadas < vagas
+
+    # Função para entregar as vagas livres a quem espera: classes em ordem de urgência e, em
+    # cada classe, um trabalho de cada vez
+    def _despachar(self):
+        for classe in CLASSES:
+            fila = self.filas[classe]
+            while fila and self._cabe(classe):
+                trabalho, esperas = next(iter(fila.items()))
+                espera = esperas.popleft()
+                if esperas:
+                    fila.move_to_end(trabalho)
+                else:
+                    del fila[trabalho]
+                self.em_uso[classe] += 1
+                espera["liberada"] = True
+                espera["evento"].set()
+
+    # Função para ocupar uma vaga (esperando na fila, se preciso); False se a espera passou
+    # de espera_maxima segundos
+    def adquirir(self, classe="interativa", trabalho=None, espera_maxima=ESPERA_MAXIMA):
+        espera = {"evento": threading.Event(), "liberada": False}
+        with self.trava:
+            fila = self.filas[classe]
+            fila.setdefault(id(espera) if trabalho is None else trabalho, collections.deque()).append(espera)
+            self._despachar()
+        if espera["liberada"] or espera["evento"].wait(espera_maxima):
+            return True
+        with self.trava:
+            if espera["liberada"]:
+                return True
+            for chave, esperas in list(fila.items()):
+                if espera in esperas:
+                    esperas.remove(espera)
+                    if not esperas:
+                        del fila[chave]
+        return False
+
+    # Função para devolver a vaga e ajustar o limite ao resultado da consulta: "ok" (com a
+    # latência em segundos), "sobrecarga" (respondeu após novas tentativas), "falha" ou None
+    # (resultado que nada diz sobre a carga do gateway)
+    def liberar(self, classe="interativa", latencia=None, resultado=None):
+        with self.trava:
+            ocupadas = sum(self.em_uso.values())
+            self.em_uso[classe] -= 1
+            agora = time.monotonic()
+            if resultado in ("falha", "sobrecarga"):
+                self._recuar(RECUO_FALHA, agora)
+            elif resultado == "ok" and latencia is not None:
+                self.latencias.append(latencia)
+                if self.recente is None:
+                    self.recente = latencia
+                self.recente += PESO_RECENTE * (latencia - self.recente)
+                if self.recente > TOLERANCIA_LATENCIA * min(self.latencias):
+                    self._recuar(RECUO_LATENCIA, agora)
+                elif ocupadas >= int(self.limite) or any(self.filas.values()):
+                    # só cresce quando o limite está de fato segurando consultas
+                    self.limite = min(self.maximo, self.limite + 1 / self.limite)
+            self._despachar()
+
+    # Função para reduzir o limite, no máximo uma vez a cada latência recente (as respostas das
+    # consultas que já estavam no gateway refletem a mesma sobrecarga)
+    def _recuar(self, fator, agora):
+        if agora - self.ultimo_recuo < (self.recente or 0.0):
+            return
+        self.limite = max(self.minimo, self.limite * fator)
+        self.ultimo_recuo = agora
+
+    # Função para resumir o estado do limitador
+    def situacao(self):
+        with self.trava:
+            return {
+                "limite": int(self.limite),
+                "maximo": self.maximo,
+                "em_uso": sum(self.em_uso.values()),
+                "na_fila": {classe: sum(map(len, fila.values())) for classe, fila in self.filas.items()},
+                "latencia_base_ms": round(min(self.latencias) * 1e3, 1) if self.latencias else None,
+                "latencia_recente_ms": round(self.recente * 1e3, 1) if self.recente is not None else None,
+            }
+
+
+# Classe e trabalho das consultas feitas dentro do bloco (inclusive nas threads que copiam o
+# contexto): cada bloco é um trabalho novo, salvo se o trabalho for dado
+@contextlib.contextmanager
+def prioridade_gateway(classe="lote", trabalho=None):
+    if classe not in CLASSES:
+        raise ValueError(f"classe desconhecida: {classe!r} (esperado: {', '.join(CLASSES)})")
+    token_classe = _classe.set(classe)
+    token_trabalho = _trabalho.set(trabalho if trabalho is not None else next(_numeros))
+    try:
+        yield
+    finally:
+        _trabalho.reset(token_trabalho)
+        _classe.reset(token_classe)
+
+
+# Trabalho das consultas feitas dentro do bloco, se ainda não houver um (as consultas em
+# paralelo de um mesmo pedido disputam a fila como um só trabalho)
+@contextlib.contextmanager
+def trabalho_gateway():
+    if _trabalho.get() is not None:
+        yield
+        return
+    token = _trabalho.set(next(_numeros))
+    try:
+        yield
+    finally:
+        _trabalho.reset(token)
+
+
+# Função para descrever o estado do disjuntor: "fechado", "aberto" ou "meio-aberto" (esperando
+# a consulta de teste)
+def estado_disjuntor(estado=None, agora=None):
+    _, aberto_ate, _ = estado or ler_disjuntor()
+    if not aberto_ate:
+        return "fechado"
+    return "aberto" if (agora or time.time()) < aberto_ate else "meio-aberto"
+
+
+# Função para pedir passagem ao disjuntor: fechado deixa passar; aberto recusa; passado o
+# tempo de espera, só uma consulta de teste passa (até duracao_sonda segundos; as demais são
+# recusadas enquanto isso)
+def permitir_consulta(duracao_sonda):
+    agora = time.time()
+    estado = ler_disjuntor()
+    situacao = estado_disjuntor(estado, agora)
+    if situacao != "meio-aberto":
+        return situacao == "fechado"
+
+    def sondar(atual):
+        falhas, aberto_ate, sonda_ate = atual
+        if estado_disjuntor(atual, agora) != "meio-aberto" or sonda_ate > agora:
+            return None
+        return falhas, aberto_ate, agora + duracao_sonda
+
+    anterior, atual = alterar_disjuntor(sondar)
+    return estado_disjuntor(atual, agora) == "fechado" or atual != anterior
+
+
+# Função para registrar o resultado de uma consulta no disjuntor: sucesso o fecha; falhas
+# seguidas (ou a falha da consulta de teste) o abrem por ESPERA_DISJUNTOR segundos
+def registrar_resultado(sucesso):
+    estado = ler_disjuntor()
+    if sucesso and estado == (0, 0.0, 0.0):
+        return
+
+    def registrar(atual):
+        if sucesso:
+            return 0, 0.0, 0.0
+        falhas, aberto_ate, _ = atual
+        falhas += 1
+        if aberto_ate or falhas >= FALHAS_DISJUNTOR:
+            return falhas, time.time() + ESPERA_DISJUNTOR, 0.0
+        return falhas, aberto_ate, 0.0
+
+    alterar_disjuntor(registrar)
+
+
+# Vaga no gateway para uma consulta: passa pelo disjuntor e pela fila do limitador. O
+# dicionário entregue ao bloco diz se a consulta foi recusada ("recusada": motivo) e recebe o
+# resultado ("ok", "sobrecarga", "falha" ou None) e a latência, usados ao sair do bloco para
+# ajustar o limite e o disjuntor (exceções contam como falha)
+@contextlib.contextmanager
+def vaga_gateway(limitador, duracao_sonda):
+    vaga = {"recusada": None, "resultado": None, "latencia": None}
+    if estado_disjuntor() == "aberto":
+        vaga["recusada"] = "disjuntor aberto"
+        yield vaga
+        return
+    classe, trabalho = _classe.get(), _trabalho.get()
+    with medir("fila_gateway", classe=classe) as medida:
+        entrou = limitador.adquirir(classe, trabalho)
+        medida["limite"] = int(limitador.limite)
+    if not entrou:
+        vaga["recusada"] = "fila cheia"
+        yield vaga
+        return
+    if not permitir_consulta(duracao_sonda):
+        limitador.liberar(classe)
+        vaga["recusada"] = "disjuntor aberto"
+        yield vaga
+        return
+    try:
+        yield vaga
+    except BaseException:
+        vaga["resultado"] = "falha"
+        raise
+    finally:
+        limitador.liberar(classe, vaga["latencia"], vaga["resultado"])
+        if vaga["resultado"] is not None:
+            registrar_resultado(vaga["resultado"] != "falha")
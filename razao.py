@@ -0,0 +1,102 @@
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+
+# Campos numéricos de cada SDT_SaldoContabilItem mantidos no índice do razão
+CAMPOS_NUMERICOS = ("SaldoInicial", "Debitos", "Creditos", "SaldoFinal")
+
+# Elemento do envelope que carrega o razão em CDATA ("namespace nome", como o expat reporta)
+TAG_XML_RETORNO = "DealerNet Xml_retorno"
+
+# Tamanho máximo de cada trecho do CDATA entregue ao parser interno
+TAMANHO_FATIA = 64 * 1024
+
+
+# Função para converter um SDT_SaldoContabilItem no registro guardado no índice
+def _registro(item):
+    textos = {filho.tag: filho.text for filho in item}
+    registro = {campo: float(textos[campo]) for campo in CAMPOS_NUMERICOS}
+    registro["ContaNivel"] = int(textos["ContaNivel"])
+    registro["ContaNatureza"] = textos["ContaNatureza"]
+    registro["ContaDescricao"] = textos.get("ContaDescricao") or ""
+    return registro
+
+
+# Função para indexar o razão por ContaIDNivel (construído uma vez por resposta)
+def indexar_razao(cdata_root):
+    razao = {}
+    for item in cdata_root.iter("SDT_SaldoContabilItem"):
+        conta_id = item.findtext("ContaIDNivel")
+        if conta_id not in razao:  # mantém a primeira ocorrência, como a busca linear fazia
+            razao[conta_id] = _registro(item)
+    return razao
+
+
+# Função para ler a resposta SOAP em uma única passada, sem montar as árvores completas
+# (aceita os bytes da resposta ou um iterável de blocos de bytes, lidos à medida que chegam);
+# primeiro_registro (opcional) é chamado quando a primeira conta fica pronta
+def ler_resposta_soap(blocos, primeiro_registro=None):
+    if isinstance(blocos, (bytes, bytearray)):
+        blocos = [blocos]
+
+    razao = {}
+    interno = ET.XMLPullParser(events=("start", "end"))
+    estado = {"dentro": False, "vazio": True, "raiz": None}
+
+    def consumir_eventos():
+        for evento, elemento in interno.read_events():
+            if evento == "start":
+                if estado["raiz"] is None:
+                    estado["raiz"] = elemento
+            elif elemento.tag == "SDT_SaldoContabilItem":
+                conta_id = elemento.findtext("ContaIDNivel")
+                if conta_id not in razao:
+                    if not razao and primeiro_registro is not None:
+                        primeiro_registro()
+                    razao[conta_id] = _registro(elemento)
+                # libera o item já consumido (e os anteriores, que já foram lidos)
+                elemento.clear()
+                estado["raiz"].clear()
+
+    def inicio(tag, atributos):
+        if tag == TAG_XML_RETORNO:
+            estado["dentro"] = True
+
+    def fim(tag):
+        if tag == TAG_XML_RETORNO:
+            estado["dentro"] = False
+
+    def texto(dados):
+        if not estado["dentro"]:
+            return
+        if estado["vazio"]:
+            # equivale ao strip() do CDATA: o XML interno não pode começar com espaços
+            dados = dados.lstrip()
+            if not dados:
+                return
+            estado["vazio"] = False
+        # alimenta em fatias para manter poucos itens pendentes na memória
+        for inicio_fatia in range(0, len(dados), TAMANHO_FATIA):
+            interno.feed(dados[inicio_fatia:inicio_fatia + TAMANHO_FATIA])
+            consumir_eventos()
+
+    externo = xml.parsers.expat.ParserCreate(namespace_separator=" ")
+    externo.StartElementHandler = inicio
+    externo.EndElementHandler = fim
+    externo.CharacterDataHandler = texto
+    for bloco in blocos:
+        externo.Parse(bloco, False)
+    externo.Parse(b"", True)
+
+    if estado["vazio"]:
+        return None
+    interno.close()
+    consumir_eventos()
+    return razao
+
+
+# Função para extrair valores das contas (consulta O(1) no índice)
+def obter_valor_conta(razao, conta_id):
+    registro = razao.get(conta_id)
+    if registro is None:
+        return None
+    return round(registro["SaldoFinal"] - registro["SaldoInicial"], 2)
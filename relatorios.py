@@ -0,0 +1,214 @@
+# Relatórios em lote, sem interface: calcula as análises de margens de várias filiais,
+# meses e tipos com o mesmo motor do dashboard e grava os gráficos (HTML e, com o pacote
+# kaleido instalado, PNG) e as tabelas (CSV). Os razões são buscados antes, em paralelo e
+# pelo cache local, como lote na fila do gateway (as consultas dos analistas passam na
+# frente); cálculo e gráficos são repartidos entre processos, um por núcleo. Razões
+# desatualizados (gateway fora do ar) contam como indisponíveis: o lote não grava análises
+# com dados velhos.
+#
+# Uso: python relatorios.py --ano 2024 [--filiais 0 1 2 3] [--tipos setorial subsetorial]
+#      python relatorios.py --inicio 2024-07 --fim 2024-12 --formatos html png csv --saida relatorios
+import argparse
+import csv
+import datetime
+import os
+import time
+
+from cache_razao import DIRETORIO_CACHE
+from nucleo import (
+    FILIAIS,
+    TIPOS_ANALISE,
+    carregar_mapeamento,
+    codigos_filiais,
+    consultar_razoes,
+    desatualizado_desde,
+    meses_intervalo,
+    numeros_analise,
+    prioridade_gateway,
+)
+
+# Nomes curtos dos tipos de análise (linha de comando e nomes dos arquivos)
+TIPOS_CURTOS = dict(zip(("setorial", "subsetorial"), TIPOS_ANALISE))
+
+FORMATOS = ("html", "png", "csv")
+
+# Pasta padrão dos relatórios gerados
+DIRETORIO_RELATORIOS = os.environ.get("DEALERNET_RELATORIOS", os.path.join(DIRETORIO_CACHE, "relatorios"))
+
+
+# Função para montar o nome dos arquivos de uma análise (sem extensão)
+def nome_arquivo(tipo, mes, ano, filial):
+    local = "consolidado" if filial == 0 else f"filial{filial}"
+    curto = next(curto for curto, nome in TIPOS_CURTOS.items() if nome == tipo)
+    return f"{ano}-{mes:02d}_{local}_{curto}"
+
+
+# Função para obter o nome de uma filial pelo código
+def nome_da_filial(filial):
+    return FILIAIS[filial] if 0 <= filial < len(FILIAIS) else f"Filial {filial}"
+
+
+# Função para saber se um razão serve para o lote (obtido e atual)
+def disponivel(razao):
+    return razao is not None and desatualizado_desde(razao) is None
+
+
+# Função para buscar (e deixar no cache) todos os razões do lote de uma vez; retorna os
+# pedidos (mes, ano, filial) que falharam
+def buscar_razoes(meses, filiais, num_filiais):
+    pedidos = sorted({
+        (mes, ano, codigo)
+        for ano, mes in meses
+        for filial in filiais
+        for codigo in codigos_filiais(filial, num_filiais)
+    })
+    with prioridade_gateway("lote"):
+        razoes = consultar_razoes(pedidos)
+    return [pedido for pedido, razao in zip(pedidos, razoes) if not disponivel(razao)]
+
+
+# Função executada em cada processo: calcula as análises de um mês e filial e grava os
+# arquivos pedidos. Retorna as linhas da tabela e os arquivos gravados
+def gerar_relatorio(mes, ano, filial, num_filiais, tipos, formatos, saida):
+    from nucleo import criar_grafico  # plotly só é carregado nos processos que desenham
+
+    codigos = codigos_filiais(filial, num_filiais)
+    with prioridade_gateway("lote"):
+        razoes = consultar_razoes([(mes, ano, codigo) for codigo in codigos])
+    if not all(map(disponivel, razoes)):
+        raise RuntimeError(f"razão indisponível para {mes:02d}/{ano}, filial {filial}")
+    nome_filial = nome_da_filial(filial)
+    linhas, arquivos = [], []
+    for tipo in tipos:
+        titulo, nomes, resultados, margens = numeros_analise(tipo, mes, ano, razoes, codigos)
+        tabela = [
+            {
+                "periodo": f"{ano}-{mes:02d}",
+                "filial": nome_filial,
+                "tipo": tipo,
+                "nome": nome,
+                "resultado": round(resultado, 2),
+                "margem": round(margem, 2),
+            }
+            for nome, resultado, margem in zip(nomes, resultados, margens)
+        ]
+        linhas += tabela
+        base = os.path.join(saida, nome_arquivo(tipo, mes, ano, filial))
+        if "csv" in formatos:
+            gravar_csv(base + ".csv", tabela)
+            arquivos.append(base + ".csv")
+        if "html" in formatos or "png" in formatos:
+            grafico = criar_grafico(nomes, resultados, margens, f"{titulo} - {nome_filial}")
+            if "html" in formatos:
+                # o plotly.min.js fica uma única vez na pasta, ao lado dos gráficos
+                grafico.write_html(base + ".html", include_plotlyjs="directory")
+                arquivos.append(base + ".html")
+            if "png" in formatos:
+                grafico.write_image(base + ".png", width=1280, height=720)
+                arquivos.append(base + ".png")
+    return linhas, arquivos
+
+
+# Função para gravar uma tabela em CSV (separador ";" e vírgula decimal, como no Excel em português)
+def gravar_csv(caminho, linhas):
+    colunas = ["periodo", "filial", "tipo", "nome", "resultado", "margem"]
+    with open(caminho, "w", newline="", encoding="utf-8-sig") as arquivo:
+        escritor = csv.writer(arquivo, delimiter=";")
+        escritor.writerow(colunas)
+        for linha in linhas:
+            decimais = {coluna: str(linha[coluna]).replace(".", ",") for coluna in ("resultado", "margem")}
+            escritor.writerow([decimais.get(coluna, linha[coluna]) for coluna in colunas])
+
+
+# Função para gerar o lote todo; retorna (arquivos gravados, falhas)
+def gerar_lote(meses, filiais, tipos, formatos, saida, processos=None, num_filiais=len(FILIAIS) - 1):
+    os.makedirs(saida, exist_ok=True)
+    if "html" in formatos:
+        # gravado antes de iniciar os processos, para que nenhum deles o escreva ao mesmo tempo
+        caminho_js = os.path.join(saida, "plotly.min.js")
+        if not os.path.exists(caminho_js):
+            from plotly.offline import get_plotlyjs
+
+            with open(caminho_js, "w", encoding="utf-8") as arquivo:
+                arquivo.write(get_plotlyjs())
+
+    # análises que dependem de um razão indisponível nem chegam aos processos
+    indisponiveis = set(buscar_razoes(meses, filiais, num_filiais))
+    falhas = [f"{mes:02d}/{ano} filial {codigo}: razão indisponível" for mes, ano, codigo in sorted(indisponiveis)]
+    tarefas = [
+        (mes, ano, filial)
+        for ano, mes in meses
+        for filial in filiais
+        if not any((mes, ano, codigo) in indisponiveis for codigo in codigos_filiais(filial, num_filiais))
+    ]
+    linhas, arquivos = [], []
+    if not tarefas:
+        return arquivos, falhas
+    from concurrent.futures import ProcessPoolExecutor, as_completed  # só quem gera o lote paga pelos processos
+
+    with ProcessPoolExecutor(max_workers=processos or os.cpu_count()) as executor:
+        futuros = {
+            executor.submit(gerar_relatorio, mes, ano, filial, num_filiais, tipos, formatos, saida): (mes, ano, filial)
+            for mes, ano, filial in tarefas
+        }
+        for feitos, futuro in enumerate(as_completed(futuros), start=1):
+            mes, ano, filial = futuros[futuro]
+            try:
+                linhas_tarefa, arquivos_tarefa = futuro.result()
+            except Exception as erro:  # uma análise com erro não interrompe o lote
+                falhas.append(f"{mes:02d}/{ano} filial {filial}: {erro}")
+                continue
+            linhas += linhas_tarefa
+            arquivos += arquivos_tarefa
+            print(f"[{feitos}/{len(tarefas)}] {mes:02d}/{ano} {nome_da_filial(filial)}")
+
+    if "csv" in formatos and linhas:
+        # tabela única com todas as análises do lote, na ordem de período, filial e tipo
+        ordem = {nome_da_filial(filial): indice for indice, filial in enumerate(filiais)}
+        linhas.sort(key=lambda linha: (linha["periodo"], ordem[linha["filial"]], linha["tipo"]))
+        gravar_csv(os.path.join(saida, "resumo.csv"), linhas)
+        arquivos.append(os.path.join(saida, "resumo.csv"))
+    return arquivos, falhas
+
+
+# Função para ler um mês no formato AAAA-MM
+def ler_mes(texto):
+    data = datetime.datetime.strptime(texto, "%Y-%m")
+    return data.year, data.month
+
+
+if __name__ == "__main__":
+    import importlib.util
+
+    parser = argparse.ArgumentParser(description="Gera em lote as análises de margens (gráficos e tabelas).")
+    periodo = parser.add_mutually_exclusive_group(required=True)
+    periodo.add_argument("--ano", type=int, help="todos os meses do ano")
+    periodo.add_argument("--inicio", type=ler_mes, help="primeiro mês (AAAA-MM), com --fim")
+    parser.add_argument("--fim", type=ler_mes, help="último mês (AAAA-MM); padrão: o mesmo de --inicio")
+    parser.add_argument("--filiais", type=int, nargs="+", default=list(range(len(FILIAIS))),
+                        help="códigos das filiais (0 = consolidado)")
+    parser.add_argument("--tipos", nargs="+", choices=TIPOS_CURTOS, default=list(TIPOS_CURTOS))
+    parser.add_argument("--formatos", nargs="+", choices=FORMATOS, default=["html", "csv"])
+    parser.add_argument("--saida", default=DIRETORIO_RELATORIOS)
+    parser.add_argument("--processos", type=int, help="processos em paralelo (padrão: um por núcleo)")
+    args = parser.parse_args()
+    if "png" in args.formatos and importlib.util.find_spec("kaleido") is None:
+        parser.error("PNG requer o pacote kaleido (pip install kaleido)")
+    try:
+        carregar_mapeamento()  # mapeamento inválido falha aqui, e não em cada processo
+    except (OSError, ValueError) as erro:
+        parser.error(str(erro))
+
+    if args.ano:
+        meses = meses_intervalo((args.ano, 1), (args.ano, 12))
+    else:
+        meses = meses_intervalo(args.inicio, args.fim or args.inicio)
+    tipos = [TIPOS_CURTOS[tipo] for tipo in args.tipos]
+
+    inicio = time.perf_counter()
+    arquivos, falhas = gerar_lote(meses, args.filiais, tipos, args.formatos, args.saida, args.processos)
+    print(f"{len(arquivos)} arquivos em {args.saida} ({time.perf_counter() - inicio:.1f} s)")
+    for falha in falhas:
+        print(f"Falha: {falha}")
+    if falhas:
+        raise SystemExit(1)
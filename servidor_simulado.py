@@ -0,0 +1,234 @@
+# Gateway DealerNet local para testes e benchmarks: responde às requisições
+# CONSULTASALDOCONTABIL lendo a filial (Empresa_codigo) e o período (Dtini) do pedido.
+# O período do soap.xml (filial 1, 11/2024) é respondido com o próprio arquivo; os demais
+# recebem um razão sintético gerado a partir dele (valores variam por filial e período).
+# Latência (fixa + variação aleatória) e falhas (HTTP 503) podem ser injetadas, e a banda
+# pode ser limitada; respostas vão com gzip quando o cliente aceita (desligável com --sem-compressao).
+# Com --capacidade N, só N requisições são atendidas ao mesmo tempo e as demais esperam a vez,
+# como num gateway sobrecarregado (a latência cresce com a concorrência).
+#
+# Uso: python servidor_simulado.py --porta 8099 --atraso 0.5 --variacao 0.2 --falhas 0.05 --banda 500
+#      python servidor_simulado.py --porta 8099 --atraso 0.2 --capacidade 4
+#      DEALERNET_URL=http://127.0.0.1:8099/aws_dealernetgateway.aspx streamlit run dashboards_streamlit.py
+#
+# Sem servidor à parte: DEALERNET_OFFLINE=1 inicia este gateway dentro do próprio processo
+# dos dashboards (ver iniciar_servidor_offline)
+import argparse
+import contextlib
+import functools
+import gzip
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dados_sinteticos import (
+    ANO_FIXTURE,
+    ARQUIVO_FIXTURE,
+    FILIAL_FIXTURE,
+    MES_FIXTURE,
+    gerar_envelope_intervalo,
+    gerar_envelope_soap,
+)
+
+# Campos do pedido SOAP lidos pelo gateway simulado
+PADRAO_FILIAL = re.compile(rb"Empresa_codigo>\s*(\d+)\s*<")
+PADRAO_PERIODO = re.compile(rb"Dtini>\s*(\d{4})-(\d{2})")
+PADRAO_FIM = re.compile(rb"Dtfin>\s*(\d{4})-(\d{2})")
+
+# Quantos envelopes sintéticos ficam guardados (gerar um custa alguns milissegundos)
+MAX_ENVELOPES = 256
+
+# Tamanho dos pedaços enviados quando a banda é limitada
+TAMANHO_ENVIO = 16 * 1024
+
+
+# Função para comprimir um envelope (os comprimidos também ficam guardados)
+@functools.lru_cache(maxsize=MAX_ENVELOPES)
+def comprimir(conteudo):
+    return gzip.compress(conteudo, compresslevel=6)
+
+
+class GatewaySimulado(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # mantém a conexão aberta entre requisições
+    disable_nagle_algorithm = True  # corpo pequeno (comprimido) não espera o ACK dos cabeçalhos
+
+    def setup(self):
+        super().setup()
+        with self.server.trava:
+            self.server.conexoes += 1
+
+    def do_POST(self):
+        corpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        servidor = self.server
+        with servidor.trava:
+            servidor.requisicoes += 1
+            servidor.simultaneas += 1
+            servidor.pico_simultaneas = max(servidor.pico_simultaneas, servidor.simultaneas)
+            falhar = servidor.falhas_restantes > 0 or servidor.aleatorio.random() < servidor.taxa_falhas
+            if servidor.falhas_restantes > 0:
+                servidor.falhas_restantes -= 1
+            espera = servidor.atraso + servidor.aleatorio.uniform(0, servidor.variacao)
+        try:
+            with servidor.atendimento or contextlib.nullcontext():
+                time.sleep(espera)
+            self.enviar_resposta(servidor, corpo, falhar)
+        finally:
+            with servidor.trava:
+                servidor.simultaneas -= 1
+
+    # Função para enviar a resposta (503 vazia se a requisição deve falhar)
+    def enviar_resposta(self, servidor, corpo, falhar):
+        if falhar:
+            with servidor.trava:
+                servidor.falhas += 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        conteudo = servidor.responder(corpo)
+        comprimido = servidor.compressao and "gzip" in self.headers.get("Accept-Encoding", "")
+        if comprimido:
+            conteudo = comprimir(conteudo)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml; charset=utf-8")
+        if comprimido:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(conteudo)))
+        self.end_headers()
+        servidor.enviar(self.wfile, conteudo)
+
+    def log_message(self, *args):
+        pass
+
+
+class ServidorSimulado(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, porta, atraso=0.0, variacao=0.0, taxa_falhas=0.0, num_contas=None, fonte="sintetico",
+                 semente=0, compressao=True, banda=0, capacidade=0):
+        super().__init__(("127.0.0.1", porta), GatewaySimulado)
+        self.atraso = atraso
+        self.variacao = variacao
+        self.taxa_falhas = taxa_falhas
+        self.falhas_restantes = 0  # próximas N requisições falham (para testar novas tentativas)
+        self.num_contas = num_contas
+        self.fonte = fonte  # "sintetico" (varia por filial e período) ou "fixture" (sempre o soap.xml)
+        self.semente = semente
+        self.compressao = compressao  # responde com gzip a quem aceita
+        self.banda = banda  # bytes por segundo de cada resposta (0 = sem limite)
+        # requisições atendidas ao mesmo tempo (0 = sem limite); as demais esperam a vez
+        self.atendimento = threading.BoundedSemaphore(capacidade) if capacidade else None
+        self.aleatorio = random.Random(semente)
+        self.trava = threading.Lock()
+        self.requisicoes = 0
+        self.conexoes = 0
+        self.simultaneas = 0
+        self.pico_simultaneas = 0  # maior número de requisições em andamento ao mesmo tempo
+        self.falhas = 0
+        self.bytes_enviados = 0
+        self.envelopes = {}
+        with open(ARQUIVO_FIXTURE, "rb") as arquivo:
+            self.conteudo = arquivo.read()
+        self.url = f"http://127.0.0.1:{self.server_port}/aws_dealernetgateway.aspx"
+
+    # Função para enviar o corpo da resposta, em pedaços no ritmo da banda (se limitada)
+    def enviar(self, saida, conteudo):
+        if not self.banda:
+            saida.write(conteudo)
+        else:
+            for inicio in range(0, len(conteudo), TAMANHO_ENVIO):
+                pedaco = conteudo[inicio:inicio + TAMANHO_ENVIO]
+                saida.write(pedaco)
+                saida.flush()
+                time.sleep(len(pedaco) / self.banda)
+        with self.trava:
+            self.bytes_enviados += len(conteudo)
+
+    # Função para montar a resposta de um pedido: o soap.xml no seu próprio período,
+    # razões sintéticos nos demais (intervalos de vários meses juntam os razões mensais)
+    def responder(self, corpo):
+        filial = PADRAO_FILIAL.search(corpo)
+        periodo = PADRAO_PERIODO.search(corpo)
+        if self.fonte == "fixture" or filial is None or periodo is None:
+            return self.conteudo
+        chave = (int(filial.group(1)), int(periodo.group(2)), int(periodo.group(1)))
+        fim = PADRAO_FIM.search(corpo)
+        fim = (int(fim.group(1)), int(fim.group(2))) if fim else (chave[2], chave[1])
+        if fim != (chave[2], chave[1]):
+            chave += fim  # intervalo de vários meses
+        elif chave == (FILIAL_FIXTURE, MES_FIXTURE, ANO_FIXTURE) and self.num_contas is None:
+            return self.conteudo
+        with self.trava:
+            envelope = self.envelopes.get(chave)
+        if envelope is None:
+            if len(chave) > 3:
+                envelope = gerar_envelope_intervalo(
+                    self.num_contas, chave[0], (chave[2], chave[1]), fim, semente=self.semente
+                )
+            else:
+                envelope = gerar_envelope_soap(self.num_contas, *chave, semente=self.semente)
+            with self.trava:
+                self.envelopes[chave] = envelope
+                while len(self.envelopes) > MAX_ENVELOPES:
+                    del self.envelopes[next(iter(self.envelopes))]
+        return envelope
+
+
+# Função para iniciar o gateway simulado numa thread (porta 0 escolhe uma porta livre)
+def iniciar_servidor(porta=0, atraso=0.0, variacao=0.0, taxa_falhas=0.0, num_contas=None, fonte="sintetico",
+                     semente=0, compressao=True, banda=0, capacidade=0):
+    servidor = ServidorSimulado(
+        porta, atraso, variacao, taxa_falhas, num_contas, fonte, semente, compressao, banda, capacidade
+    )
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+# Função para iniciar o gateway do modo offline (DEALERNET_OFFLINE=1), configurado por
+# DEALERNET_OFFLINE_ATRASO, DEALERNET_OFFLINE_VARIACAO, DEALERNET_OFFLINE_FALHAS, DEALERNET_OFFLINE_CONTAS,
+# DEALERNET_OFFLINE_BANDA (KB/s), DEALERNET_OFFLINE_COMPRESSAO e DEALERNET_OFFLINE_CAPACIDADE
+def iniciar_servidor_offline():
+    contas = os.environ.get("DEALERNET_OFFLINE_CONTAS")
+    return iniciar_servidor(
+        atraso=float(os.environ.get("DEALERNET_OFFLINE_ATRASO", 0)),
+        variacao=float(os.environ.get("DEALERNET_OFFLINE_VARIACAO", 0)),
+        taxa_falhas=float(os.environ.get("DEALERNET_OFFLINE_FALHAS", 0)),
+        num_contas=int(contas) if contas else None,
+        compressao=os.environ.get("DEALERNET_OFFLINE_COMPRESSAO", "1") == "1",
+        banda=float(os.environ.get("DEALERNET_OFFLINE_BANDA", 0)) * 1024,
+        capacidade=int(os.environ.get("DEALERNET_OFFLINE_CAPACIDADE", 0)),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gateway DealerNet simulado.")
+    parser.add_argument("--porta", type=int, default=8099)
+    parser.add_argument("--atraso", type=float, default=0.0, help="segundos de espera antes de cada resposta")
+    parser.add_argument("--variacao", type=float, default=0.0, help="espera extra aleatória, de 0 até este valor")
+    parser.add_argument("--falhas", type=float, default=0.0, help="fração das requisições respondidas com 503")
+    parser.add_argument("--contas", type=int, help="número mínimo de contas dos razões sintéticos")
+    parser.add_argument("--fonte", choices=("sintetico", "fixture"), default="sintetico")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--banda", type=float, default=0.0, help="KB/s de cada resposta (0 = sem limite)")
+    parser.add_argument("--sem-compressao", action="store_true", help="ignora o Accept-Encoding dos pedidos")
+    parser.add_argument(
+        "--capacidade", type=int, default=0, help="requisições atendidas ao mesmo tempo (0 = sem limite)"
+    )
+    args = parser.parse_args()
+    servidor = iniciar_servidor(
+        args.porta, args.atraso, args.variacao, args.falhas, args.contas, args.fonte, args.semente,
+        not args.sem_compressao, args.banda * 1024, args.capacidade,
+    )
+    print(f"Gateway simulado em {servidor.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+    print(
+        f"{servidor.requisicoes} requisições, {servidor.falhas} falhas injetadas, "
+        f"{servidor.bytes_enviados} bytes enviados"
+    )
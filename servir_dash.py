@@ -0,0 +1,70 @@
+# Modo de produção do app Dash: vários processos (workers) do gunicorn atendendo ao mesmo
+# tempo. Os workers compartilham o cache em disco de razões (cache_razao) e o cache de
+# resultados dos callbacks (cache/dash), então um razão buscado por um worker é
+# reaproveitado pelos outros.
+#
+# Os workers são síncronos (uma thread cada): os callbacks em segundo plano do Dash rodam
+# em processos criados com fork, e um fork feito enquanto outras threads do worker usam o
+# SQLite do diskcache pode herdar travas presas.
+#
+# Com --aquecer, o agendador de aquecimento (aquecimento.py --continuo) roda num processo à
+# parte enquanto o servidor estiver no ar, deixando os meses recentes no cache compartilhado.
+#
+# Uso: python servir_dash.py --workers 4 --porta 8050 [--aquecer] [--offline]
+import argparse
+import os
+import subprocess
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+
+class ServidorDash(BaseApplication):
+    def __init__(self, opcoes):
+        self.opcoes = opcoes
+        super().__init__()
+
+    def load_config(self):
+        for chave, valor in self.opcoes.items():
+            self.cfg.set(chave, valor)
+
+    def load(self):
+        # importado dentro de cada worker, depois do fork
+        from dashboards_dash import server
+
+        return server
+
+
+# Funções para iniciar e encerrar o processo de aquecimento junto com o servidor
+def iniciar_aquecedor(servidor):
+    servidor.aquecedor = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "aquecimento.py"), "--continuo"]
+    )
+
+
+def encerrar_aquecedor(servidor):
+    aquecedor = getattr(servidor, "aquecedor", None)
+    if aquecedor is not None:
+        aquecedor.terminate()
+        aquecedor.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve o app Dash com vários processos.")
+    parser.add_argument("--workers", type=int, default=2 * (os.cpu_count() or 1) + 1)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--porta", type=int, default=8050)
+    parser.add_argument("--aquecer", action="store_true", help="aquece os meses recentes em segundo plano")
+    parser.add_argument("--offline", action="store_true", help="usa o gateway simulado local (servidor_simulado)")
+    args = parser.parse_args()
+    if args.offline:
+        os.environ["DEALERNET_OFFLINE"] = "1"  # herdado pelos workers e pelo aquecimento
+    opcoes = {
+        "bind": f"{args.host}:{args.porta}",
+        "workers": args.workers,
+        "worker_class": "sync",
+        "timeout": 120,
+    }
+    if args.aquecer:
+        opcoes.update(when_ready=iniciar_aquecedor, on_exit=encerrar_aquecedor)
+    ServidorDash(opcoes).run()